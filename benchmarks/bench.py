@@ -0,0 +1,223 @@
+""" benchmarks of the hot paths of the heuristic, and of end-to-end runs
+
+Run from the base directory, e.g.
+
+    python -m benchmarks.bench --output bench.json
+    python -m benchmarks.bench --quick --compare bench.json
+
+The results are written as JSON: one record per benchmark, with the timings of each repeat in seconds.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import timeit
+import platform
+import argparse
+import subprocess
+import numpy as np
+
+from det_k_bisbm.optimalks import OptimalKs
+from det_k_bisbm.generators import gen_bisbm
+from det_k_bisbm.block_matrix import BlockMatrix
+from det_k_bisbm.merge_tree import MergeTree
+from det_k_bisbm.ioutils import get_bipartite_graph
+from det_k_bisbm.utils import get_italic_i_from_m_e_rs, get_merge_candidates, merge_m_e_rs
+from det_k_bisbm.utils import merge_block, new_rng_state
+from det_k_bisbm.utils import get_desc_len_from_data, get_desc_len_from_data_uni, gen_equal_bipartite_partition
+from det_k_bisbm.utils import get_desc_len_from_data_batch
+from engines.mcmc_numba import MCMCNumba
+
+DATASET = "dataset/test"
+
+
+def gen_m_e_rs(graph, ka, kb):
+    '''
+        The affinity matrix of the equal-sized partition of <graph>.
+    '''
+    mb = gen_equal_bipartite_partition(graph.n_a, graph.n_b, ka, kb)
+    return OptimalKs.get_m_e_rs_from_mb(graph.edges, mb)[0], mb
+
+
+def time_it(func, repeat, number=None):
+    '''
+        Time <func> after one warm-up call (e.g. for the numba compilation), and return the list of the seconds
+        per call, one for each repeat.
+        If <number> is not passed, it is chosen so that each repeat takes about 0.2 s.
+    '''
+    func()
+    if number is None:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            if time.perf_counter() - start > 0.2 or number >= 10 ** 6:
+                break
+            number *= 10
+    times = []
+    for _ in range(repeat):
+        times.append(timeit.timeit(func, number=number) / number)
+    return times, number
+
+
+def micro_benchmarks(quick):
+    graph = get_bipartite_graph(
+        os.path.join(DATASET, "bisbm-n_1000-ka_4-kb_6-r-1.0-Ka_30-Ir_1.75.gt.edgelist"),
+        os.path.join(DATASET, "bisbm-n_1000-ka_4-kb_6-r-1.0-Ka_30-Ir_1.75.gt.types"),
+        "\t"
+    )
+    for k in [10] if quick else [10, 30, 100]:
+        m_e_rs, mb = gen_m_e_rs(graph, k, k)
+        params = {"ka": k, "kb": k, "n": graph.n, "e": graph.e}
+
+        yield "merge_matrix", params, lambda: OptimalKs.merge_matrix(k, k, m_e_rs)
+        block, out, rng_state = m_e_rs[:k, k:].copy(), np.empty((k, k)), new_rng_state(42)
+        yield "merge_block", params, lambda: merge_block(k, k, block, out, rng_state)
+        yield "get_merge_candidates", params, lambda: get_merge_candidates(k, k, m_e_rs)
+        yield "get_italic_i_from_m_e_rs", params, lambda: get_italic_i_from_m_e_rs(m_e_rs)
+        yield "get_m_e_rs_from_mb", params, lambda: OptimalKs.get_m_e_rs_from_mb(graph.edges, mb)
+        yield "BlockMatrix.from_edges", params, lambda: BlockMatrix.from_edges(graph.edges, mb, k, k)
+        block_matrix = BlockMatrix.from_m_e_rs(m_e_rs, k)
+        yield "BlockMatrix.get_italic_i", params, block_matrix.get_italic_i
+        yield "get_merge_candidates[BlockMatrix]", params, lambda: get_merge_candidates(k, k, block_matrix)
+        yield "get_desc_len_from_data", params, \
+            lambda: get_desc_len_from_data(graph.n_a, graph.n_b, graph.e, k, k, graph.edges, mb)
+        mbs = np.tile(np.asarray(mb), (64, 1))
+        yield "get_desc_len_from_data_batch", dict(params, n_partitions=len(mbs)), \
+            lambda: get_desc_len_from_data_batch(graph, mbs, k, k)
+        mb_uni = [i % k for i in range(graph.n)]
+        yield "get_desc_len_from_data_uni", {"k": k, "n": graph.n, "e": graph.e}, \
+            lambda: get_desc_len_from_data_uni(graph.n, graph.e, k, graph.edges, mb_uni)
+
+        oks = OptimalKs(MCMCNumba(is_parallel=False), graph, logging_level="warning")
+        _ka, _kb, _m_e_rs = merge_m_e_rs(k, k, m_e_rs, [0, 1])
+
+        mb_array = np.asarray(mb, dtype=np.int32)
+
+        def update_transient_state(oks=oks, k=k, mb_array=mb_array, m_e_rs=m_e_rs, _ka=_ka, _kb=_kb,
+                                   _m_e_rs=_m_e_rs):
+            # the state is reset before each call, which is cheap
+            oks.trace_mb = MergeTree()
+            oks.trace_mb[(k, k)] = mb_array
+            oks._update_current_state(k, k, m_e_rs)
+            oks._update_transient_state(_ka, _kb, _m_e_rs, [0, 1])
+
+        yield "_update_transient_state", params, update_transient_state
+
+        # materialize the membership vector at the end of a path of merges, down to (1, 1)
+        trace_mb = MergeTree()
+        trace_mb[(k, k)] = mb_array
+        for ka_ in range(k - 1, 0, -1):
+            trace_mb.add_merge((ka_, ka_ + 1), (ka_ + 1, ka_ + 1), [0, 1])
+            trace_mb.add_merge((ka_, ka_), (ka_, ka_ + 1), [ka_, ka_ + 1])
+        yield "MergeTree.get_array", params, lambda: trace_mb.get_array((1, 1))
+
+
+def macro_benchmarks(quick):
+    def make_engine(graph):
+        # about 100 sweeps of single-node moves
+        return MCMCNumba(n_sweeps=2, is_parallel=False, n_cores=1, mcmc_moves=100 * graph.n,
+                         mcmc_await_moves=10 * graph.n, mcmc_cooling="linear", mcmc_cooling_param_1=20,
+                         mcmc_cooling_param_2=0.5, seed=42)
+
+    graphs = []
+    for f_edgelist in sorted(glob.glob(os.path.join(DATASET, "*.edgelist"))):
+        prefix = f_edgelist[:-len(".edgelist")]
+        graphs.append((os.path.basename(prefix), get_bipartite_graph(f_edgelist, prefix + ".types", "\t")))
+    for n in [1000] if quick else [1000, 4000, 16000]:
+        for degree in [5] if quick else [5, 20]:
+            graph, _ = gen_bisbm(n // 2, n - n // 2, 4, 6, n * degree, degree_exponent=2.5, seed=42)
+            graphs.append(("bisbm-n_{}-e_{}".format(n, n * degree), graph))
+
+    for name, graph in graphs:
+        for init_k in [5] if quick else [5, 10, 20]:
+            params = {"graph": name, "n": graph.n, "e": graph.e, "init_ka": init_k, "init_kb": init_k}
+
+            def run(graph=graph, init_k=init_k):
+                oks = OptimalKs(make_engine(graph), graph, init_ka=init_k, init_kb=init_k, logging_level="warning")
+                try:
+                    oks.iterator()
+                except UserWarning:
+                    # the merging reached (1, 1)
+                    pass
+
+            yield "iterator", params, run
+
+
+def run_benchmarks(quick=False, repeat=5, pattern=None):
+    records = []
+    for group, benchmarks, n_repeats in [("micro", micro_benchmarks, repeat), ("macro", macro_benchmarks, 1)]:
+        for name, params, func in benchmarks(quick):
+            if pattern is not None and pattern not in name:
+                continue
+            record = {"group": group, "name": name, "params": params}
+            try:
+                record["times"], record["number"] = time_it(func, n_repeats, 1 if group == "macro" else None)
+                record["min"] = min(record["times"])
+                record["median"] = float(np.median(record["times"]))
+            except Exception as e:
+                record["error"] = "{}: {}".format(type(e).__name__, e)
+            sys.stderr.write("{:<34} {:<70} {}\n".format(
+                name, json.dumps(params), record.get("error", "{:.3e} s".format(record.get("min", 0.)))
+            ))
+            records.append(record)
+    return records
+
+
+def get_meta():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import numba
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": numba.__version__,
+        "platform": platform.platform(),
+        "n_cpus": os.cpu_count()
+    }
+
+
+def compare(records, f_baseline):
+    '''
+        Print the ratio of the timings to those of a previous output, for the benchmarks found in both.
+    '''
+    with open(f_baseline, "r") as f:
+        baseline = {
+            (r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["benchmarks"] if "min" in r
+        }
+    for record in records:
+        key = (record["name"], json.dumps(record["params"], sort_keys=True))
+        if "min" in record and key in baseline:
+            sys.stderr.write("{:<34} {:<70} {:.2f}x\n".format(
+                record["name"], key[1], record["min"] / baseline[key]["min"]
+            ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the heuristic; the results are written as JSON.")
+    parser.add_argument("--output", help="where to write the results; defaults to the standard output")
+    parser.add_argument("--quick", action="store_true", help="small sizes only")
+    parser.add_argument("--repeat", type=int, default=5, help="number of repeats of the micro-benchmarks")
+    parser.add_argument("--filter", help="only run the benchmarks whose name contains this string")
+    parser.add_argument("--compare", metavar="BASELINE", help="print the time ratios to a previous output")
+    args = parser.parse_args(argv)
+
+    records = run_benchmarks(args.quick, args.repeat, args.filter)
+    output = json.dumps({"meta": get_meta(), "benchmarks": records}, indent=2)
+    if args.output is None:
+        sys.stdout.write(output + "\n")
+    else:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    if args.compare is not None:
+        compare(records, args.compare)
+
+
+if __name__ == "__main__":
+    main()
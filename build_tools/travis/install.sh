@@ -24,7 +24,6 @@ if [[ ! -f $HOME/miniconda3/bin/activate ]]
     chmod +x miniconda.sh && ./miniconda.sh -b -f
     conda update --yes conda
     conda create -n testenv3 --yes python=3.6
-    conda create -n testenv2 --yes python=2.7
 fi
 cd ..
 popd
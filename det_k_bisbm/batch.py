@@ -0,0 +1,118 @@
+""" model selection on many graphs, sharing one pool of workers """
+import os
+import sys
+import json
+import argparse
+
+from det_k_bisbm.optimalks import OptimalKs
+from det_k_bisbm.ioutils import get_bipartite_graph
+from det_k_bisbm.scheduler import get_scheduler
+
+ENGINES = {
+    "mcmc": ("engines.mcmc", "MCMC"),
+    "kl": ("engines.kl", "KL"),
+    "mcmc_numba": ("engines.mcmc_numba", "MCMCNumba"),
+    "kl_numba": ("engines.kl_numba", "KLNumba")
+}
+
+
+def run_batch(graphs, make_engine, n_cores, init_ka=10, init_kb=10, i_th=0.1, logging_level="warning"):
+    """
+        This function runs the heuristic on each graph, and yields the results as soon as each graph is done.
+
+        The `iterator` of every graph is a top-level task of the global scheduler, and the sweeps that it runs are
+        its subtasks; all of them share the same <n_cores> cores, so that the sweeps of one graph fill the cores
+        left idle by the others.
+
+        Parameters
+        ----------
+        graphs : list
+            The (name, BipartiteGraph) pairs
+
+        make_engine : callable
+            Returns a new engine, which is given to one graph only; e.g. `lambda: MCMCNumba(n_sweeps=4)`
+
+        n_cores : int
+            The core budget of the whole batch
+
+        Returns
+        -------
+        results : generator
+            The (name, oks, error) tuples, in the order in which the graphs are done, where <oks> is the
+            `OptimalKs` instance of the graph, and <error> is the exception raised by its run, or None.
+
+    """
+    scheduler = get_scheduler(n_cores)
+    names = {}
+    for name, graph in graphs:
+        oks = OptimalKs(make_engine(), graph, init_ka=init_ka, init_kb=init_kb, i_th=i_th,
+                        logging_level=logging_level)
+        names[scheduler.submit_top_level(oks.iterator)] = name, oks
+    for future in scheduler.as_completed(list(names)):
+        name, oks = names[future]
+        yield name, oks, future.exception()
+
+
+def get_engine_factory(engine, params):
+    """
+        This function returns a callable that builds a new engine of type <engine> (see ENGINES) from <params>.
+    """
+    module, name = ENGINES[engine]
+    engine_class = getattr(__import__(module, fromlist=[name]), name)
+    return lambda: engine_class(**params)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the model selection of the biSBM on many graphs; one JSON line is printed per graph, "
+                    "as soon as it is done."
+    )
+    parser.add_argument("graphs", nargs="+",
+                        help="path prefix of each graph, whose edgelist and types are <prefix>.edgelist and "
+                             "<prefix>.types")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="mcmc_numba")
+    parser.add_argument("--engine-param", action="append", default=[], metavar="KEY=VALUE",
+                        help="parameter of the engine constructor, e.g. n_sweeps=4; the value is parsed as JSON "
+                             "when possible")
+    parser.add_argument("--n-cores", type=int, default=os.cpu_count())
+    parser.add_argument("--init-ka", type=int, default=10)
+    parser.add_argument("--init-kb", type=int, default=10)
+    parser.add_argument("--i-th", type=float, default=0.1)
+    parser.add_argument("--delimiter", default="\t")
+    args = parser.parse_args(argv)
+
+    params = {"n_cores": args.n_cores}
+    for param in args.engine_param:
+        key, value = param.split("=", 1)
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+
+    graphs = [
+        (prefix, get_bipartite_graph(prefix + ".edgelist", prefix + ".types", args.delimiter))
+        for prefix in args.graphs
+    ]
+    results = run_batch(graphs, get_engine_factory(args.engine, params), args.n_cores,
+                        init_ka=args.init_ka, init_kb=args.init_kb, i_th=args.i_th)
+    n_errors = 0
+    for name, oks, error in results:
+        if error is not None:
+            n_errors += 1
+            record = {"graph": name, "error": "{}: {}".format(type(error).__name__, error)}
+        else:
+            ka, kb = oks.confident_desc_len.get_min_point()
+            record = {
+                "graph": name,
+                "ka": ka,
+                "kb": kb,
+                "desc_len": oks.confident_desc_len[(ka, kb)],
+                "desc_lens": [[p[0], p[1], d] for p, d in oks.confident_desc_len.items()]
+            }
+        sys.stdout.write(json.dumps(record) + "\n")
+        sys.stdout.flush()
+    return 1 if n_errors > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
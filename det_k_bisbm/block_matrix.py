@@ -0,0 +1,121 @@
+""" compact affinity matrices """
+import math
+import numpy as np
+
+
+class BlockMatrix(object):
+    """Affinity matrix of a bipartite partition, stored as its ka x kb block of integer edge counts.
+
+    The full (ka + kb) x (ka + kb) affinity matrix, m_e_rs, is symmetric, its diagonal blocks are zero, and its
+    off-diagonal blocks are the same ka x kb block twice. Only that block is stored, along with its row and column
+    sums, i.e. the degrees of the type-a and type-b groups. The block is never modified in place; merging two groups
+    gives a new BlockMatrix, whose marginals are updated rather than summed again.
+
+    Parameters
+    ----------
+    block : numpy array, required
+        The ka x kb counts of the edges between the type-a group r and the type-b group s.
+
+    e_r, e_s : numpy array, optional
+        The row and column sums of <block>, if they are already known.
+
+    Attributes
+    ----------
+    block : numpy array
+        int64 array of shape (ka, kb).
+
+    e_r, e_s : numpy array
+        int64 degrees of the type-a and type-b groups.
+
+    ka, kb, e : int
+        Number of type-a groups, type-b groups and edges.
+
+    """
+
+    def __init__(self, block, e_r=None, e_s=None):
+        block = np.asarray(block)
+        assert block.ndim == 2, "[ERROR] the block should be a 2-d array; here its shape is {}".format(block.shape)
+        self.block = block.astype(np.int64)
+        self.ka, self.kb = self.block.shape
+        self.e_r = self.block.sum(axis=1) if e_r is None else np.asarray(e_r, dtype=np.int64)
+        self.e_s = self.block.sum(axis=0) if e_s is None else np.asarray(e_s, dtype=np.int64)
+        self.e = int(self.e_r.sum())
+        for arr in [self.block, self.e_r, self.e_s]:
+            arr.setflags(write=False)
+
+    @classmethod
+    def from_m_e_rs(cls, m_e_rs, ka):
+        """Take the ka x kb block of the full affinity matrix <m_e_rs>."""
+        return cls(np.asarray(m_e_rs)[:ka, ka:])
+
+    @classmethod
+    def from_edges(cls, edges, mb, ka, kb):
+        """Count the edges between each type-a group and each type-b group, in one bincount pass.
+
+        Type-b labels in <mb> start at ka. Raise ImportError if an edge does not join a type-a and a type-b group,
+        or if a label is beyond the ka type-a or the kb type-b groups.
+        """
+        mb = np.asarray(mb, dtype=np.int64)
+        r = mb[edges[:, 0]]
+        s = mb[edges[:, 1]]
+        a = np.minimum(r, s)
+        b = np.maximum(r, s) - ka
+        if len(a) > 0 and (a.max() >= ka or b.min() < 0 or b.max() >= kb):
+            raise ImportError("[ERROR] This is not a bipartite network!")
+        return cls(np.bincount(a * kb + b, minlength=ka * kb).reshape(ka, kb))
+
+    @property
+    def shape(self):
+        """Shape of the full affinity matrix."""
+        return self.ka + self.kb, self.ka + self.kb
+
+    @property
+    def m_e_r(self):
+        """Degrees of all groups, i.e. the row sums of the full affinity matrix."""
+        return np.concatenate([self.e_r, self.e_s])
+
+    def to_m_e_rs(self):
+        """The full, symmetric (ka + kb) x (ka + kb) affinity matrix, as floats."""
+        m_e_rs = np.zeros(self.shape)
+        m_e_rs[:self.ka, self.ka:] = self.block
+        m_e_rs[self.ka:, :self.ka] = self.block.T
+        return m_e_rs
+
+    def get_italic_i(self):
+        """The profile likelihood, (sum_rs e_rs log e_rs - sum_r e_r log e_r - sum_s e_s log e_s) / E + log(2E)."""
+        if self.e == 0:
+            return 0.
+        return float(
+            (_x_log_x(self.block).sum() - _x_log_x(self.e_r).sum() - _x_log_x(self.e_s).sum()) / self.e
+            + math.log(2 * self.e)
+        )
+
+    def merge(self, merge_list):
+        """Merge two groups of the same type, given as row-indexes of the full matrix (type-b ones offset by ka).
+
+        The higher index is folded into the lower one, which is the same relabeling that is applied to the
+        membership vector.
+        """
+        r, s = sorted(merge_list)
+        assert (s < self.ka) == (r < self.ka), \
+            "[ERROR] cannot merge a type-a block ({}) with a type-b block ({})".format(r, s)
+        if s < self.ka:
+            block = np.delete(self.block, s, axis=0)
+            block[r] += self.block[s]
+            e_r = np.delete(self.e_r, s)
+            e_r[r] += self.e_r[s]
+            return BlockMatrix(block, e_r, self.e_s)
+        r -= self.ka
+        s -= self.ka
+        block = np.delete(self.block, s, axis=1)
+        block[:, r] += self.block[:, s]
+        e_s = np.delete(self.e_s, s)
+        e_s[r] += self.e_s[s]
+        return BlockMatrix(block, self.e_r, e_s)
+
+
+def _x_log_x(x):
+    x = np.asarray(x, dtype=np.float64)
+    out = np.zeros_like(x)
+    np.log(x, out=out, where=x > 0)
+    return x * out
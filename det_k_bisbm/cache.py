@@ -0,0 +1,198 @@
+""" caches shared across OptimalKs instances """
+import os
+import atexit
+import hashlib
+import tempfile
+import threading
+import numpy as np
+
+from det_k_bisbm.block_matrix import BlockMatrix
+from det_k_bisbm.tracing import traced
+
+# engine attributes that do not change the partitions found, and hence are left out of the keys of ResultStore
+_NON_RESULT_PARAMS = ("PARALLELIZATION", "NUM_CORES", "KL_PARALLELIZATION", "kl_verbose", "f_kl_output", "types")
+
+
+class GraphInputCache(object):
+    """Engine input files, written exactly once per graph and shared by reference counting.
+
+    The files are keyed by the content hash of the graph and placed in shared memory (/dev/shm) when it is available.
+    Their names also carry the process id, so that one process never removes a file that another process still uses.
+    All remaining files are removed when the interpreter exits.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Where to write the files; defaults to /dev/shm, or to the system temporary directory.
+
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = "/dev/shm" if os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+        self.directory = os.path.join(directory, "det_k_bisbm")
+        self._ref_counts = {}
+        self._paths = {}
+        self._lock = threading.Lock()
+        atexit.register(self.clear)
+
+    def get_path(self, graph):
+        """Path to the edgelist file of <graph>, written on first use; it is kept until exit."""
+        with self._lock:
+            return self._get_path(graph)
+
+    def acquire(self, graph):
+        """Same as <get_path>, but the file is removed as soon as every acquirer has released it."""
+        # the lookup (or the write) and the count happen under one lock, so that a concurrent release of the
+        # same graph never removes the file in between
+        with self._lock:
+            path = self._get_path(graph)
+            self._ref_counts[graph.content_hash] = self._ref_counts.get(graph.content_hash, 0) + 1
+            return path
+
+    def release(self, graph):
+        key = graph.content_hash
+        with self._lock:
+            if self._ref_counts.get(key, 0) == 0:
+                # never acquired in this process (e.g. a copy of OptimalKs in a worker process)
+                return
+            self._ref_counts[key] -= 1
+            if self._ref_counts[key] == 0:
+                del self._ref_counts[key]
+                self._remove(self._paths.pop(key, None))
+
+    def clear(self):
+        with self._lock:
+            for path in self._paths.values():
+                self._remove(path)
+            self._paths = {}
+            self._ref_counts = {}
+
+    def _get_path(self, graph):
+        # to be called with the lock held
+        key = graph.content_hash
+        if key not in self._paths or not os.path.isfile(self._paths[key]):
+            self._paths[key] = self._write(graph, key)
+        return self._paths[key]
+
+    @traced("GraphInputCache.write")
+    def _write(self, graph, key):
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            pass
+        path = os.path.join(self.directory, "{}-{}.edgelist".format(key, os.getpid()))
+        # write to a temporary name first, so that the engines never see a half-written file
+        with tempfile.NamedTemporaryFile(mode='w', dir=self.directory, delete=False) as f:
+            graph.write_edgelist(f)
+        os.rename(f.name, path)
+        return path
+
+    @staticmethod
+    def _remove(path):
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ResultStore(object):
+    """On-disk store of the best partition found at each (ka, kb), which persists across runs and processes.
+
+    An entry is keyed by the content hash of the graph, the engine (class and parameters) and (ka, kb), and holds
+    the group membership vector, the affinity matrix (as a BlockMatrix, or in full for a one-mode graph, where
+    kb = 0), the profile likelihood and the description length.
+    Each entry is one file, written under a temporary name and then renamed, so that the processes sharing the
+    store never read a half-written entry; a worse result never replaces a stored one. When the store grows
+    beyond <max_size> bytes, the least recently used entries are evicted.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Where to keep the entries; defaults to ~/.cache/det_k_bisbm.
+
+    max_size : int, optional
+        Maximal size of the store in bytes.
+
+    """
+
+    def __init__(self, directory=None, max_size=2 ** 30):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser("~"), ".cache", "det_k_bisbm")
+        self.directory = directory
+        self.max_size = int(max_size)
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            pass
+
+    @staticmethod
+    def get_engine_key(engine):
+        """Identify <engine> by its class and its public parameters that affect the results."""
+        params = sorted(
+            (k, v) for k, v in vars(engine).items()
+            if not k.startswith("_") and k not in _NON_RESULT_PARAMS and isinstance(v, (bool, int, float, str))
+        )
+        return "{}.{}{}".format(type(engine).__module__, type(engine).__name__, params)
+
+    @traced("ResultStore.get")
+    def get(self, graph, engine_key, ka, kb):
+        """Return (italic_i, m_e_rs, mb, desc_len) stored for this point, or None."""
+        path = self._get_path(graph, engine_key, ka, kb)
+        try:
+            with np.load(path) as entry:
+                m_e_rs = BlockMatrix(entry["block"]) if "block" in entry else entry["m_e_rs"]
+                result = float(entry["italic_i"]), m_e_rs, entry["mb"].tolist(), float(entry["desc_len"])
+            # mark the entry as recently used
+            os.utime(path, None)
+        except (IOError, OSError, ValueError, KeyError):
+            # missing, or evicted by another process meanwhile
+            return None
+        return result
+
+    @traced("ResultStore.put")
+    def put(self, graph, engine_key, ka, kb, italic_i, m_e_rs, mb, desc_len):
+        stored = self.get(graph, engine_key, ka, kb)
+        if stored is not None and stored[3] <= desc_len:
+            return
+        if isinstance(m_e_rs, BlockMatrix):
+            arrays = {"block": m_e_rs.block}
+        else:
+            arrays = {"m_e_rs": np.asarray(m_e_rs)}
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as f:
+            np.savez(f, italic_i=italic_i, mb=np.asarray(mb, dtype=np.int32), desc_len=desc_len, **arrays)
+        path = self._get_path(graph, engine_key, ka, kb)
+        os.rename(f.name, path)
+        self._evict(path)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                GraphInputCache._remove(os.path.join(self.directory, name))
+
+    def _get_path(self, graph, engine_key, ka, kb):
+        key = "{}|{}|{}|{}".format(graph.content_hash, engine_key, int(ka), int(kb))
+        return os.path.join(self.directory, "{}.npz".format(hashlib.md5(key.encode()).hexdigest()))
+
+    def _evict(self, path):
+        # the entry at <path> was just written, and is kept
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npz") or name == os.path.basename(path):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        size = sum(entry[1] for entry in entries) + os.path.getsize(path)
+        for _, entry_size, name in sorted(entries):
+            if size <= self.max_size:
+                break
+            GraphInputCache._remove(os.path.join(self.directory, name))
+            size -= entry_size
+
+
+graph_input_cache = GraphInputCache()
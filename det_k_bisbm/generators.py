@@ -0,0 +1,75 @@
+""" random graph generators """
+import numpy as np
+
+from det_k_bisbm.graph import BipartiteGraph
+
+
+def gen_bisbm(n_a, n_b, ka, kb, e, mixing=0.1, degree_exponent=None, is_simple=False, seed=None):
+    '''
+        Generate a degree-corrected biSBM graph with a planted partition, in vectorized NumPy.
+
+        The type-a nodes are split into <ka> equal-sized groups of consecutive nodes, and the type-b nodes into <kb>
+        groups likewise. Each type-a group r is planted with the type-b groups s such that s == r * kb // ka or
+        r == s * ka // kb, so that every group has at least one partner. A fraction (1 - <mixing>) of the edges
+        is drawn uniformly between planted pairs, and the other edges between random groups, in proportion to the
+        group sizes. The endpoints of the edges are then drawn within their groups, in proportion to the node
+        propensities, which are Pareto-distributed with shape <degree_exponent>, or all equal if it is None.
+
+        :param n_a: number of type-a nodes
+        :param n_b: number of type-b nodes
+        :param ka: number of planted type-a groups
+        :param kb: number of planted type-b groups
+        :param e: number of edges
+        :param mixing: fraction of the edges that ignore the planted structure; 1. gives a random bipartite graph
+        :param degree_exponent: shape of the Pareto distribution of the node propensities, e.g. 2.5
+        :param is_simple: if True, the multi-edges are merged, hence the graph may have fewer than <e> edges
+        :param seed: seed of the random number generator
+        :return: the graph, as a BipartiteGraph, and the planted membership vector, mb, as an int32 numpy array
+    '''
+    assert 0 < ka <= n_a and 0 < kb <= n_b, \
+        "[ERROR] cannot plant ({}, {}) groups into ({}, {}) nodes".format(ka, kb, n_a, n_b)
+    assert 0. <= mixing <= 1., "[ERROR] <mixing> should be within [0, 1]; here it is {}".format(mixing)
+    rng = np.random.RandomState(seed)
+    n = n_a + n_b
+    k = ka + kb
+
+    # groups of consecutive nodes; type-b labels start at ka
+    n_r = np.concatenate([
+        np.array([len(c) for c in np.array_split(np.arange(n_a), ka)]),
+        np.array([len(c) for c in np.array_split(np.arange(n_b), kb)])
+    ])
+    mb = np.repeat(np.arange(k), n_r).astype(np.int32)
+    offsets = np.concatenate([[0], np.cumsum(n_r)]).astype(np.int64)
+
+    # probability of an edge to fall between the groups r (type-a) and s (type-b)
+    r, s = np.meshgrid(np.arange(ka), np.arange(kb), indexing="ij")
+    planted = ((s == r * kb // ka) | (r == s * ka // kb)).astype(np.float64)
+    p_rs = (1. - mixing) * planted / planted.sum()
+    p_rs += mixing * np.outer(n_r[:ka], n_r[ka:]) / float(n_a * n_b)
+    m_rs = rng.multinomial(int(e), p_rs.ravel() / p_rs.sum()).reshape(ka, kb)
+
+    # node propensities
+    if degree_exponent is None:
+        theta = np.ones(n)
+    else:
+        theta = rng.pareto(degree_exponent, n) + 1.
+
+    def draw_endpoints(group, m):
+        # the number of edge ends of each node of the group is multinomial in the propensities, and the ends are
+        # shuffled, so that they are paired at random with the ends of the other side
+        _theta = theta[offsets[group]:offsets[group + 1]]
+        counts = rng.multinomial(m, _theta / _theta.sum())
+        return rng.permutation(np.repeat(np.arange(offsets[group], offsets[group + 1], dtype=np.int32), counts))
+
+    # the edges are sorted by (r, s); the ends of the type-a group r are contiguous, and those of the type-b
+    # groups are put in place via a stable sort of the edges by s
+    s_of_edges = np.tile(np.arange(kb, dtype=np.int8 if kb < 128 else np.int32), ka)
+    s_of_edges = np.repeat(s_of_edges, m_rs.ravel())
+    edges = np.empty((int(e), 2), dtype=np.int32)
+    edges[:, 0] = np.concatenate([draw_endpoints(r, m_rs[r].sum()) for r in range(ka)])
+    edges[np.argsort(s_of_edges, kind="stable"), 1] = np.concatenate(
+        [draw_endpoints(ka + s, m_rs[:, s].sum()) for s in range(kb)]
+    )
+    if is_simple:
+        edges = np.unique(edges, axis=0)
+    return BipartiteGraph(edges, np.repeat([1, 2], [n_a, n_b])), mb
@@ -0,0 +1,148 @@
+""" compact graph containers """
+import hashlib
+import numpy as np
+from numba import njit
+
+from det_k_bisbm.cache import graph_input_cache
+
+
+class BipartiteGraph(object):
+    """Compact bipartite graph backed by int32 NumPy arrays.
+
+    The graph is built once and meant to be shared read-only, e.g. between `OptimalKs`, the engines and the utils.
+    All its arrays are flagged as non-writeable.
+
+    Parameters
+    ----------
+    edges : list or numpy array, required
+        Edgelist (bipartite network), as a Python list of 2-tuples or an array of shape (n_edges, 2).
+        Node indexes are 0-indexed, with all type-a nodes first and then type-b nodes.
+
+    types : list or numpy array, required
+        Types of each node specifying the type membership (1 for type-a, 2 for type-b).
+
+    Attributes
+    ----------
+    edges : numpy array
+        int32 array of shape (n_edges, 2).
+
+    types : numpy array
+        int32 array of node types.
+
+    indptr, indices : numpy array
+        CSR representation of the (undirected) adjacency; the neighbors of node v are indices[indptr[v]:indptr[v + 1]].
+
+    n_a, n_b, n, e : int
+        Number of type-a nodes, type-b nodes, all nodes and edges.
+
+    """
+    # see UnipartiteGraph
+    IS_ONE_MODE = False
+
+    def __init__(self, edges, types):
+        edges = np.asarray(edges)
+        if edges.size == 0:
+            edges = np.zeros((0, 2), dtype=np.int32)
+        assert edges.ndim == 2 and edges.shape[1] == 2, \
+            "[ERROR] the edgelist should hold 2-tuples of node indexes; here its shape is {}".format(edges.shape)
+        self.edges = edges.astype(np.int32)
+        self.types = np.asarray(types).astype(np.int32)
+
+        self.n_a = int(np.count_nonzero(self.types == 1))
+        self.n_b = int(np.count_nonzero(self.types == 2))
+        assert self.n_a > 0, "[ERROR] Number of type-a nodes = 0, which is not allowed"
+        assert self.n_b > 0 or self.IS_ONE_MODE, "[ERROR] Number of type-b nodes = 0, which is not allowed"
+        self.n = len(self.types)
+        self.e = len(self.edges)
+        assert self.n == self.n_a + self.n_b, \
+            "[ERROR] num_nodes ({}) does not equal to num_nodes_a ({}) plus num_nodes_b ({})".format(
+                self.n, self.n_a, self.n_b
+            )
+        if self.e > 0:
+            assert self.edges.min() >= 0 and self.edges.max() < self.n, \
+                "[ERROR] node indexes in the edgelist should run from 0 to {}".format(self.n - 1)
+
+        self.indptr, self.indices = self._get_csr(self.edges, self.n)
+
+        for arr in [self.edges, self.types, self.indptr, self.indices]:
+            arr.setflags(write=False)
+
+        self._content_hash = None
+
+    @classmethod
+    def from_na_nb(cls, edges, na, nb):
+        """Build the graph when the type-a nodes are 0 .. na - 1 and the type-b nodes are na .. na + nb - 1."""
+        return cls(edges, [1] * int(na) + [2] * int(nb))
+
+    @property
+    def degrees(self):
+        return np.diff(self.indptr)
+
+    def neighbors(self, v):
+        return self.indices[self.indptr[v]:self.indptr[v + 1]]
+
+    def write_edgelist(self, f, delimiter="\t", offset=0):
+        """Write the edgelist as text to a path or an open file handle; <offset> is added to every node index."""
+        np.savetxt(f, self.edges.astype(np.int64) + int(offset), fmt="%d", delimiter=delimiter)
+
+    def write_types(self, f):
+        np.savetxt(f, self.types, fmt="%d")
+
+    @property
+    def content_hash(self):
+        """md5 digest of the edges and the types, which identifies the graph across instances and runs."""
+        if self._content_hash is None:
+            h = hashlib.md5()
+            h.update(np.ascontiguousarray(self.edges).tobytes())
+            h.update(np.ascontiguousarray(self.types).tobytes())
+            self._content_hash = h.hexdigest()
+        return self._content_hash
+
+    def get_engine_input(self):
+        """Path to a text edgelist of this graph, as consumed by the engine binaries; written once per graph."""
+        return graph_input_cache.get_path(self)
+
+    @staticmethod
+    def _get_csr(edges, n):
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(edges.ravel(), minlength=n), out=indptr[1:])
+        indices = _fill_csr_indices(edges, indptr)
+        return indptr, indices
+
+
+@njit(cache=True)
+def _fill_csr_indices(edges, indptr):
+    # a counting sort of the edge ends by source, in one pass; the neighbors of each node keep the order of the
+    # edgelist, first from the source and then from the target column
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    position = indptr[:-1].copy()
+    for col in range(2):
+        for idx in range(len(edges)):
+            v = edges[idx, col]
+            indices[position[v]] = edges[idx, 1 - col]
+            position[v] += 1
+    return indices
+
+
+class UnipartiteGraph(BipartiteGraph):
+    """Compact one-mode graph, seen as a bipartite graph whose nodes are all of type a, i.e. with n_b = 0.
+
+    It shares the arrays and the caches of `BipartiteGraph`, hence the engines and the utils that accept one also
+    accept the other; the one-mode code paths are chosen by kb = 0 (see `OptimalK`).
+
+    Parameters
+    ----------
+    edges : list or numpy array, required
+        Edgelist, as a Python list of 2-tuples or an array of shape (n_edges, 2), with 0-indexed nodes.
+
+    n : int, optional
+        Number of nodes; defaults to the highest node index plus one.
+
+    """
+    IS_ONE_MODE = True
+
+    def __init__(self, edges, n=None):
+        if n is None:
+            edges = np.asarray(edges)
+            n = int(edges.astype(np.int64).max()) + 1 if edges.size > 0 else 0
+        super(UnipartiteGraph, self).__init__(edges, [1] * int(n))
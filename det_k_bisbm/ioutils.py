@@ -1,4 +1,15 @@
 """ i/o utilities """
+import os
+import pickle
+import tempfile
+import warnings
+import numpy as np
+
+from itertools import islice
+from numba import njit
+
+from det_k_bisbm.graph import BipartiteGraph
+from det_k_bisbm.tracing import traced
 
 
 def get_edgelist(f_edgelist, delimiter=','):
@@ -56,6 +67,291 @@ def get_types(f_types):
     return types
 
 
+@traced("get_bipartite_graph")
+def get_bipartite_graph(f_edgelist, f_types, delimiter=','):
+    """
+        This function returns a BipartiteGraph from an edgelist file and a types file.
+
+        Parameters
+        ----------
+        f_edgelist : str
+            The path to the edgelist file
+
+        f_types : str
+            The path to the types file
+
+        delimiter : str
+            The delimiter in the edgelist file
+
+        Returns
+        -------
+        graph : BipartiteGraph
+            The graph, backed by int32 arrays.
+
+    """
+    edges = np.loadtxt(f_edgelist, delimiter=delimiter, dtype=np.int64, ndmin=2)
+    types = np.loadtxt(f_types, dtype=np.int64, ndmin=1)
+    return BipartiteGraph(edges, types)
+
+
+@traced("read_bipartite_graph")
+def read_bipartite_graph(f_edgelist, f_types=None, delimiter=None, chunk_size=2 ** 16, dtype=np.int64):
+    """
+        This function streams a large edgelist file into a BipartiteGraph, chunk by chunk.
+
+        Each chunk of <chunk_size> lines is parsed by NumPy, checked for bipartiteness, remapped to node indexes, and
+        rid of the edges seen before, keeping the first one; only its new edges are kept, as int32 pairs. The nodes
+        are finally laid out as in the engines, i.e. 0 .. n_a - 1 for the type-a nodes and n_a .. n - 1 for the
+        type-b nodes, each in the order of their ids.
+
+        An edge seen before in the reverse direction (`b a` after `a b`) is dropped only when <f_types> is passed.
+        Otherwise, the columns give the types, hence the reversed edge puts its nodes in both columns, which raises
+        an ImportError as for any graph that is not bipartite.
+
+        Besides the parsing of one chunk, the memory used grows with the graph, not with the file: 8 bytes per kept
+        edge, a set of 8-byte keys of the edges (at most half full), and the ids of the nodes. Building the
+        BipartiteGraph at the end takes about twice the memory of its edges.
+
+        Parameters
+        ----------
+        f_edgelist : str
+            The path to the edgelist file; the columns after the first two (e.g. weights) are ignored
+
+        f_types : str, optional
+            The path to the types file, whose i-th line is the type (1 or 2) of the node of id i. If not passed,
+            the nodes of the first column are of type a and those of the second column of type b, and the ids
+            can be arbitrary
+
+        delimiter : str, optional
+            The delimiter in the edgelist file; defaults to any whitespace
+
+        chunk_size : int, optional
+            The number of lines parsed at once
+
+        dtype : data-type, optional
+            The type of the node ids, e.g. `str` for names; only int ids are allowed with <f_types>
+
+        Returns
+        -------
+        graph : BipartiteGraph
+            The graph, backed by int32 arrays.
+
+        ids : numpy array
+            The original id of each node of the graph.
+
+        stats : dict
+            The number of lines parsed ("n_lines"), of duplicate edges dropped ("n_duplicates"), the peak size in
+            bytes of the text and the parsed array of a chunk ("peak_parse_bytes"), and the size in bytes of the
+            kept edges and of the set of their keys, at the end of the parsing ("edge_bytes", "key_set_bytes").
+
+    """
+    types = None
+    new_index = None
+    if f_types is not None:
+        assert np.issubdtype(np.dtype(dtype), np.integer), "[ERROR] the node ids should be ints when <f_types> is passed"
+        types = np.loadtxt(f_types, dtype=np.int64, ndmin=1)
+        # the final layout is known beforehand
+        ids = np.argsort(types, kind="mergesort")
+        new_index = np.empty(len(types), dtype=np.int32)
+        new_index[ids] = np.arange(len(types))
+    elif np.issubdtype(np.dtype(dtype), np.integer):
+        index_a, index_b = _IntIdIndex(), _IntIdIndex()
+    else:
+        index_a, index_b = _IdIndex(), _IdIndex()
+
+    key_set = _KeySet()
+    chunks = []
+    stats = {"n_lines": 0, "n_duplicates": 0, "peak_parse_bytes": 0}
+    with open(f_edgelist, "r") as f:
+        for lines in iter(lambda: list(islice(f, int(chunk_size))), []):
+            with warnings.catch_warnings():
+                # a chunk of blank lines
+                warnings.simplefilter("ignore", UserWarning)
+                chunk = np.loadtxt(lines, dtype=dtype, delimiter=delimiter, usecols=(0, 1), ndmin=2)
+            stats["n_lines"] += len(lines)
+            stats["peak_parse_bytes"] = max(stats["peak_parse_bytes"], sum(map(len, lines)) + chunk.nbytes)
+            del lines
+            if types is not None:
+                assert chunk.size == 0 or (chunk.min() >= 0 and chunk.max() < len(types)), \
+                    "[ERROR] node indexes in the edgelist should run from 0 to {}".format(len(types) - 1)
+                if np.any(types[chunk[:, 0]] == types[chunk[:, 1]]):
+                    raise ImportError("[ERROR] This is not a bipartite network!")
+                edges = new_index[chunk]
+                # the type-a end comes first, hence an edge and its reverse have the same key
+                edges.sort(axis=1)
+            else:
+                edges = np.stack([index_a.get_or_insert(chunk[:, 0]), index_b.get_or_insert(chunk[:, 1])], axis=1)
+                _check_columns_are_disjoint(chunk, index_a, index_b)
+            del chunk
+            is_new = key_set.add((edges[:, 0].astype(np.int64) << 32) | edges[:, 1])
+            stats["n_duplicates"] += len(edges) - int(is_new.sum())
+            chunks.append(edges[is_new])
+
+    stats["key_set_bytes"] = key_set.nbytes
+    del key_set
+    edges = np.concatenate(chunks) if len(chunks) > 0 else np.zeros((0, 2), dtype=np.int32)
+    del chunks
+    stats["edge_bytes"] = edges.nbytes
+    if types is not None:
+        node_types = types[ids]
+    else:
+        # from the order of appearance to the order of the ids, in place
+        ids_a = index_a.get_ids(dtype)
+        ids_b = index_b.get_ids(dtype)
+        del index_a, index_b
+        order_a = np.argsort(ids_a, kind="mergesort")
+        order_b = np.argsort(ids_b, kind="mergesort")
+        rank = np.empty(len(ids_a) + len(ids_b), dtype=np.int32)
+        rank[order_a] = np.arange(len(ids_a))
+        rank[len(ids_a) + order_b] = len(ids_a) + np.arange(len(ids_b))
+        edges[:, 1] += len(ids_a)
+        for start in range(0, len(edges), int(chunk_size)):
+            edges[start:start + int(chunk_size)] = rank[edges[start:start + int(chunk_size)]]
+        ids = np.concatenate([ids_a[order_a], ids_b[order_b]])
+        node_types = np.array([1] * len(ids_a) + [2] * len(ids_b))
+    return BipartiteGraph(edges, node_types), ids, stats
+
+
+def _check_columns_are_disjoint(chunk, index_a, index_b):
+    # after the ids of <chunk> are indexed, hence an id in both columns of the chunk is also found
+    for column, index in [(chunk[:, 0], index_b), (chunk[:, 1], index_a)]:
+        both = column[index.contains(column)]
+        if len(both) > 0:
+            raise ImportError(
+                "[ERROR] This is not a bipartite network! The node {} is in both columns.".format(both[0])
+            )
+
+
+class _IdIndex(object):
+    """The index of any hashable node ids, in the order of first appearance."""
+
+    def __init__(self):
+        self._index = {}
+
+    def __len__(self):
+        return len(self._index)
+
+    def get_or_insert(self, ids):
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        index = self._index
+        indexes = np.array([index.setdefault(node_id, len(index)) for node_id in unique_ids.tolist()], dtype=np.int32)
+        return indexes[inverse.ravel()]
+
+    def contains(self, ids):
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        index = self._index
+        return np.array([node_id in index for node_id in unique_ids.tolist()], dtype=np.bool_)[inverse.ravel()]
+
+    def get_ids(self, dtype):
+        """The ids, by index."""
+        return np.array(list(self._index), dtype=dtype)
+
+
+class _IntIdIndex(object):
+    """Same as _IdIndex for int ids, in an open-addressing hash table that is kept at most half full."""
+
+    def __init__(self):
+        self._keys = np.zeros(2 ** 10, dtype=np.int64)
+        self._values = np.full(2 ** 10, -1, dtype=np.int32)
+        self._shift = 64 - 10
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def get_or_insert(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        if 2 * (self._size + len(ids)) > len(self._keys):
+            # at most this many new ids
+            n_new = len(np.unique(ids))
+        else:
+            n_new = 0
+        if 2 * (self._size + n_new) > len(self._keys):
+            old_ids = self.get_ids(np.int64)
+            size = len(self._keys)
+            while 2 * (self._size + n_new) > size:
+                size *= 2
+            self._keys = np.zeros(size, dtype=np.int64)
+            self._values = np.full(size, -1, dtype=np.int32)
+            self._shift = 64 - int(np.log2(size))
+            # in the order of the indexes, which are thus kept
+            _get_indexes(self._keys, self._values, self._shift, old_ids, 0, np.empty(len(old_ids), dtype=np.int32))
+        indexes = np.empty(len(ids), dtype=np.int32)
+        self._size = _get_indexes(self._keys, self._values, self._shift, ids, self._size, indexes)
+        return indexes
+
+    def contains(self, ids):
+        indexes = np.empty(len(ids), dtype=np.int32)
+        _get_indexes(self._keys, self._values, self._shift, np.asarray(ids, dtype=np.int64), -1, indexes)
+        return indexes >= 0
+
+    def get_ids(self, dtype):
+        ids = np.empty(self._size, dtype=dtype)
+        is_used = self._values >= 0
+        ids[self._values[is_used]] = self._keys[is_used]
+        return ids
+
+
+class _KeySet(object):
+    """A set of non-negative int64 keys, in an open-addressing hash table that is kept at most half full."""
+
+    def __init__(self):
+        self._table = np.full(2 ** 10, -1, dtype=np.int64)
+        self._shift = 64 - 10
+        self._size = 0
+
+    @property
+    def nbytes(self):
+        return self._table.nbytes
+
+    def add(self, keys):
+        """Add <keys>; return whether each of them was new, where the repeats of a new key within <keys> are not."""
+        while 2 * (self._size + len(keys)) > len(self._table):
+            table = np.full(2 * len(self._table), -1, dtype=np.int64)
+            self._shift -= 1
+            old_keys = self._table[self._table >= 0]
+            _insert_keys(table, self._shift, old_keys, np.empty(len(old_keys), dtype=np.bool_))
+            self._table = table
+        is_new = np.empty(len(keys), dtype=np.bool_)
+        self._size += _insert_keys(self._table, self._shift, keys, is_new)
+        return is_new
+
+
+@njit(cache=True)
+def _get_indexes(keys, values, shift, ids, size, indexes):
+    # linear probing from the top bits of a multiplicative hash, where a value of -1 marks an empty slot; a new id
+    # gets the index <size>, which is then incremented, unless <size> is -1, where the id is only looked up
+    mask = len(keys) - 1
+    for i in range(len(ids)):
+        node_id = ids[i]
+        slot = ((node_id * -7046029254386353131) >> shift) & mask
+        while values[slot] != -1 and keys[slot] != node_id:
+            slot = (slot + 1) & mask
+        if values[slot] == -1 and size >= 0:
+            keys[slot] = node_id
+            values[slot] = size
+            size += 1
+        indexes[i] = values[slot]
+    return size
+
+
+@njit(cache=True)
+def _insert_keys(table, shift, keys, is_new):
+    # linear probing from the top bits of a multiplicative hash; -1 marks the empty slots
+    mask = len(table) - 1
+    n_new = 0
+    for i in range(len(keys)):
+        key = keys[i]
+        slot = ((key * -7046029254386353131) >> shift) & mask
+        while table[slot] != -1 and table[slot] != key:
+            slot = (slot + 1) & mask
+        is_new[i] = table[slot] == -1
+        if is_new[i]:
+            table[slot] = key
+            n_new += 1
+    return n_new
+
+
 def save_mb_to_file(path, mb):
     """Save the group membership list to a file path.
 
@@ -72,3 +368,45 @@ def save_mb_to_file(path, mb):
     with open(path, "w") as f:
         for i in range(0, num_nodes):
             f.write(str(mb[i]) + "\n")
+
+
+@traced("save_checkpoint")
+def save_checkpoint(path, state):
+    """
+        This function writes a checkpoint of the heuristic state to a file, atomically.
+
+        The state is pickled, where the membership vectors are held by a MergeTree, as int32 arrays and merges.
+        It is written to a temporary file first, then renamed, so that <path> always holds a complete checkpoint.
+
+        Parameters
+        ----------
+        path : str
+            The path to the checkpoint file
+
+        state : dict
+            The state, as built by `OptimalKs`
+
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False) as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(f.name, path)
+
+
+def load_checkpoint(path):
+    """
+        This function reads a checkpoint written by `save_checkpoint`.
+
+        Parameters
+        ----------
+        path : str
+            The path to the checkpoint file
+
+        Returns
+        -------
+        state : dict
+            The state, as built by `OptimalKs`
+
+    """
+    with open(path, "rb") as f:
+        return pickle.load(f)
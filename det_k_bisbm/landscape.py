@@ -0,0 +1,148 @@
+""" indexed books of the visited (ka, kb) points """
+import heapq
+import numpy as np
+
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+
+class Landscape(MutableMapping):
+    """Values at the visited points of a grid of block numbers, e.g. the description lengths over (ka, kb).
+
+    It reads like the OrderedDict that it replaces: iterating over it gives the points in the order in which they
+    were first set. In addition, the values are indexed in two ways:
+
+        - a dense grid, where the unknown points are NaN, for the neighborhood queries;
+        - a heap of (value, rank, point), where rank is the insertion order of the point, to track the minimum.
+
+    Setting a value pushes it onto the heap, whose outdated entries are only dropped when they reach the top. The
+    minimum is the first point in insertion order among the lowest values, as `sorted(landscape, key=landscape.get)[0]`
+    would give.
+
+    Parameters
+    ----------
+    items : dict or iterable of (point, value), optional
+        Initial content.
+
+    Notes
+    -----
+    The points are non-negative ints, or tuples of them, all of the same length.
+
+    """
+
+    def __init__(self, items=None):
+        self._data = OrderedDict()
+        self._ranks = {}
+        self._heap = []
+        self._grid = None
+        self._n_ranks = 0
+        if items is not None:
+            self.update(items)
+
+    def __getitem__(self, point):
+        return self._data[point]
+
+    def __setitem__(self, point, value):
+        index = self._get_index(point)
+        self._grow(index)
+        if point not in self._ranks:
+            self._ranks[point] = self._n_ranks
+            self._n_ranks += 1
+        self._data[point] = value
+        self._grid[index] = value
+        heapq.heappush(self._heap, (value, self._ranks[point], point))
+        if len(self._heap) > 2 * len(self._data) + 16:
+            self._compact()
+
+    def __delitem__(self, point):
+        del self._data[point]
+        del self._ranks[point]
+        self._grid[self._get_index(point)] = np.nan
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, list(self._data.items()))
+
+    def copy(self):
+        landscape = type(self)()
+        landscape._data = OrderedDict(self._data)
+        landscape._ranks = dict(self._ranks)
+        landscape._heap = list(self._heap)
+        landscape._grid = None if self._grid is None else self._grid.copy()
+        landscape._n_ranks = self._n_ranks
+        return landscape
+
+    def get_min_point(self):
+        """The point of the lowest value; ties go to the point that was set first."""
+        heap = self._heap
+        while len(heap) > 0:
+            value, rank, point = heap[0]
+            if self._ranks.get(point) == rank and self._data[point] == value:
+                return point
+            heapq.heappop(heap)
+        raise ValueError("[ERROR] the landscape is empty")
+
+    def get_min_value(self):
+        return self._data[self.get_min_point()]
+
+    def is_min(self, value):
+        """Whether no value in the landscape is lower than <value>."""
+        return len(self._data) == 0 or not value > self.get_min_value()
+
+    def get_window(self, point, k_th):
+        """The values of the grid within <k_th> of <point> along each axis (NaN where unknown), and the window origin.
+
+        The window is clipped to the non-negative points; its entry [i, j] is at point (origin[0] + i, origin[1] + j).
+        """
+        index = self._get_index(point)
+        origin = tuple(max(i - int(k_th), 0) for i in index)
+        shape = tuple(i + int(k_th) + 1 - o for i, o in zip(index, origin))
+        window = np.full(shape, np.nan)
+        if self._grid is not None:
+            src = tuple(slice(o, min(o + s, n)) for o, s, n in zip(origin, shape, self._grid.shape))
+            window[tuple(slice(0, sl.stop - sl.start) for sl in src)] = self._grid[src]
+        if isinstance(point, tuple):
+            return window, origin
+        return window, origin[0]
+
+    def get_neighbors(self, point, k_th):
+        """The known points within <k_th> of <point> along each axis, excluding <point>, in insertion order."""
+        window, origin = self.get_window(point, k_th)
+        origin = origin if isinstance(point, tuple) else (origin,)
+        known = set(tuple(int(i + o) for i, o in zip(index, origin)) for index in np.argwhere(~np.isnan(window)))
+        if not isinstance(point, tuple):
+            known = set(index[0] for index in known)
+        return [p for p in self._data if p in known and p != point]
+
+    def get_grid(self):
+        """A copy of the dense grid, where the unknown points are NaN."""
+        return None if self._grid is None else self._grid.copy()
+
+    def _get_index(self, point):
+        index = tuple(point) if isinstance(point, tuple) else (point,)
+        assert all(int(i) == i and i >= 0 for i in index), \
+            "[ERROR] the points should be non-negative ints or tuples of them; here it is {}".format(point)
+        if self._grid is not None:
+            assert len(index) == self._grid.ndim, \
+                "[ERROR] the points should have {} dimensions; here it is {}".format(self._grid.ndim, point)
+        return tuple(int(i) for i in index)
+
+    def _grow(self, index):
+        if self._grid is None:
+            self._grid = np.full(tuple(2 * i + 1 for i in index), np.nan)
+            return
+        if all(i < n for i, n in zip(index, self._grid.shape)):
+            return
+        # double the grid along the axes that are too short, to amortize the copies
+        grid = np.full(tuple(max(n, 2 * i + 1) for i, n in zip(index, self._grid.shape)), np.nan)
+        grid[tuple(slice(0, n) for n in self._grid.shape)] = self._grid
+        self._grid = grid
+
+    def _compact(self):
+        self._heap = [(value, self._ranks[point], point) for point, value in self._data.items()]
+        heapq.heapify(self._heap)
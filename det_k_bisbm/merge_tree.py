@@ -0,0 +1,78 @@
+""" compact history of the membership vectors """
+import numpy as np
+
+
+class MergeTree(object):
+    """Membership vectors of the visited (ka, kb) points, stored as a tree of merges.
+
+    A computed point holds its membership vector as an int32 array (a root), while a point reached by merging two
+    groups only holds its parent and the merged pair of labels. The membership vector of such a point is only
+    materialized on request, by composing the relabelings of the merges into a lookup table of the root labels.
+
+    It reads like the dict of membership lists that it replaces: `trace_mb[(ka, kb)]` gives a list, and
+    `get_array` gives the int32 array. Assigning a point again does not change the points derived from it earlier.
+
+    """
+
+    def __init__(self):
+        self._nodes = []  # ("root", mb, k) or ("merge", parent node, (r, s), k), where k is the number of labels
+        self._points = {}
+        self._order = []
+
+    def __setitem__(self, point, mb):
+        mb = np.asarray(mb, dtype=np.int32)
+        self._add_node(point, ("root", mb, int(mb.max()) + 1 if len(mb) > 0 else 0))
+
+    def add_merge(self, point, parent_point, merge_list):
+        """Record that <point> is <parent_point> with the groups of <merge_list> merged (the higher into the lower)."""
+        parent = self._points[parent_point]
+        r, s = sorted(int(label) for label in merge_list)
+        assert 0 <= r < s < self._nodes[parent][-1] and (r < parent_point[0]) == (s < parent_point[0]), \
+            "[ERROR] cannot merge the groups {} at {}".format([r, s], parent_point)
+        k = self._nodes[parent][-1] - 1
+        assert k == point[0] + point[1], \
+            "[ERROR] inconsistency between the membership indexes and the number of blocks."
+        self._add_node(point, ("merge", parent, (r, s), k))
+
+    def get_array(self, point):
+        node = self._nodes[self._points[point]]
+        merges = []
+        while node[0] == "merge":
+            merges.append(node[2])
+            node = self._nodes[node[1]]
+        table = np.arange(node[2], dtype=np.int32)
+        for r, s in reversed(merges):
+            table = np.where(table == s, r, table - (table > s)).astype(np.int32)
+        return table[node[1]]
+
+    def __getitem__(self, point):
+        return self.get_array(point).tolist()
+
+    def __contains__(self, point):
+        return point in self._points
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def keys(self):
+        return list(self._order)
+
+    def items(self):
+        return [(point, self[point]) for point in self._order]
+
+    def copy(self):
+        """A snapshot; the nodes are never modified, hence it shares them with this tree."""
+        tree = MergeTree()
+        tree._nodes = list(self._nodes)
+        tree._points = dict(self._points)
+        tree._order = list(self._order)
+        return tree
+
+    def _add_node(self, point, node):
+        if point not in self._points:
+            self._order.append(point)
+        self._nodes.append(node)
+        self._points[point] = len(self._nodes) - 1
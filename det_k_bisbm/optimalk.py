@@ -0,0 +1,82 @@
+import math
+
+from det_k_bisbm.optimalks import OptimalKs
+from det_k_bisbm.graph import UnipartiteGraph
+from det_k_bisbm.utils import get_m_e_rs_from_edges
+from det_k_bisbm.tracing import span
+
+
+class OptimalK(OptimalKs):
+    """OptimalKs for one-mode graphs, which searches a single number of groups, K.
+
+    A one-mode graph is handled as a bipartite graph whose nodes are all of type a, with kb = 0. Hence the points
+    are (k, 0), and the merging, the books (`confident_desc_len`, ...), the result store, the checkpoints and the
+    parallel neighborhood search are those of `OptimalKs`; only the affinity matrices are kept in full, since their
+    diagonal is not empty, and the description length is the one of PRL 110, 148701 (2013).
+
+    Parameters
+    ----------
+    engine : object, required
+        A partitioning engine that also partitions one-mode graphs (with `ONE_MODE = True`), e.g. `MCMCNumba`
+        or `KLNumba`.
+
+    edgelist : list or UnipartiteGraph, required
+        Edgelist (one-mode network) for model selection, or a prebuilt `UnipartiteGraph`.
+
+    n : int, optional
+        Number of nodes; defaults to the highest node index plus one.
+
+    init_k : int, optional
+        Initial K for successive merging and searching for the optimum.
+
+    i_th :  double, optional
+        Threshold for the merging step (as described in the main text).
+
+    logging_level : str, optional
+        Logging level used. It can be one of "warning" or "info".
+
+    """
+    _BOTTOM_POINT = (1, 0)
+
+    def __init__(self,
+                 engine,
+                 edgelist,
+                 n=None,
+                 init_k=10,
+                 i_th=0.1,
+                 logging_level="info"):
+        assert getattr(engine, "ONE_MODE", False), \
+            "[ERROR] the engine {} does not partition one-mode graphs".format(type(engine).__name__)
+        if not isinstance(edgelist, UnipartiteGraph):
+            edgelist = UnipartiteGraph(edgelist, n)
+        super(OptimalK, self).__init__(
+            engine, edgelist, init_ka=init_k, init_kb=0, i_th=i_th, logging_level=logging_level
+        )
+
+    def set_params(self, init_k=10, i_th=0.1):
+        super(OptimalK, self).set_params(init_ka=init_k, init_kb=0, i_th=i_th)
+
+    def _get_m_e_rs(self, mb, ka, kb):
+        with span("get_m_e_rs_from_edges"):
+            return get_m_e_rs_from_edges(self.edges, mb, n_blocks=ka, is_bipartite=False)[0]
+
+    def _cal_desc_len_diff(self, ka, kb, italic_i):
+        n = self.n
+        e = self.e
+        desc_len_b = (n * math.log(ka) - e * italic_i) / e
+        x = float(ka * (ka + 1)) / 2. / e
+        desc_len_b += (1 + x) * math.log(1 + x) - x * math.log(x)
+        desc_len_b -= (1. + 1. / e) * math.log(1. + 1. / e) - (1. / e) * math.log(1. / e)
+        return desc_len_b
+
+    @staticmethod
+    def _get_neighborhood(ka, kb, k_th):
+        return [(k, 0) for k in range(ka - k_th, ka + k_th + 1) if k >= 1 and k != ka]
+
+    def _check_if_random_bipartite(self):
+        # if we reached K = 1, check that it's the local optimal point, then we could return it.
+        for k in [1, 2]:
+            self.compute_and_update(k, 0, recompute=True)
+        if self.confident_desc_len.get_min_point() != (1, 0):
+            raise UserWarning("[WARNING] merging reached K = 1; cannot go any further, please set a smaller <i_th>.")
+        self._clean_up_and_record_mdl_point()
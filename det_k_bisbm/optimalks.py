@@ -1,26 +1,35 @@
-import os
 import math
 import random
 import logging
-import tempfile
+import threading
 import numpy as np
-from numba import jit
 
 from collections import OrderedDict
-from loky import get_reusable_executor
 from itertools import product
 
+from det_k_bisbm.utils import get_italic_i_from_m_e_rs, get_italic_i_from_m_e_rs_batch
+from det_k_bisbm.utils import get_merge_candidates, merge_m_e_rs, merge_block, new_rng_state
+from det_k_bisbm.utils import get_edges_from_edgelist, get_m_e_rs_from_edges
+from det_k_bisbm.graph import BipartiteGraph
+from det_k_bisbm.block_matrix import BlockMatrix
+from det_k_bisbm.merge_tree import MergeTree
+from det_k_bisbm.landscape import Landscape
+from det_k_bisbm.cache import graph_input_cache, ResultStore
+from det_k_bisbm.scheduler import get_scheduler
+from det_k_bisbm.ioutils import save_checkpoint, load_checkpoint
+from det_k_bisbm.tracing import span, traced
+
 
 class OptimalKs(object):
     """Base class for OptimalKs.
 
     Parameters
     ----------
-    edgelist : list, required
-        Edgelist (bipartite network) for model selection.
+    edgelist : list or BipartiteGraph, required
+        Edgelist (bipartite network) for model selection, or a prebuilt `BipartiteGraph`.
 
-    types : list, required
-        Types of each node specifying the type membership.
+    types : list, optional
+        Types of each node specifying the type membership; required unless `edgelist` is a `BipartiteGraph`.
 
     init_ka : int, required
         Initial Ka for successive merging and searching for the optimum.
@@ -35,20 +44,27 @@ class OptimalKs(object):
         Logging level used. It can be one of "warning" or "info".
 
     """
+    # the merging stops at this point
+    _BOTTOM_POINT = (1, 1)
 
     def __init__(self,
                  engine,
                  edgelist,
-                 types,
+                 types=None,
                  init_ka=10,
                  init_kb=10,
                  i_th=0.1,
                  logging_level="info"):
 
         self.engine_ = engine.engine  # TODO: check that engine is an object
+        self._engine = engine
         self.max_n_sweeps_ = engine.MAX_NUM_SWEEPS
         self.is_par_ = engine.PARALLELIZATION
         self.n_cores_ = engine.NUM_CORES
+        # in-process engines work on the BipartiteGraph directly, and need no edgelist file
+        self.is_engine_in_process_ = bool(getattr(engine, "IN_PROCESS", False))
+        self._engine_key = ResultStore.get_engine_key(engine)
+        self._result_store = None
 
         # params for the heuristic
         self.ka = int(init_ka)
@@ -56,42 +72,36 @@ class OptimalKs(object):
         self.i_0 = float(i_th)
         self.adaptive_ratio = 0.9  # adaptive parameter to make the "delta" smaller, if it's too large
 
-        # TODO: "types" is only used to compute na and nb. Can be made more generic.
-        self.types = types
-        self.n_a = 0
-        self.n_b = 0
-        for _type in types:
-            if _type in ["1", 1]:
-                self.n_a += 1
-            elif _type in ["2", 2]:
-                self.n_b += 1
-
-        assert self.n_a > 0, "[ERROR] Number of type-a nodes = 0, which is not allowed"
-        assert self.n_b > 0, "[ERROR] Number of type-b nodes = 0, which is not allowed"
-        self.n = len(types)
-
-        self.edgelist = edgelist
-        self.e = len(self.edgelist)
-
-        assert self.n == self.n_a + self.n_b, \
-            "[ERROR] num_nodes ({}) does not equal to num_nodes_a ({}) plus num_nodes_b ({})".format(
-                self.n, self.n_a, self.n_b
-            )
+        # the graph is stored once, as compact int32 arrays, and shared read-only
+        if isinstance(edgelist, BipartiteGraph):
+            self.graph = edgelist
+        else:
+            assert types is not None, "[ERROR] <types> is required unless a BipartiteGraph is passed"
+            self.graph = BipartiteGraph(edgelist, types)
+        self.types = self.graph.types
+        self.n_a = self.graph.n_a
+        self.n_b = self.graph.n_b
+        self.n = self.graph.n
+
+        self.edgelist = self.graph.edges
+        self.e = self.graph.e
+        # used to build m_e_rs after every engine run
+        self.edges = self.graph.edges
 
         # These confident_* variable are used to store the "true" data
         # that is, not the sloppy temporarily results via matrix merging
-        self.confident_desc_len = OrderedDict()
+        self.confident_desc_len = Landscape()
         self.confident_m_e_rs = OrderedDict()
-        self.confident_italic_i = OrderedDict()
+        self.confident_italic_i = Landscape()
 
         # These trace_* variable are used to store the data that we temporarily go through
-        self.trace_mb = OrderedDict()
+        self.trace_mb = MergeTree()
 
         # for debug/temp variables
-        self.is_tempfile_existed = True
-        self.f_edgelist = tempfile.NamedTemporaryFile(mode='w', delete=False)
-        # To prevent "TypeError: cannot serialize '_io.TextIOWrapper' object" when using loky
-        self._f_edgelist_name = self._get_tempfile_edgelist()
+        # the engine input is written once per graph and shared with other instances
+        self.is_tempfile_existed = False
+        self._f_edgelist_name = None
+        self._acquire_engine_input()
 
         # initialize other class attributes
         self.init_italic_i = 0.
@@ -102,8 +112,17 @@ class OptimalKs(object):
         self.set_logging_level(logging_level)
 
         # hard-coded parameters
-        self._size_rows_to_run = 1
+        self._n_merge_candidates = 1
+        self.merge_candidates = []  # the best merges (diff_italic_i, merge_list) found at the latest merging step
         self._k_th_nb_to_search = 1
+        self._is_racing = True
+        self._f_checkpoint = None
+        self._checkpoint_every = 1
+        self._n_checkpointed_points = 0
+        self._checkpoint_writer = None
+        # the neighborhood search in progress, as (ka, kb, old_desc_len, k_th), and its batch results so far
+        self._neighborhood = None
+        self._batch_results = OrderedDict()
         pass
 
     def set_logging_level(self, level):
@@ -131,6 +150,28 @@ class OptimalKs(object):
     def set_k_th_neighbor_to_search(self, k):
         self._k_th_nb_to_search = int(k)
 
+    def set_n_merge_candidates(self, n):
+        """
+            Number of best merges to keep in <merge_candidates> at each merging step (the best one is applied).
+        """
+        self._n_merge_candidates = max(int(n), 1)
+
+    def set_racing(self, is_racing):
+        """
+            In parallel mode, whether the sweeps that are compared to an old description length race each other,
+            i.e. the remaining sweeps of a point are cancelled (and their engine processes terminated) as soon as
+            one of them beats it. If False, the sweeps after the first one that beats it are cancelled, and the
+            result is the one of the serial sweeps, which is deterministic for deterministic engines.
+        """
+        self._is_racing = bool(is_racing)
+
+    def set_result_store(self, result_store):
+        """
+            Use <result_store> (a `ResultStore`, or None) to look up the points computed in earlier runs, before
+            launching the engine, and to save the points computed in this run.
+        """
+        self._result_store = result_store
+
     def set_exist_bookkeeping(self, exist_bookkeeping):
         """
             Experimental use only.
@@ -141,11 +182,67 @@ class OptimalKs(object):
         if not exist_bookkeeping:
             self._logger.warning("Setting <exist_bookkeeping> to false makes bad performance.")
 
-    def iterator(self):
-        if not self.is_tempfile_existed:
-            self._f_edgelist_name = self._get_tempfile_edgelist()
+    def set_checkpoint(self, f_checkpoint, every=1):
+        """
+            Checkpoint the state of `iterator` to <f_checkpoint> each time <every> new points have been computed.
+            This includes the points of a neighborhood search in progress, whose batch results are saved as they
+            come, before they are merged into the books. The checkpoints are written in the background; see `resume`.
+        """
+        self._f_checkpoint = f_checkpoint
+        self._checkpoint_every = max(int(every), 1)
 
-        while self.ka != 1 or self.kb != 1:
+    def resume(self, f_checkpoint):
+        """
+            Restore the state saved at <f_checkpoint> by an interrupted `iterator`, and continue from there.
+            The OptimalKs instance should be built with the same graph and engine as the interrupted one. The random
+            state of the engine is restored as well, if the engine has `get_state` and `set_state` methods.
+        """
+        state = load_checkpoint(f_checkpoint)
+        assert state["graph"] == self.graph.content_hash, \
+            "[ERROR] the checkpoint {} was written for another graph".format(f_checkpoint)
+        self.ka = state["ka"]
+        self.kb = state["kb"]
+        self.m_e_rs = state["m_e_rs"]
+        self.init_italic_i = state["init_italic_i"]
+        self.i_0 = state["i_0"]
+        self.adaptive_ratio = state["adaptive_ratio"]
+        self._k_th_nb_to_search = state["k_th_nb_to_search"]
+        self._n_merge_candidates = state["n_merge_candidates"]
+        self.confident_desc_len = state["confident_desc_len"]
+        self.confident_m_e_rs = state["confident_m_e_rs"]
+        self.confident_italic_i = state["confident_italic_i"]
+        self.trace_mb = state["trace_mb"]
+        self._neighborhood = state.get("neighborhood")
+        self._batch_results = state.get("batch_results", OrderedDict())
+        random.setstate(state["random_state"])
+        np.random.set_state(state["np_random_state"])
+        # engines may keep a random state of their own, which they expose via get_state and set_state
+        if state["engine_random_state"] is not None and hasattr(self._engine, "set_state"):
+            self._engine.set_state(state["engine_random_state"])
+
+        if self._f_checkpoint is None:
+            self.set_checkpoint(f_checkpoint)
+        self._n_checkpointed_points = self._get_n_computed_points()
+        return self.iterator()
+
+    @traced("OptimalKs.iterator")
+    def iterator(self):
+        self._acquire_engine_input()
+        try:
+            return self._iterate()
+        finally:
+            self._wait_for_checkpoint()
+            self._release_engine_input()
+
+    def _iterate(self):
+        if self._neighborhood is not None:
+            # the checkpoint was taken during a neighborhood search, which is finished first
+            if self._check_if_local_minimum(*self._neighborhood):
+                self._clean_up_and_record_mdl_point()
+                return self.confident_desc_len
+            self._checkpoint_if_needed()
+
+        while (self.ka, self.kb) != self._BOTTOM_POINT:
             ka_, kb_, m_e_rs_, diff_italic_i, mlist = self._moving_one_step_down(self.ka, self.kb)
             if abs(diff_italic_i) > self.i_0 * self.init_italic_i:
                 self._update_current_state(ka_, kb_, m_e_rs_)
@@ -161,84 +258,112 @@ class OptimalKs(object):
                     return self.confident_desc_len
             else:
                 self._update_transient_state(ka_, kb_, m_e_rs_, mlist)
+            self._checkpoint_if_needed()
 
         self._check_if_random_bipartite()
         return self.confident_desc_len
 
+    def _checkpoint_if_needed(self):
+        if self._f_checkpoint is None:
+            return
+        if self._get_n_computed_points() < self._n_checkpointed_points + self._checkpoint_every:
+            return
+        self._n_checkpointed_points = self._get_n_computed_points()
+        get_engine_state = getattr(self._engine, "get_state", None)
+        # the books only get new entries, hence shallow copies are enough to snapshot them
+        state = {
+            "graph": self.graph.content_hash,
+            "ka": self.ka,
+            "kb": self.kb,
+            "m_e_rs": self.m_e_rs,
+            "init_italic_i": self.init_italic_i,
+            "i_0": self.i_0,
+            "adaptive_ratio": self.adaptive_ratio,
+            "k_th_nb_to_search": self._k_th_nb_to_search,
+            "n_merge_candidates": self._n_merge_candidates,
+            "confident_desc_len": self.confident_desc_len.copy(),
+            "confident_m_e_rs": OrderedDict(self.confident_m_e_rs),
+            "confident_italic_i": self.confident_italic_i.copy(),
+            "trace_mb": self.trace_mb.copy(),
+            "neighborhood": self._neighborhood,
+            "batch_results": OrderedDict(self._batch_results),
+            "random_state": random.getstate(),
+            "np_random_state": np.random.get_state(),
+            "engine_random_state": get_engine_state() if get_engine_state is not None else None
+        }
+        # serialize and write in the background, one checkpoint at a time
+        self._wait_for_checkpoint()
+        self._checkpoint_writer = threading.Thread(target=save_checkpoint, args=(self._f_checkpoint, state))
+        self._checkpoint_writer.start()
+
+    def _get_n_computed_points(self):
+        return len(self.confident_desc_len) + len(self._batch_results)
+
+    def _wait_for_checkpoint(self):
+        if self._checkpoint_writer is not None:
+            self._checkpoint_writer.join()
+            self._checkpoint_writer = None
+
     def clean(self):
-        self.confident_desc_len = OrderedDict()
+        self.confident_desc_len = Landscape()
         self.confident_m_e_rs = OrderedDict()
-        self.confident_italic_i = OrderedDict()
-        self.trace_mb = OrderedDict()
-        self.set_params(init_ka=10, init_kb=10, i_th=0.1)
+        self.confident_italic_i = Landscape()
+        self.trace_mb = MergeTree()
+        self._neighborhood = None
+        self._batch_results = OrderedDict()
+        self.set_params()
 
     def compute_and_update(self, ka, kb, recompute=False):
+        # the engine input is released afterwards only if this call acquired it, i.e. not within `iterator`
+        is_acquired_here = not self.is_tempfile_existed
+        self._acquire_engine_input()
         try:
-            os.remove(self._f_edgelist_name)
-        except FileNotFoundError as e:
-            self._logger.warning("FileNotFoundError: {}".format(e))
-        finally:
-            self._f_edgelist_name = self._get_tempfile_edgelist()
             if recompute:
                 self.confident_desc_len[(ka, kb)] = 0
             self._calc_and_update((ka, kb))
+        finally:
+            if is_acquired_here:
+                self._release_engine_input()
 
     @staticmethod
     def executor(max_workers, timeout, func, feeds):
+        """
+            Map <func> over <feeds> on the global scheduler, whose core budget is grown to <max_workers>.
+            The <timeout> is kept for compatibility only, since the workers of the scheduler are long-lived.
+        """
         assert type(feeds) is list, "[ERROR] feeds should be a Python list; here it is {}".format(str(type(feeds)))
-        executor = get_reusable_executor(max_workers=int(max_workers), timeout=int(timeout))
-        results = executor.map(func, feeds)
-        return results
+        return get_scheduler(max_workers).map(func, feeds)
 
     @staticmethod
     def get_italic_i_from_m_e_rs(m_e_rs):
-        assert type(m_e_rs) is np.ndarray, "[ERROR] input parameter (m_e_rs) should be of type numpy.ndarray"
-        italic_i = 0.
-        m_e_r = np.sum(m_e_rs, axis=1)
-        num_edges = m_e_r.sum() / 2.
-        for ind, e_val in enumerate(np.nditer(m_e_rs)):
-            ind_i = int(math.floor(ind / (m_e_rs.shape[0])))
-            ind_j = ind % (m_e_rs.shape[0])
-            if e_val != 0.0:
-                italic_i += e_val / 2. / num_edges * math.log(
-                    e_val / m_e_r[ind_i] / m_e_r[ind_j] * 2 * num_edges
-                )
-        return italic_i
+        return get_italic_i_from_m_e_rs(m_e_rs)
+
+    @staticmethod
+    def get_italic_i_from_m_e_rs_batch(m_e_rs_stack):
+        return get_italic_i_from_m_e_rs_batch(m_e_rs_stack)
 
     @staticmethod
     def get_m_e_rs_from_mb(edgelist, mb):
-        assert type(edgelist) is list, \
-            "[ERROR] the type of the first input should be a list; however, it is {}".format(str(type(edgelist)))
-        assert type(mb) is list, \
-            "[ERROR] the type of the second input should be a list; however, it is {}".format(str(type(mb)))
-        # construct e_rs matrix
-        m_e_rs = np.zeros((max(mb) + 1, max(mb) + 1))
-        for i in edgelist:
-            # Please do check the index convention of the edgelist
-            source_group = int(mb[int(i[0])])
-            target_group = int(mb[int(i[1])])
-            if source_group == target_group:
-                raise ImportError("[ERROR] This is not a bipartite network!")
-            m_e_rs[source_group][target_group] += 1
-            m_e_rs[target_group][source_group] += 1
-
-        m_e_r = np.sum(m_e_rs, axis=1)
-        return m_e_rs, m_e_r
+        # construct e_rs matrix; the edgelist is parsed on the fly if it is not yet an int32 edge array
+        return get_m_e_rs_from_edges(get_edges_from_edgelist(edgelist), mb)
 
     @staticmethod
-    @jit
-    def merge_matrix(ka, kb, m_e_rs):
+    def merge_matrix(ka, kb, m_e_rs, rng_state=None):
         """
         Merge random two rows of the affinity matrix (dim = K) to gain a reduced matrix (dim = K - 1)
 
+        This builds the full matrix around `merge_block`, which does the work on the ka x kb block only.
+
         Parameters
         ----------
         ka : int
             number of type-a communities in the affinity matrix
         kb : int
             number of type-b communities in the affinity matrix
-        m_e_rs : numpy array
+        m_e_rs : numpy array or BlockMatrix
             the affinity matrix
+        rng_state : numpy array, optional
+            the state of the random number generator (see `new_rng_state`); defaults to one seeded from numpy.random
 
         Returns
         -------
@@ -248,100 +373,30 @@ class OptimalKs(object):
         new_kb : int
             the new number of type-b communities in the affinity matrix
 
-        c : numpy array
-            the new affinity matrix
+        c : numpy array or BlockMatrix
+            the new affinity matrix, of the same type as <m_e_rs>
 
         merge_list : list(int, int)
             the two row-indexes of the original affinity matrix that were merged
 
         """
+        if rng_state is None:
+            rng_state = new_rng_state(np.random.randint(2 ** 31 - 1))
+        if isinstance(m_e_rs, BlockMatrix):
+            out = np.zeros((ka, kb), dtype=np.int64)
+            merge_list = list(merge_block(ka, kb, m_e_rs.block, out, rng_state))
+            new_ka, new_kb = (ka - 1, kb) if merge_list[1] < ka else (ka, kb - 1)
+            return new_ka, new_kb, BlockMatrix(out[:new_ka, :new_kb]), merge_list
+
         assert type(m_e_rs) is np.ndarray, "[ERROR] input parameter (m_e_rs) should be of type numpy.ndarray"
-        assert np.all(m_e_rs.transpose() == m_e_rs), "[ERROR] input m_e_rs matrix is not symmetric!"
-
-        from_row = random.sample([0] * ka + [ka] * kb, 1)[0]
-        a = m_e_rs[0:ka, ka:ka + kb]
-
-        merge_list = list([0, 0])  # which two mb label should be merged together?
-        mb_map = OrderedDict()
-        new_ka = 0
-        new_kb = 0
-
-        if ka == 1:
-            # do not merge type-a rows (this happens when <i_th> is set too high)
-            from_row = ka
-        elif kb == 1:
-            from_row = 0
-
-        b = np.zeros([ka, kb])
-        if from_row == 0:
-            perm = np.arange(a.shape[0])
-            np.random.shuffle(perm)
-            for _ind in np.arange(a.shape[0]):
-                mb_map[_ind] = perm[_ind]
-            a = a[perm]
-
-            new_ka = ka - 1
-            new_kb = kb
-            b = np.zeros([new_ka, new_kb])
-            for ind_i, _a in enumerate(a):
-                for ind_j, __a in enumerate(_a):
-                    if ind_i < from_row:
-                        b[ind_i][ind_j] = __a
-                    elif ind_i > from_row + 1:
-                        b[ind_i - 1][ind_j] = __a
-                    elif ind_i == from_row:
-                        b[ind_i][ind_j] += __a
-                    elif ind_i == from_row + 1:
-                        b[ind_i - 1][ind_j] += __a
-
-            merge_list[0] = mb_map[from_row]
-            merge_list[1] = mb_map[from_row + 1]
-
-        elif from_row == ka:
-            perm = np.arange(a.shape[1])
-            np.random.shuffle(perm)
-            for _ind in np.arange(a.shape[1]):
-                mb_map[_ind] = perm[_ind]
-
-            new_ka = ka
-            new_kb = kb - 1
-            a = a.transpose()
-
-            a = a[perm]
-
-            b = np.zeros([new_kb, new_ka])
-            for ind_i, _a in enumerate(a):
-                for ind_j, __a in enumerate(_a):
-                    if ind_i < from_row - new_ka:
-                        b[ind_i][ind_j] = __a
-                    elif ind_i > from_row + 1 - new_ka:
-                        b[ind_i - 1][ind_j] = __a
-                    elif ind_i == from_row - new_ka:
-                        b[ind_i][ind_j] += __a
-                    elif ind_i == from_row + 1 - new_ka:
-                        b[ind_i - 1][ind_j] += __a
-            merge_list[0] = mb_map[from_row - ka] + ka
-            merge_list[1] = mb_map[from_row + 1 - ka] + ka
-
-        c = np.zeros([new_ka + new_kb, new_ka + new_kb])
-        bt = b.transpose()
-        if not from_row == 0:
-            b = bt
-            bt = b.transpose()
-        for ind_i, _c in enumerate(c):
-            for ind_j, __c in enumerate(_c):
-                if ind_i >= new_ka and ind_j < new_ka:
-                    c[ind_i][ind_j] = bt[ind_i - new_ka][ind_j]
-                elif ind_i < new_ka and ind_j >= new_ka:
-                    c[ind_i][ind_j] = b[ind_i][ind_j - new_ka]
-
-        assert new_ka + new_kb == c.shape[0], "new_ka = {}; new_kb = {}; new_mat.shape[0] = {}".format(
-            new_ka, new_kb, c.shape[0]
-        )
-        assert new_ka + new_kb == c.shape[1], "new_ka = {}; new_kb = {}; new_mat.shape[1] = {}".format(
-            new_ka, new_kb, c.shape[1]
-        )
-        assert np.all(c.transpose() == c), "Error: output m_e_rs matrix is not symmetric!"
+        block = m_e_rs[0:ka, ka:ka + kb]
+        out = np.zeros((ka, kb), dtype=block.dtype)
+        merge_list = list(merge_block(ka, kb, block, out, rng_state))
+        new_ka, new_kb = (ka - 1, kb) if merge_list[1] < ka else (ka, kb - 1)
+
+        c = np.zeros((new_ka + new_kb, new_ka + new_kb), dtype=block.dtype)
+        c[:new_ka, new_ka:] = out[:new_ka, :new_kb]
+        c[new_ka:, :new_ka] = out[:new_ka, :new_kb].T
         return new_ka, new_kb, c, merge_list
 
     def _cal_desc_len_diff(self, ka, kb, italic_i):
@@ -355,7 +410,8 @@ class OptimalKs(object):
         desc_len_b -= (1. + 1. / e) * math.log(1. + 1. / e) - (1. / e) * math.log(1. / e)
         return desc_len_b
 
-    def _calc_with_hook(self, ka, kb, old_desc_len=None):
+    @traced("OptimalKs._calc_with_hook")
+    def _calc_with_hook(self, ka, kb, old_desc_len=None, is_par=None):
         """
         Execute the partitioning code by spawning child processes in the shell; save its output afterwards.
 
@@ -366,6 +422,12 @@ class OptimalKs(object):
         kb : int
             Number of type-b communities that one wants to partition on the bipartite graph
 
+        old_desc_len : float, optional
+            If passed, stop sweeping as soon as a result has a lower description length (in serial mode)
+
+        is_par : bool, optional
+            Whether to run the sweeps in parallel; defaults to the setting of the engine
+
         Returns
         -------
         italic_i : float
@@ -392,21 +454,20 @@ class OptimalKs(object):
                 self._logger.info("... fetch calculated data ...")
                 return italic_i, m_e_rs, mb
 
-        def run(ka, kb):
-            mb = self.engine_(self._f_edgelist_name, self.n_a, self.n_b, ka, kb)
-            m_e_rs, _ = self.get_m_e_rs_from_mb(self.edgelist, mb)
-            italic_i = self.get_italic_i_from_m_e_rs(m_e_rs)
-            new_desc_len = self._cal_desc_len_diff(ka, kb, italic_i)
+        stored = self._fetch_stored_result(ka, kb)
+        if stored is not None:
+            return stored
 
-            return m_e_rs, italic_i, new_desc_len, mb
+        if is_par is None:
+            is_par = self.is_par_
+        run = self._run_engine
 
         # Calculate the biSBM inference several times,
         # choose the maximum likelihood result.
         # In other words, we choose the state with minimum entropy.
         results = []
         if old_desc_len is None:
-            if self.is_par_:
-                # automatically shutdown after idling for 2s
+            if is_par:
                 results = list(
                     self.executor(self.n_cores_, 2, lambda x: run(ka, kb), list(range(self.max_n_sweeps_)))
                 )
@@ -414,7 +475,7 @@ class OptimalKs(object):
                 results = [run(ka, kb)]
         else:
             old_desc_len = float(old_desc_len)
-            if not self.is_par_:
+            if not is_par:
                 # if old_desc_len is passed
                 # we compare the new_desc_len with the old one
                 # --
@@ -430,6 +491,12 @@ class OptimalKs(object):
                         calculate_times = self.max_n_sweeps_
                     else:
                         calculate_times += 1
+            elif self._is_racing:
+                # the sweeps race each other; the others are cancelled as soon as one beats old_desc_len
+                scheduler = get_scheduler(self.n_cores_)
+                futures = [scheduler.submit(run, ka, kb) for _ in range(self.max_n_sweeps_)]
+                scheduler.race(futures, lambda result: result[2] < old_desc_len)
+                results = [result for result in scheduler.results(futures) if result is not None]
             else:
                 results = list(
                     self.executor(self.n_cores_, 2, lambda x: run(ka, kb), list(range(self.max_n_sweeps_)))
@@ -439,12 +506,93 @@ class OptimalKs(object):
         mb = result[3]
         italic_i = result[1]
         m_e_rs = result[0]
+        self._save_result(ka, kb, result)
 
         return italic_i, m_e_rs, mb
 
+    def _run_engine(self, ka, kb):
+        engine_input = self.graph if self.is_engine_in_process_ else self._f_edgelist_name
+        with span("engine", ka=ka, kb=kb):
+            mb = self.engine_(engine_input, self.n_a, self.n_b, ka, kb)
+        m_e_rs = self._get_m_e_rs(mb, ka, kb)
+        italic_i = self.get_italic_i_from_m_e_rs(m_e_rs)
+        new_desc_len = self._cal_desc_len_diff(ka, kb, italic_i)
+
+        return m_e_rs, italic_i, new_desc_len, mb
+
+    def _get_m_e_rs(self, mb, ka, kb):
+        with span("BlockMatrix.from_edges"):
+            return BlockMatrix.from_edges(self.edges, mb, ka, kb)
+
+    @traced("OptimalKs._calc_in_batch")
+    def _calc_in_batch(self, points, old_desc_len):
+        """
+            Compute several points at once, where every (point, sweep) is a task of the scheduler.
+
+            In racing mode, the sweeps of a point are cancelled as soon as one of them beats <old_desc_len>, and
+            the point keeps the best of its finished sweeps. Otherwise, for each point, only the sweeps up to the
+            first one that beats <old_desc_len> are considered, which is the result that the serial sweeps of
+            `_calc_with_hook` would give; the later ones are cancelled.
+        """
+        # the results are kept on the instance as they come, so that they are checkpointed with the books
+        batch_results = self._batch_results
+        points = [point for point in points if self.confident_desc_len.get(point, 0) == 0]
+        for point in points:
+            if point in batch_results:
+                continue
+            stored = self._fetch_stored_result(point[0], point[1])
+            if stored is not None:
+                batch_results[point] = stored
+        points = [point for point in points if point not in batch_results]
+        if len(points) == 0:
+            return batch_results
+        self._logger.info("Now computing graph partitions at {} in parallel ...".format(points))
+        old_desc_len = float(old_desc_len)
+        scheduler = get_scheduler(self.n_cores_)
+        futures = OrderedDict()
+        for point in points:
+            futures[point] = [
+                scheduler.submit(self._run_engine, point[0], point[1]) for _ in range(self.max_n_sweeps_)
+            ]
+            if self._is_racing:
+                scheduler.race(futures[point], lambda result: result[2] < old_desc_len)
+        for point in points:
+            if self._is_racing:
+                sweeps = [result for result in scheduler.results(futures[point]) if result is not None]
+            else:
+                sweeps = []
+                for future in futures[point]:
+                    sweeps.append(scheduler.result(future))
+                    if sweeps[-1][2] < old_desc_len:
+                        break
+                # the later sweeps are not needed; they are cancelled, and waited for so that none outlives the batch
+                for future in futures[point][len(sweeps):]:
+                    future.request_cancel()
+                scheduler.results(futures[point][len(sweeps):])
+            result = min(sweeps, key=lambda x: x[2])
+            self._save_result(point[0], point[1], result)
+            batch_results[point] = result[1], result[0], result[3]
+            self._checkpoint_if_needed()
+        return batch_results
+
+    def _fetch_stored_result(self, ka, kb):
+        if self._result_store is None:
+            return None
+        stored = self._result_store.get(self.graph, self._engine_key, ka, kb)
+        if stored is None:
+            return None
+        self._logger.info("... fetch stored data at ({}, {}) ...".format(ka, kb))
+        return stored[:3]
+
+    def _save_result(self, ka, kb, result):
+        # <result> is (m_e_rs, italic_i, desc_len, mb), as returned by _run_engine
+        if self._result_store is not None:
+            self._result_store.put(self.graph, self._engine_key, ka, kb, result[1], result[0], result[3], result[2])
+
+    @traced("OptimalKs._moving_one_step_down")
     def _moving_one_step_down(self, ka, kb):
         """
-        Apply multiple merges of the original affinity matrix, return the one that least alters the entropy
+        Evaluate all merges of the original affinity matrix, return the one that least alters the entropy
 
         Parameters
         ----------
@@ -478,24 +626,14 @@ class OptimalKs(object):
             self.init_italic_i = italic_i
             self.m_e_rs = m_e_rs
 
-        def _sample_and_merge():
-            _ka, _kb, _m_e_rs, _mlist = self.merge_matrix(self.ka, self.kb, self.m_e_rs)
-            _italic_I = self.get_italic_i_from_m_e_rs(_m_e_rs)
-            diff_italic_i = _italic_I - self.init_italic_i  # diff_italic_i is always negative;
-            return _ka, _kb, _m_e_rs, diff_italic_i, _mlist
-
-        # how many times that a sample merging takes place
-        indexes_to_run_ = range(0, (ka + kb) * self._size_rows_to_run)
+        # score every possible merge in closed form, and apply the one that least decreases italic I
+        self.merge_candidates = get_merge_candidates(self.ka, self.kb, self.m_e_rs, top_n=self._n_merge_candidates)
+        _, _mlist = self.merge_candidates[0]
+        _ka, _kb, _m_e_rs = merge_m_e_rs(self.ka, self.kb, self.m_e_rs, _mlist)
+        _diff_italic_i = self.get_italic_i_from_m_e_rs(_m_e_rs) - self.init_italic_i  # diff_italic_i is always negative;
 
-        results = []
-        for _ in indexes_to_run_:
-            results.append(_sample_and_merge())
-
-        _ka, _kb, _m_e_rs, _diff_italic_i, _mlist = max(results, key=lambda x: x[3])
-
-        assert int(_m_e_rs.sum()) == int(self.e * 2), "__m_e_rs.sum() = {}; self.e * 2 = {}".format(
-            str(int(_m_e_rs.sum())), str(self.e * 2)
-        )
+        _e = _m_e_rs.e if isinstance(_m_e_rs, BlockMatrix) else int(_m_e_rs.sum()) // 2
+        assert _e == self.e, "_m_e_rs.e = {}; self.e = {}".format(str(_e), str(self.e))
 
         return _ka, _kb, _m_e_rs, _diff_italic_i, _mlist
 
@@ -504,7 +642,7 @@ class OptimalKs(object):
         points_to_compute = [(1, 1), (1, 2), (2, 1), (2, 2)]
         for point in points_to_compute:
             self.compute_and_update(point[0], point[1], recompute=True)
-        p_estimate = sorted(self.confident_desc_len, key=self.confident_desc_len.get)[0]
+        p_estimate = self.confident_desc_len.get_min_point()
 
         if p_estimate != (1, 1):
             # TODO: write some documentation here
@@ -512,66 +650,63 @@ class OptimalKs(object):
         self._clean_up_and_record_mdl_point()
 
     def _update_transient_state(self, ka_moving, kb_moving, t_m_e_rs, mlist):
-        old_of_g = self.trace_mb[(self.ka, self.kb)]
-        new_of_g = list(np.zeros(self.n))
-
-        mlist.sort()
-        for _node_id, _g in enumerate(old_of_g):
-            if _g == mlist[1]:
-                new_of_g[_node_id] = mlist[0]
-            elif _g < mlist[1]:
-                new_of_g[_node_id] = _g
-            else:
-                new_of_g[_node_id] = _g - 1
-        assert max(new_of_g) + 1 == ka_moving + kb_moving, \
-            "[ERROR] inconsistency between the membership indexes and the number of blocks."
-        self.trace_mb[(ka_moving, kb_moving)] = new_of_g
+        # the membership vector of the transient point is only materialized when it is requested
+        self.trace_mb.add_merge((ka_moving, kb_moving), (self.ka, self.kb), mlist)
         self._update_current_state(ka_moving, kb_moving, t_m_e_rs)
 
+    @traced("OptimalKs._check_if_local_minimum")
     def _check_if_local_minimum(self, ka, kb, old_desc_len, k_th):
         '''
             The `neighborhood search` as described in the paper.
         '''
-        self.is_tempfile_existed = True
-        items = map(lambda x: (x[0] + ka, x[1] + kb), product(range(-k_th, k_th + 1), repeat=2))
-        # if any item has values less than 1, delete it. Also, exclude the suspected point.
-        items = [(i, j) for i, j in items if i >= 1 and j >= 1 and (i, j) != (ka, kb)]
+        self._acquire_engine_input()
+        items = self._get_neighborhood(ka, kb, k_th)
         ka_moving, kb_moving = 0, 0
+        self._neighborhood = ka, kb, old_desc_len, k_th
+
+        # in parallel mode, the whole neighborhood is dispatched as one batch; the results are then merged in the
+        # same order as the serial search, which stops at the first point that is lower than all others so far.
+        batch_results = self._batch_results
+        if self.is_par_ and len(items) > 1:
+            batch_results = self._calc_in_batch(items, old_desc_len)
 
         for item in items:
-            self._calc_and_update(item, old_desc_len)
+            self._calc_and_update(item, old_desc_len, result=batch_results.pop(item, None))
             if self._is_this_mdl(self.confident_desc_len[(item[0], item[1])]):
-                p_estimate = sorted(self.confident_desc_len, key=self.confident_desc_len.get)[0]
+                p_estimate = self.confident_desc_len.get_min_point()
                 self._logger.info("Found {} that gives an even lower description length ...".format(p_estimate))
                 ka_moving, kb_moving, _, _ = self._back_to_where_desc_len_is_lowest()
                 break
-        if ka_moving * kb_moving == 0:
+            self._checkpoint_if_needed()
+        self._neighborhood = None
+        self._batch_results = OrderedDict()
+        if (ka_moving, kb_moving) == (0, 0):
             return True
         else:
             return False
 
+    @staticmethod
+    def _get_neighborhood(ka, kb, k_th):
+        items = map(lambda x: (x[0] + ka, x[1] + kb), product(range(-k_th, k_th + 1), repeat=2))
+        # if any item has values less than 1, delete it. Also, exclude the suspected point.
+        return [(i, j) for i, j in items if i >= 1 and j >= 1 and (i, j) != (ka, kb)]
+
     def _clean_up_and_record_mdl_point(self):
-        try:
-            os.remove(self._f_edgelist_name)
-        except FileNotFoundError as e:
-            self._logger.warning("FileNotFoundError: {}".format(e))
-        finally:
-            self.is_tempfile_existed = False
-            p_estimate = sorted(self.confident_desc_len, key=self.confident_desc_len.get)[0]
-            self._logger.info("DONE: the MDL point is {}".format(p_estimate))
+        self._release_engine_input()
+        p_estimate = self.confident_desc_len.get_min_point()
+        self._logger.info("DONE: the MDL point is {}".format(p_estimate))
 
     def _is_this_mdl(self, desc_len):
         """
             Check if `desc_len` is the minimal value so far.
         """
         if self.exist_bookkeeping:
-            return not any([i < desc_len for i in self.confident_desc_len.values()])
+            return self.confident_desc_len.is_min(desc_len)
         else:
             return True
 
     def _back_to_where_desc_len_is_lowest(self):
-        ka = sorted(self.confident_desc_len, key=self.confident_desc_len.get, reverse=False)[0][0]
-        kb = sorted(self.confident_desc_len, key=self.confident_desc_len.get, reverse=False)[0][1]
+        ka, kb = self.confident_desc_len.get_min_point()
         m_e_rs = self.confident_m_e_rs[(ka, kb)]
         self._update_current_state(ka, kb, m_e_rs)
         return ka, kb, m_e_rs, self.confident_desc_len[(self.ka, self.kb)]
@@ -581,12 +716,15 @@ class OptimalKs(object):
         self.kb = kb
         self.m_e_rs = m_e_rs    # this will be used in _moving_one_step_down function
 
-    def _calc_and_update(self, point, old_desc_len=0.):
-        self._logger.info("Now computing graph partition at {} ...".format(point))
-        if old_desc_len == 0.:
-            italic_i, m_e_rs, mb = self._calc_with_hook(point[0], point[1], old_desc_len=None)
-        else:
-            italic_i, m_e_rs, mb = self._calc_with_hook(point[0], point[1], old_desc_len=old_desc_len)
+    def _calc_and_update(self, point, old_desc_len=0., result=None):
+        # <result> is passed when the point is already computed, e.g. by _calc_in_batch
+        if result is None:
+            self._logger.info("Now computing graph partition at {} ...".format(point))
+            if old_desc_len == 0.:
+                result = self._calc_with_hook(point[0], point[1], old_desc_len=None)
+            else:
+                result = self._calc_with_hook(point[0], point[1], old_desc_len=old_desc_len)
+        italic_i, m_e_rs, mb = result
         candidate_desc_len = self._cal_desc_len_diff(point[0], point[1], italic_i)
         self.confident_desc_len[point] = candidate_desc_len
         self.confident_italic_i[point] = italic_i
@@ -600,17 +738,12 @@ class OptimalKs(object):
 
         return candidate_desc_len, m_e_rs, italic_i
 
-    def _get_tempfile_edgelist(self):
-        try:
-            self.f_edgelist.seek(0)
-        except AttributeError:
-            self.f_edgelist = tempfile.NamedTemporaryFile(mode='w', delete=False)
-        finally:
-            for edge in self.edgelist:
-                self.f_edgelist.write(str(edge[0]) + "\t" + edge[1] + "\n")
-            self.f_edgelist.flush()
-            f_edgelist_name = self.f_edgelist.name
-            del self.f_edgelist
-        return f_edgelist_name
-
+    def _acquire_engine_input(self):
+        if not self.is_tempfile_existed and not self.is_engine_in_process_:
+            self._f_edgelist_name = graph_input_cache.acquire(self.graph)
+            self.is_tempfile_existed = True
 
+    def _release_engine_input(self):
+        if self.is_tempfile_existed:
+            graph_input_cache.release(self.graph)
+            self.is_tempfile_existed = False
@@ -0,0 +1,241 @@
+""" task scheduling under one global core budget """
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import Future, CancelledError, wait, FIRST_COMPLETED
+
+
+class Task(Future):
+    """A Future that can also be cancelled while running, by calling the kill callbacks registered by the task."""
+
+    def __init__(self):
+        super(Task, self).__init__()
+        self.is_cancel_requested = False
+        self._kill_callbacks = []
+        self._kill_lock = threading.Lock()
+
+    def request_cancel(self):
+        if self.cancel():
+            # it was still pending, and will never run
+            return
+        with self._kill_lock:
+            if self.done() or self.is_cancel_requested:
+                return
+            self.is_cancel_requested = True
+            callbacks = list(self._kill_callbacks)
+        for callback in callbacks:
+            callback()
+
+    def add_kill_callback(self, callback):
+        with self._kill_lock:
+            if not self.is_cancel_requested:
+                self._kill_callbacks.append(callback)
+                return
+        callback()
+
+
+_local = threading.local()
+
+
+def get_current_task():
+    """The Task run by this thread, or None outside of the scheduler."""
+    return getattr(_local, "task", None)
+
+
+def raise_if_cancelled():
+    task = get_current_task()
+    if task is not None and task.is_cancel_requested:
+        raise CancelledError()
+
+
+def popen(*args, **kwargs):
+    """Same as `subprocess.Popen`, but the process is terminated if the current task gets cancelled."""
+    p = subprocess.Popen(*args, **kwargs)
+    task = get_current_task()
+    if task is not None:
+        task.add_kill_callback(lambda: _terminate(p))
+    return p
+
+
+def _terminate(p):
+    try:
+        p.terminate()
+    except OSError:
+        pass
+
+
+class Scheduler(object):
+    """Run tasks on a long-lived pool of threads, under a global budget of cores.
+
+    Every (point, sweep) of `OptimalKs`, and every inner sweep of an engine, is a task of the same pool. The engines
+    do their heavy work outside of the GIL (in a subprocess, or in numba code compiled with `nogil=True`), hence
+    threads are enough to keep the cores busy, and tasks may submit other tasks: a thread that waits for its
+    subtasks runs pending tasks itself, instead of blocking a core. This avoids the "daemonic processes are not
+    allowed to have children" error of nested process pools.
+
+    The top-level tasks (see `submit_top_level`), e.g. the whole `iterator` of a graph in a batch, are only run by
+    the workers, or by a waiting thread that does not run a task itself. Hence a task never gets suspended under
+    another long run, and the stack of a thread stays as deep as the nesting of the tasks.
+
+    Parameters
+    ----------
+    n_cores : int, required
+        The core budget. The thread that waits for the results counts as one of them.
+
+    """
+
+    def __init__(self, n_cores):
+        self.n_cores = 1
+        self._tasks = deque()
+        self._top_level_tasks = deque()
+        self._lock = threading.Condition()
+        self._threads = []
+        self.set_n_cores(n_cores)
+
+    def set_n_cores(self, n_cores):
+        """Grow the core budget to <n_cores>; the budget is never reduced, since it is shared."""
+        with self._lock:
+            self.n_cores = max(self.n_cores, int(n_cores))
+            while len(self._threads) < self.n_cores - 1:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, func, *args):
+        return self._submit(self._tasks, func, args)
+
+    def submit_top_level(self, func, *args):
+        """Same as `submit`, for a task that is not a subtask of a running task, such as the run of a whole graph."""
+        return self._submit(self._top_level_tasks, func, args)
+
+    def _submit(self, tasks, func, args):
+        future = Task()
+        with self._lock:
+            tasks.append((future, func, args))
+            self._lock.notify()
+        return future
+
+    def map(self, func, feeds):
+        """Like the builtin `map`, but the calls are run in parallel; the results keep the order of <feeds>."""
+        futures = [self.submit(func, feed) for feed in feeds]
+        return [self.result(future) for future in futures]
+
+    def race(self, futures, is_winner):
+        """Cancel all <futures> as soon as one of them gives a result for which <is_winner> is True.
+
+        The pending tasks are dropped, and the running ones are asked to stop, which terminates the processes
+        they started via `popen`. Collect the results with `results`.
+        """
+        def on_done(done_future):
+            if done_future.cancelled() or done_future.exception() is not None:
+                return
+            if is_winner(done_future.result()):
+                for future in futures:
+                    if future is not done_future:
+                        future.request_cancel()
+
+        for future in futures:
+            future.add_done_callback(on_done)
+        return futures
+
+    def results(self, futures):
+        """Wait for all <futures>; the results of the cancelled ones are None."""
+        results = []
+        for future in futures:
+            try:
+                results.append(self.result(future))
+            except CancelledError:
+                results.append(None)
+        return results
+
+    def as_completed(self, futures):
+        """Yield <futures> as they finish, running pending tasks in the meantime."""
+        done = deque()
+        is_done = threading.Condition()
+
+        def on_done(future):
+            with is_done:
+                done.append(future)
+                is_done.notify()
+
+        for future in futures:
+            future.add_done_callback(on_done)
+        for _ in range(len(futures)):
+            while True:
+                with is_done:
+                    if len(done) > 0:
+                        break
+                task = self._pop()
+                if task is not None:
+                    self._run(task)
+                    continue
+                with is_done:
+                    while len(done) == 0:
+                        is_done.wait()
+            with is_done:
+                future = done.popleft()
+            yield future
+
+    def result(self, future):
+        """Wait for <future>, running pending tasks in the meantime, and return its result."""
+        while not future.done():
+            task = self._pop()
+            if task is None:
+                break
+            self._run(task)
+        return future.result()
+
+    def _pop(self):
+        # a task to run inline, in a waiting thread
+        with self._lock:
+            if len(self._tasks) > 0:
+                # the latest tasks first, which are the subtasks of the tasks running now
+                return self._tasks.pop()
+            if len(self._top_level_tasks) > 0 and get_current_task() is None:
+                return self._top_level_tasks.popleft()
+            return None
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while len(self._tasks) == 0 and len(self._top_level_tasks) == 0:
+                    self._lock.wait()
+                # the subtasks first, which let the tasks running now go on
+                if len(self._tasks) > 0:
+                    task = self._tasks.popleft()
+                else:
+                    task = self._top_level_tasks.popleft()
+            self._run(task)
+
+    @staticmethod
+    def _run(task):
+        future, func, args = task
+        if not future.set_running_or_notify_cancel():
+            return
+        # tasks may be run inline by a waiting thread, hence the task it was running is restored afterwards
+        parent_task = get_current_task()
+        _local.task = future
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            _local.task = parent_task
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(n_cores=1):
+    """The global scheduler, whose core budget is grown to at least <n_cores>."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(n_cores)
+        else:
+            _scheduler.set_n_cores(n_cores)
+    return _scheduler
@@ -0,0 +1,126 @@
+""" span timings of the heuristic, exportable as a Chrome trace """
+import os
+import json
+import time
+import threading
+import functools
+
+
+class Tracer(object):
+    """Record the spans (name, start, duration) of the instrumented code, from all threads.
+
+    A tracer records nothing until it is activated with `start_tracing`. The spans can be exported in the
+    Chrome trace format, which chrome://tracing and https://ui.perfetto.dev can display, and callbacks can be
+    added to handle the spans as they end, e.g. to aggregate them.
+
+    Attributes
+    ----------
+    spans : list
+        The (name, start, duration, thread id, args) tuples of the spans that ended, where the times are in seconds.
+
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._t_0 = time.perf_counter()
+
+    def add_callback(self, callback):
+        """Call <callback>(name, start, duration, args) each time a span ends."""
+        self._callbacks.append(callback)
+
+    def record(self, name, start, duration, args):
+        with self._lock:
+            self.spans.append((name, start - self._t_0, duration, threading.get_ident(), args))
+        for callback in self._callbacks:
+            callback(name, start - self._t_0, duration, args)
+
+    def get_total_durations(self):
+        """Total duration of the spans of each name, in seconds."""
+        totals = {}
+        for name, _, duration, _, _ in self.spans:
+            totals[name] = totals.get(name, 0.) + duration
+        return totals
+
+    def export_chrome_trace(self, path):
+        pid = os.getpid()
+        events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": duration * 1e6,
+                "pid": pid,
+                "tid": tid,
+                "args": {k: str(v) for k, v in args.items()}
+            }
+            for name, start, duration, tid, args in self.spans
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+class _Span(object):
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.start, time.perf_counter() - self.start, self.args)
+        return False
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+_tracer = None
+
+
+def start_tracing(tracer=None):
+    """Activate <tracer> (a new Tracer by default) for all threads, and return it."""
+    global _tracer
+    _tracer = Tracer() if tracer is None else tracer
+    return _tracer
+
+
+def stop_tracing():
+    """Deactivate the tracer, and return it."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def span(name, **args):
+    """Context manager that records a span of <name> if tracing is active; otherwise it does nothing."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(_tracer, name, args)
+
+
+def traced(name):
+    """Decorator that records each call of the function as a span of <name>."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _Span(_tracer, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
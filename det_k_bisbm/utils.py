@@ -1,6 +1,13 @@
 """ utilities """
 import numpy as np
 import math
+from collections import deque
+from itertools import islice
+from numba import njit
+
+from det_k_bisbm.graph import BipartiteGraph
+from det_k_bisbm.block_matrix import BlockMatrix, _x_log_x
+from det_k_bisbm.scheduler import get_scheduler
 
 
 def gen_equal_partition(n, total):
@@ -31,6 +38,266 @@ def get_n_r_from_mb(mb):
     return n_r
 
 
+def get_edges_from_edgelist(edgelist):
+    '''
+        Parse an edgelist (e.g. a Python list of string tuples) once into an int32 array of shape (n_edges, 2).
+    '''
+    if isinstance(edgelist, BipartiteGraph):
+        return edgelist.edges
+    if type(edgelist) is np.ndarray and edgelist.dtype == np.int32:
+        return edgelist
+    edges = np.asarray(edgelist)
+    if edges.size == 0:
+        return np.zeros((0, 2), dtype=np.int32)
+    assert edges.ndim == 2 and edges.shape[1] == 2, \
+        "[ERROR] the edgelist should hold 2-tuples of node indexes; here its shape is {}".format(edges.shape)
+    return edges.astype(np.int32)
+
+
+def get_m_e_rs_from_edges(edges, mb, n_blocks=None, is_bipartite=True):
+    '''
+        Build the affinity matrix from an int32 edge array and a membership array, in one bincount pass.
+
+        :param edges: int32 numpy array of shape (n_edges, 2), see <get_edges_from_edgelist>
+        :param mb: community membership of each node, as a numpy array or a Python list
+        :param n_blocks: number of blocks; defaults to max(mb) + 1
+        :param is_bipartite: if True, raise when an edge falls inside a block
+        :return: the affinity matrix, m_e_rs, and its row sums, m_e_r
+    '''
+    mb = np.asarray(mb, dtype=np.int64)
+    if n_blocks is None:
+        n_blocks = int(mb.max()) + 1
+    # Please do check the index convention of the edgelist
+    source_group = mb[edges[:, 0]]
+    target_group = mb[edges[:, 1]]
+    if is_bipartite and np.any(source_group == target_group):
+        raise ImportError("[ERROR] This is not a bipartite network!")
+    counts = np.bincount(
+        source_group * n_blocks + target_group, minlength=n_blocks * n_blocks
+    ).reshape(n_blocks, n_blocks)
+    m_e_rs = (counts + counts.T).astype(np.float64)
+    m_e_r = np.sum(m_e_rs, axis=1)
+    return m_e_rs, m_e_r
+
+
+def get_italic_i_from_m_e_rs_batch(m_e_rs_stack):
+    '''
+        Profile likelihood (italic I) of a stack of affinity matrices, computed in one vectorized pass.
+
+        :param m_e_rs_stack: numpy array of shape (n_matrices, K, K), or a list of (K, K) affinity matrices
+        :return: numpy array of shape (n_matrices,) with the italic I value of each matrix
+    '''
+    m_e_rs_stack = np.asarray(m_e_rs_stack, dtype=np.float64)
+    if m_e_rs_stack.ndim == 2:
+        m_e_rs_stack = m_e_rs_stack[np.newaxis]
+    assert m_e_rs_stack.ndim == 3, \
+        "[ERROR] input stack should be of shape (n_matrices, K, K); here it is {}".format(m_e_rs_stack.shape)
+
+    m_e_r = m_e_rs_stack.sum(axis=2)
+    two_num_edges = m_e_r.sum(axis=1)
+    nonzero = m_e_rs_stack > 0
+
+    # e_rs * 2E / (e_r * e_s), evaluated only where e_rs != 0
+    ratio = np.ones_like(m_e_rs_stack)
+    np.divide(
+        m_e_rs_stack * two_num_edges[:, np.newaxis, np.newaxis],
+        m_e_r[:, :, np.newaxis] * m_e_r[:, np.newaxis, :],
+        out=ratio,
+        where=nonzero
+    )
+    terms = m_e_rs_stack * np.log(ratio)
+    return terms.sum(axis=(1, 2)) / two_num_edges
+
+
+def get_italic_i_from_m_e_rs(m_e_rs):
+    '''
+        Profile likelihood (italic I) of a single affinity matrix, given in full or as a BlockMatrix.
+    '''
+    if isinstance(m_e_rs, BlockMatrix):
+        return m_e_rs.get_italic_i()
+    assert type(m_e_rs) is np.ndarray, "[ERROR] input parameter (m_e_rs) should be of type numpy.ndarray"
+    return float(get_italic_i_from_m_e_rs_batch(m_e_rs[np.newaxis])[0])
+
+
+def _score_row_merges(block, degrees):
+    # change of (sum_rs e_rs log e_rs - sum_r e_r log e_r) when merging each pair (r, s) of rows, r < s
+    ind_r, ind_s = np.triu_indices(block.shape[0], k=1)
+    row_terms = _x_log_x(block).sum(axis=1)
+    merged_terms = _x_log_x(block[ind_r] + block[ind_s]).sum(axis=1)
+    diff = merged_terms - row_terms[ind_r] - row_terms[ind_s]
+    diff -= _x_log_x(degrees[ind_r] + degrees[ind_s]) - _x_log_x(degrees[ind_r]) - _x_log_x(degrees[ind_s])
+    return diff, ind_r, ind_s
+
+
+def get_merge_candidates(ka, kb, m_e_rs, top_n=1):
+    '''
+        Score every merge of two type-a rows or two type-b columns of the affinity matrix, in closed form.
+
+        Since italic I = (sum_rs e_rs log e_rs - sum_r e_r log e_r - sum_s e_s log e_s) / E + log(2E),
+        merging two rows only changes their own terms, which costs O(K) per candidate pair.
+
+        :param ka: number of type-a communities in the affinity matrix
+        :param kb: number of type-b communities in the affinity matrix; 0 for a one-mode graph
+        :param m_e_rs: the (ka + kb) x (ka + kb) affinity matrix, or a BlockMatrix
+        :param top_n: number of best candidates to return
+        :return: list of (diff_italic_i, merge_list) tuples, sorted from the least to the most decrease of italic I;
+                 merge_list holds the two (sorted) row-indexes of the affinity matrix to be merged
+    '''
+    ka = int(ka)
+    kb = int(kb)
+    assert m_e_rs.shape[0] == ka + kb, "[ERROR] m_e_rs dimension (={}) is not equal to ka (={}) + kb (={})!".format(
+        m_e_rs.shape[0], ka, kb
+    )
+    if kb == 0:
+        return _get_merge_candidates_uni(np.asarray(m_e_rs, dtype=np.float64), top_n)
+    if not isinstance(m_e_rs, BlockMatrix):
+        m_e_rs = BlockMatrix.from_m_e_rs(m_e_rs, ka)
+    block = m_e_rs.block
+    num_edges = float(m_e_rs.e)
+
+    diffs = []
+    merge_lists = []
+    # do not merge type-a rows if ka == 1, or type-b columns if kb == 1
+    if ka > 1:
+        diff, ind_r, ind_s = _score_row_merges(block, m_e_rs.e_r)
+        diffs.append(diff)
+        merge_lists.append(np.stack([ind_r, ind_s], axis=1))
+    if kb > 1:
+        diff, ind_r, ind_s = _score_row_merges(block.T, m_e_rs.e_s)
+        diffs.append(diff)
+        merge_lists.append(np.stack([ind_r, ind_s], axis=1) + ka)
+    if len(diffs) == 0:
+        return []
+
+    diffs = np.concatenate(diffs) / num_edges
+    merge_lists = np.concatenate(merge_lists)
+    # stable sort, so that ties are always resolved in the same order
+    order = np.argsort(-diffs, kind="mergesort")[:int(top_n)]
+    return [(float(diffs[i]), [int(merge_lists[i][0]), int(merge_lists[i][1])]) for i in order]
+
+
+def _get_merge_candidates_uni(m_e_rs, top_n):
+    # italic I = (sum_rs e_rs log e_rs / 2 - sum_r e_r log e_r) / E + log(2E) over the full matrix, whose diagonal holds
+    # twice the edges within each group; merging r and s changes rows r and s, their columns, and the diagonal
+    k = m_e_rs.shape[0]
+    if k < 2:
+        return []
+    num_edges = m_e_rs.sum() / 2.
+    degrees = m_e_rs.sum(axis=1)
+    ind_r, ind_s = np.triu_indices(k, k=1)
+    pairs = np.arange(len(ind_r))
+    merged = m_e_rs[ind_r] + m_e_rs[ind_s]
+    merged_terms = _x_log_x(merged).sum(axis=1) - _x_log_x(merged[pairs, ind_r]) - _x_log_x(merged[pairs, ind_s])
+    row_terms = _x_log_x(m_e_rs).sum(axis=1)
+    diag = np.diag(m_e_rs)
+    off_diag = m_e_rs[ind_r, ind_s]
+    diff = merged_terms - row_terms[ind_r] - row_terms[ind_s] + _x_log_x(diag[ind_r]) + _x_log_x(diag[ind_s])
+    diff += _x_log_x(off_diag)
+    diff += 0.5 * (_x_log_x(diag[ind_r] + diag[ind_s] + 2 * off_diag) - _x_log_x(diag[ind_r]) - _x_log_x(diag[ind_s]))
+    diff -= _x_log_x(degrees[ind_r] + degrees[ind_s]) - _x_log_x(degrees[ind_r]) - _x_log_x(degrees[ind_s])
+    diffs = diff / num_edges
+    order = np.argsort(-diffs, kind="mergesort")[:int(top_n)]
+    return [(float(diffs[i]), [int(ind_r[i]), int(ind_s[i])]) for i in order]
+
+
+def merge_m_e_rs(ka, kb, m_e_rs, merge_list):
+    '''
+        Merge two rows (and the corresponding columns) of the affinity matrix.
+
+        The higher index of <merge_list> is folded into the lower one and the rows after it are shifted up by one,
+        which is the same relabeling that is applied to the membership vector.
+
+        :return: new_ka, new_kb, and the new (ka + kb - 1) x (ka + kb - 1) affinity matrix, which is a BlockMatrix
+                 if <m_e_rs> is one
+    '''
+    if isinstance(m_e_rs, BlockMatrix):
+        m_e_rs = m_e_rs.merge(merge_list)
+        return m_e_rs.ka, m_e_rs.kb, m_e_rs
+    r, s = sorted(merge_list)
+    assert (s < ka) == (r < ka), "[ERROR] cannot merge a type-a block ({}) with a type-b block ({})".format(r, s)
+    c = np.array(m_e_rs, dtype=np.float64)
+    c[r, :] += c[s, :]
+    c[:, r] += c[:, s]
+    c = np.delete(np.delete(c, s, axis=0), s, axis=1)
+    if s < ka:
+        return ka - 1, kb, c
+    return ka, kb - 1, c
+
+
+def new_rng_state(seed):
+    '''
+        Explicit state of the random number generator of the numba kernels, e.g. <merge_block>.
+    '''
+    return np.array([seed], dtype=np.uint64)
+
+
+@njit(cache=True, nogil=True)
+def _next_random(rng_state):
+    # splitmix64, which updates <rng_state> in place
+    rng_state[0] += np.uint64(0x9E3779B97F4A7C15)
+    z = rng_state[0]
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+@njit(cache=True, nogil=True)
+def _random_below(rng_state, n):
+    return np.int64(_next_random(rng_state) % np.uint64(n))
+
+
+@njit(cache=True, nogil=True)
+def merge_block(ka, kb, block, out, rng_state):
+    '''
+        Merge two random type-a rows, or two random type-b columns, of the ka x kb block of the affinity matrix.
+
+        The type is chosen with probability ka / (ka + kb) for type-a, and never a type with a single group.
+        The higher index of the pair is folded into the lower one, as in <merge_m_e_rs>, and the result is
+        written to out[:new_ka, :new_kb], where <out> is a preallocated buffer of shape (at least) (ka, kb).
+
+        :param block: the ka x kb block of the affinity matrix, i.e. m_e_rs[:ka, ka:]
+        :param out: the output buffer, with the dtype of <block>
+        :param rng_state: the state of the random number generator, see <new_rng_state>; it is updated in place
+        :return: the merged pair of row-indexes of the affinity matrix (type-b indexes are offset by ka)
+    '''
+    if ka == 1 and kb == 1:
+        raise ValueError("[ERROR] cannot merge any groups when ka == kb == 1")
+    if ka == 1:
+        is_type_a = False
+    elif kb == 1:
+        is_type_a = True
+    else:
+        is_type_a = _random_below(rng_state, ka + kb) < ka
+
+    k = ka if is_type_a else kb
+    r = _random_below(rng_state, k)
+    s = _random_below(rng_state, k - 1)
+    if s >= r:
+        s += 1
+    if s < r:
+        r, s = s, r
+
+    if is_type_a:
+        for row in range(ka):
+            if row == s:
+                continue
+            dst = row if row < s else row - 1
+            for col in range(kb):
+                out[dst, col] = block[row, col]
+        for col in range(kb):
+            out[r, col] += block[s, col]
+        return r, s
+
+    for row in range(ka):
+        for col in range(kb):
+            if col == s:
+                continue
+            dst = col if col < s else col - 1
+            out[row, dst] = block[row, col]
+        out[row, r] += block[row, s]
+    return ka + r, ka + s
+
+
 def get_desc_len_from_data(na, nb, n_edges, ka, kb, edgelist, mb):
     '''
         Description length difference to a randomized instance
@@ -40,34 +307,15 @@ def get_desc_len_from_data(na, nb, n_edges, ka, kb, edgelist, mb):
         :param n_edges: number of edges
         :param ka: number of communities in type-a
         :param kb: number of communities in type-b
-        :param edgelist: edgelist in Python list structure
-        :param mb: community membership of each node in Python list structure
+        :param edgelist: edgelist in Python list structure, an int32 edge array, or a BipartiteGraph
+        :param mb: community membership of each node in Python list structure, or a numpy array
         :return: Description length difference
     '''
-    assert type(edgelist) is list, "[ERROR] the type of the input parameter (edgelist) should be a list"
-    assert type(mb) is list, "[ERROR] the type of the input parameter (mb) should be a list"
     # First, let's compute the m_e_rs from the edgelist and mb
-    m_e_rs = np.zeros((max(mb) + 1, max(mb) + 1))
-    for i in edgelist:
-        # Please do check the index convention of the edgelist
-        source_group = int(mb[int(i[0])])
-        target_group = int(mb[int(i[1])])
-        if source_group == target_group:
-            raise ImportError("This is not a bipartite network!")
-        m_e_rs[source_group][target_group] += 1
-        m_e_rs[target_group][source_group] += 1
+    m_e_rs = BlockMatrix.from_edges(get_edges_from_edgelist(edgelist), mb, ka, kb)
 
     # then, we compute the profile likelihood from the m_e_rs
-    italic_i = 0.
-    m_e_r = np.sum(m_e_rs, axis=1)
-    num_edges = m_e_r.sum() / 2.
-    for ind, e_val in enumerate(np.nditer(m_e_rs)):
-        ind_i = int(math.floor(ind / (m_e_rs.shape[0])))
-        ind_j = ind % (m_e_rs.shape[0])
-        if e_val != 0.0:
-            italic_i += e_val / 2. / num_edges * math.log(
-                e_val / m_e_r[ind_i] / m_e_r[ind_j] * 2 * num_edges
-            )
+    italic_i = m_e_rs.get_italic_i()
     assert m_e_rs.shape[0] == ka + kb, "[ERROR] m_e_rs dimension (={}) is not equal to ka (={}) + kb (={})!".format(
         m_e_rs.shape[0], ka, kb
     )
@@ -85,28 +333,11 @@ def get_desc_len_from_data_uni(n, n_edges, k, edgelist, mb):
     '''
         Description length difference to a randomized instance, via PRL 110, 148701 (2013).
     '''
-    assert type(edgelist) is list, "[ERROR] the type of the input parameter (edgelist) should be a list"
-    assert type(mb) is list, "[ERROR] the type of the input parameter (mb) should be a list"
     # First, let's compute the m_e_rs from the edgelist and mb
-    m_e_rs = np.zeros((max(mb) + 1, max(mb) + 1))
-    for i in edgelist:
-        # Please do check the index convention of the edgelist
-        source_group = int(mb[int(i[0])])
-        target_group = int(mb[int(i[1])])
-        m_e_rs[source_group][target_group] += 1
-        m_e_rs[target_group][source_group] += 1
+    m_e_rs, _ = get_m_e_rs_from_edges(get_edges_from_edgelist(edgelist), mb, is_bipartite=False)
 
     # then, we compute the profile likelihood from the m_e_rs
-    italic_i = 0.
-    m_e_r = np.sum(m_e_rs, axis=1)
-    num_edges = m_e_r.sum() / 2.
-    for ind, e_val in enumerate(np.nditer(m_e_rs)):
-        ind_i = int(math.floor(ind / (m_e_rs.shape[0])))
-        ind_j = ind % (m_e_rs.shape[0])
-        if e_val != 0.0:
-            italic_i += e_val / 2. / num_edges * math.log(
-                e_val / m_e_r[ind_i] / m_e_r[ind_j] * 2 * num_edges
-            )
+    italic_i = get_italic_i_from_m_e_rs(m_e_rs)
     assert m_e_rs.shape[0] == k, "[ERROR] m_e_rs dimension (={}) is not equal to k (={})!".format(
         m_e_rs.shape[0], k
     )
@@ -117,3 +348,179 @@ def get_desc_len_from_data_uni(n, n_edges, k, edgelist, mb):
     desc_len_b += (1 + x) * math.log(1 + x) - x * math.log(x)
     desc_len_b -= (1 + 1 / n_edges) * math.log(1 + 1 / n_edges) - (1 / n_edges) * math.log(1 / n_edges)
     return desc_len_b
+
+
+def get_desc_len_from_data_batch(graph, mbs, ka=None, kb=None, n_cores=1, chunk_size=16):
+    '''
+        Description length difference to a randomized instance, for many partitions of the same graph at once.
+
+        The partitions are scored in chunks of <chunk_size> rows, which are spread over the cores of the global
+        scheduler; each chunk is counted by a numba kernel that runs outside of the GIL. The result agrees with
+        <get_desc_len_from_data>, partition by partition.
+
+        :param graph: the BipartiteGraph, or an (edgelist, types) tuple, which is prepared only once
+        :param mbs: membership vectors, as a 2-d array with one row per partition, or an iterable of vectors
+        :param ka: number of communities in type-a; if None, it is max(mb[type-a nodes]) + 1 for each partition
+        :param kb: number of communities in type-b; if None, it is max(mb) + 1 - ka for each partition
+        :param n_cores: number of cores used
+        :param chunk_size: number of partitions scored by each task
+        :return: numpy array of the description length differences, in the order of <mbs>
+    '''
+    if not isinstance(graph, BipartiteGraph):
+        graph = BipartiteGraph(*graph)
+    edges = graph.edges
+    is_type_a = graph.types == 1
+    n_a, n_b, n_edges = graph.n_a, graph.n_b, graph.e
+
+    def score_chunk(chunk):
+        kas = chunk[:, is_type_a].max(axis=1) + 1 if ka is None else np.full(len(chunk), int(ka))
+        kbs = chunk.max(axis=1) + 1 - kas if kb is None else np.full(len(chunk), int(kb))
+        italic_i = _get_italic_i_of_partitions(edges, chunk, kas, kbs)
+        if np.any(np.isnan(italic_i)):
+            raise ImportError("[ERROR] This is not a bipartite network!")
+        kas = kas.astype(np.float64)
+        kbs = kbs.astype(np.float64)
+        desc_len_b = (n_a * np.log(kas) + n_b * np.log(kbs) - n_edges * (italic_i - math.log(2))) / n_edges
+        x = kas * kbs / n_edges
+        desc_len_b += (1 + x) * np.log(1 + x) - x * np.log(x)
+        desc_len_b -= (1 + 1 / n_edges) * math.log(1 + 1 / n_edges) - (1 / n_edges) * math.log(1 / n_edges)
+        return desc_len_b
+
+    return _map_partitions(score_chunk, mbs, graph.n, n_cores, chunk_size)
+
+
+def get_desc_len_from_data_uni_batch(n, edgelist, mbs, k=None, n_cores=1, chunk_size=16):
+    '''
+        Description length difference to a randomized instance, via PRL 110, 148701 (2013), for many partitions of
+        the same graph at once; see <get_desc_len_from_data_batch>. The result agrees with
+        <get_desc_len_from_data_uni>, partition by partition.
+
+        :param n: number of nodes
+        :param edgelist: edgelist in Python list structure, or an int32 edge array, which is parsed only once
+        :param mbs: membership vectors, as a 2-d array with one row per partition, or an iterable of vectors
+        :param k: number of communities; if None, it is max(mb) + 1 for each partition
+        :param n_cores: number of cores used
+        :param chunk_size: number of partitions scored by each task
+        :return: numpy array of the description length differences, in the order of <mbs>
+    '''
+    edges = get_edges_from_edgelist(edgelist)
+    n_edges = len(edges)
+
+    def score_chunk(chunk):
+        ks = chunk.max(axis=1) + 1 if k is None else np.full(len(chunk), int(k))
+        italic_i = _get_italic_i_of_partitions_uni(edges, chunk, ks)
+        assert not np.any(np.isnan(italic_i)), "[ERROR] the membership indexes should run from 0 to k - 1"
+        ks = ks.astype(np.float64)
+        desc_len_b = (n * np.log(ks) - n_edges * italic_i) / n_edges
+        x = ks * (ks + 1) / 2. / n_edges
+        desc_len_b += (1 + x) * np.log(1 + x) - x * np.log(x)
+        desc_len_b -= (1 + 1 / n_edges) * math.log(1 + 1 / n_edges) - (1 / n_edges) * math.log(1 / n_edges)
+        return desc_len_b
+
+    return _map_partitions(score_chunk, mbs, n, n_cores, chunk_size)
+
+
+def _map_partitions(score_chunk, mbs, n, n_cores, chunk_size):
+    # at most two chunks per core are in flight, hence an iterable of partitions is never held in memory at once
+    scheduler = get_scheduler(n_cores)
+    chunk_size = max(int(chunk_size), 1)
+    if isinstance(mbs, np.ndarray):
+        assert mbs.ndim == 2, "[ERROR] <mbs> should be a 2-d array; here its shape is {}".format(mbs.shape)
+        chunks = (mbs[i:i + chunk_size] for i in range(0, len(mbs), chunk_size))
+    else:
+        mbs = iter(mbs)
+        chunks = iter(lambda: list(islice(mbs, chunk_size)), [])
+
+    def score(chunk):
+        chunk = np.asarray(chunk, dtype=np.int64)
+        assert chunk.ndim == 2 and chunk.shape[1] == n, \
+            "[ERROR] the membership vectors should hold {} nodes".format(n)
+        return score_chunk(chunk)
+
+    futures = deque()
+    results = []
+    for chunk in chunks:
+        futures.append(scheduler.submit(score, chunk))
+        if len(futures) >= 2 * scheduler.n_cores:
+            results.append(scheduler.result(futures.popleft()))
+    while len(futures) > 0:
+        results.append(scheduler.result(futures.popleft()))
+    if len(results) == 0:
+        return np.zeros(0)
+    return np.concatenate(results)
+
+
+@njit(cache=True, nogil=True)
+def _get_italic_i_of_partitions(edges, mbs, kas, kbs):
+    # italic I of each row of <mbs>, or NaN if an edge does not join a type-a and a type-b group
+    n_edges = len(edges)
+    block = np.zeros(np.max(kas * kbs), dtype=np.int64)
+    e_r = np.zeros(np.max(kas), dtype=np.int64)
+    e_s = np.zeros(np.max(kbs), dtype=np.int64)
+    italic_i = np.zeros(len(mbs))
+    for i in range(len(mbs)):
+        ka = kas[i]
+        kb = kbs[i]
+        block[:ka * kb] = 0
+        e_r[:ka] = 0
+        e_s[:kb] = 0
+        for idx in range(n_edges):
+            r = mbs[i, edges[idx, 0]]
+            s = mbs[i, edges[idx, 1]]
+            a = min(r, s)
+            b = max(r, s) - ka
+            if a < 0 or a >= ka or b < 0 or b >= kb:
+                italic_i[i] = np.nan
+                break
+            block[a * kb + b] += 1
+            e_r[a] += 1
+            e_s[b] += 1
+        if n_edges == 0 or np.isnan(italic_i[i]):
+            continue
+        total = 0.
+        for j in range(ka * kb):
+            if block[j] > 0:
+                total += block[j] * np.log(block[j])
+        for j in range(ka):
+            if e_r[j] > 0:
+                total -= e_r[j] * np.log(e_r[j])
+        for j in range(kb):
+            if e_s[j] > 0:
+                total -= e_s[j] * np.log(e_s[j])
+        italic_i[i] = total / n_edges + np.log(2. * n_edges)
+    return italic_i
+
+
+@njit(cache=True, nogil=True)
+def _get_italic_i_of_partitions_uni(edges, mbs, ks):
+    # italic I of each row of <mbs>, or NaN if a membership index is out of range
+    n_edges = len(edges)
+    max_k = np.max(ks)
+    m_e_rs = np.zeros((max_k, max_k), dtype=np.int64)
+    m_e_r = np.zeros(max_k, dtype=np.int64)
+    italic_i = np.zeros(len(mbs))
+    for i in range(len(mbs)):
+        k = ks[i]
+        m_e_rs[:k, :k] = 0
+        m_e_r[:k] = 0
+        for idx in range(n_edges):
+            r = mbs[i, edges[idx, 0]]
+            s = mbs[i, edges[idx, 1]]
+            if r < 0 or r >= k or s < 0 or s >= k:
+                italic_i[i] = np.nan
+                break
+            m_e_rs[r, s] += 1
+            m_e_rs[s, r] += 1
+            m_e_r[r] += 1
+            m_e_r[s] += 1
+        if n_edges == 0 or np.isnan(italic_i[i]):
+            continue
+        total = 0.
+        for r in range(k):
+            for s in range(k):
+                if m_e_rs[r, s] > 0:
+                    total += m_e_rs[r, s] * np.log(m_e_rs[r, s])
+            if m_e_r[r] > 0:
+                total -= 2. * m_e_r[r] * np.log(m_e_r[r])
+        italic_i[i] = total / (2. * n_edges) + np.log(2. * n_edges)
+    return italic_i
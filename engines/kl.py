@@ -2,8 +2,13 @@ import os
 import shutil
 import subprocess
 import hashlib
-from collections import OrderedDict
-import random
+import tempfile
+import threading
+import numpy as np
+
+from det_k_bisbm.graph import BipartiteGraph
+from det_k_bisbm.scheduler import get_scheduler, get_current_task, popen, raise_if_cancelled
+from det_k_bisbm.tracing import span, traced
 
 
 class KL(object):
@@ -25,12 +30,10 @@ class KL(object):
         self.KL_PARALLELIZATION = bool(kl_is_parallel)
 
         # <kl_itertimes> is the number of KL sweeps (<kl_steps> per sweep) performed before returning the optimal result
-        # during each engine run (Note that there are <n_sweeps> engines running in parallel via loky)
+        # during each engine run (Note that there are <n_sweeps> engines running in parallel on the scheduler); with
+        # <kl_is_parallel>, the sweeps of each run are also spread over the scheduler, each in its own output dir
         self.MAX_KL_NUM_SWEEPS = int(kl_itertimes)
 
-        if self.KL_PARALLELIZATION:
-            raise NotImplementedError("[ERROR] KL calculation accross many cores is not supported.")
-
         # for KL
         if not os.path.isfile(f_engine):
             raise BaseException("[ERROR] KL engine binary not found!")
@@ -44,11 +47,18 @@ class KL(object):
 
         pass
 
+    @traced("KL.prepare_engine")
     def prepare_engine(self, f_edgelist, na, nb, ka, kb, delimiter=None):
         """Output shell commands for graph partitioning calculation.
 
+        The output dir of the command (its 4th argument) is created in <f_kl_output> for this command only; it is
+        owned by the caller, who removes it once the command has been run, e.g. with `shutil.rmtree`.
+
         Parameters
         ----------
+        f_edgelist : str or BipartiteGraph, required
+            Path to the edgelist file, or the graph itself.
+
         ka : int, required
             Number of communities for type-a nodes to partition.
 
@@ -61,50 +71,50 @@ class KL(object):
             the command line string that enables execution of the code
 
         """
+        action_str, _ = self._prepare_engine(f_edgelist, na, nb, ka, kb, delimiter)
+        return action_str
+
+    def _prepare_engine(self, f_edgelist, na, nb, ka, kb, delimiter=None):
+        # returns the command line string, and the working dir of this run; the engine object is left untouched,
+        # so that several runs may be prepared concurrently
         if delimiter is None:
             delimiter = self.kl_edgelist_delimiter
+        f_edgelist_1_indexed, f_types = self._get_inputs(f_edgelist, na, nb, delimiter)
+        f_kl_output = self._make_output_dir()
+        action_str = ' '.join(self._get_action_list(f_edgelist_1_indexed, f_types, f_kl_output, ka, kb))
+        return action_str, f_kl_output
 
+    def _make_output_dir(self):
         try:
-            os.mkdir(self.f_kl_output)
+            os.makedirs(self.f_kl_output)
         except OSError:
             pass
-        finally:
-            self.f_kl_output += "/" + hashlib.md5(str(random.random()).encode()).hexdigest()
-            try:
-                os.mkdir(self.f_kl_output)
-            except OSError:
-                # clear the working dir, and mkdir a new one
-                shutil.rmtree(self.f_kl_output, ignore_errors=True)
-                os.mkdir(self.f_kl_output)
-                pass
-
-        filename = hashlib.md5(f_edgelist.encode()).hexdigest()
-        f_edgelist_1_indexed = self.f_kl_output + "/" + filename + "_1-indexed.edgelist"
-        self._save_edgelist_as_1_indexed(f_edgelist, f_edgelist_1_indexed, delimiter)
-
-        f_types = self.f_kl_output + "/" + filename + ".types"
-        self.types = self._save_types(f_types, na, nb)
-
-        action_list = [
+        # only the output of the run goes to its own dir
+        return tempfile.mkdtemp(dir=self.f_kl_output)
+
+    def _get_action_list(self, f_edgelist_1_indexed, f_types, f_kl_output, ka, kb):
+        return [
             self.f_engine,
             f_edgelist_1_indexed,
             f_types,
-            self.f_kl_output,
+            f_kl_output,
             str(ka),
             str(kb),
             '1',  # degree-corrected
             str(self.kl_steps)
         ]
 
-        action_str = ' '.join(action_list)
-
-        return action_str
-
-    def engine(self, f_edgelist, na, nb, ka, kb):  # TODO: bug when assigned verbose=False
+    def engine(self, f_edgelist, na, nb, ka, kb):
         """Run the shell code.
 
+        The <kl_itertimes> KL runs are independent, each in its own output dir; with `kl_is_parallel`, they are
+        run as tasks of the global scheduler, which is also the one of `OptimalKs`.
+
         Parameters
         ----------
+        f_edgelist : str or BipartiteGraph, required
+            Path to the edgelist file, or the graph itself.
+
         ka : int, required
             Number of communities for type-a nodes to partition.
 
@@ -116,88 +126,127 @@ class KL(object):
         of_group : list
 
         """
-        action_str = self.prepare_engine(f_edgelist, na, nb, ka, kb)
-
-        num_sweeps_ = self.MAX_KL_NUM_SWEEPS
-        verbose_ = self.kl_verbose
-        parallelization_ = self.KL_PARALLELIZATION
-        num_cores_ = self.NUM_CORES
+        inputs = self._get_inputs(f_edgelist, na, nb, self.kl_edgelist_delimiter)
+        feeds = [(inputs, ka, kb)] * self.MAX_KL_NUM_SWEEPS
 
-        if not verbose_:
-            stdout = open(os.devnull, "w")
+        if not self.KL_PARALLELIZATION:
+            kl_output = [self._run_sweep(feed) for feed in feeds]
         else:
-            stdout = subprocess.PIPE
+            # the scheduler is safe to use from its own workers, since a waiting thread runs the pending tasks;
+            # the runs are cancelled, and their processes terminated, together with the task running this engine
+            scheduler = get_scheduler(self.NUM_CORES)
+            futures = [scheduler.submit(self._run_sweep, feed) for feed in feeds]
+            task = get_current_task()
+            if task is not None:
+                task.add_kill_callback(lambda: [future.request_cancel() for future in futures])
+            kl_output = scheduler.results(futures)
+            raise_if_cancelled()
+
+        # the highest score; ties go to the first run
+        score, of_group = max(kl_output, key=lambda output: output[0])
+        return of_group
 
-        def run(_):
-            p = subprocess.Popen(
-                action_str.split(' '),
-                bufsize=2048,
-                stdout=stdout
-            )
-            out, err = p.communicate()
-            p.wait()
-            return out, err, p
-
-        kl_output = OrderedDict()
-        num_sweep_ = 0
-        while num_sweep_ < num_sweeps_:
-            if not parallelization_:
-                out, err, p = run("")
+    def _run_sweep(self, feed):
+        # a single KL run in a fresh output dir, which is removed afterwards; returns (score, of_group)
+        (f_edgelist_1_indexed, f_types), ka, kb = feed
+        f_kl_output = self._make_output_dir()
+        action_list = self._get_action_list(f_edgelist_1_indexed, f_types, f_kl_output, ka, kb)
+        stdout = subprocess.PIPE if self.kl_verbose else subprocess.DEVNULL
+        try:
+            while True:
+                with span("KL.subprocess"):
+                    p = popen(action_list, bufsize=2048, stdout=stdout)
+                    p.communicate()
+                # the process was terminated because the task running this engine got cancelled
+                raise_if_cancelled()
                 if p.returncode == -11:  # when Exception raises from the KL code
-                    raise RuntimeError("[ERROR] Exception from C++ program during inference! -- " + action_str)
+                    raise RuntimeError(
+                        "[ERROR] Exception from C++ program during inference! -- " + ' '.join(action_list)
+                    )
                 elif p.returncode == 0:
-                    num_sweep_ += 1
-                    assert type(self._get_score_by_index(num_sweep_)) == float
-                    kl_output[self._get_score_by_index(num_sweep_)] = self._get_of_group_by_index(num_sweep_)
-
-            else:  # spawn processes across cores, collect results, and return the best option
-                # However, in optimalks.py main code, we may calculate each single point in parallel, which
-                # might raise "AssertionError: daemonic processes are not allowed to have children"
-                # TODO: For now, parallel calculation for KL is disabled. (Fix it?)
-                raise NotImplementedError
+                    break
+            score = self._get_score_by_index(f_kl_output, 1)
+            assert type(score) == float
+            return score, self._get_of_group_by_index(f_kl_output, 1)
+        finally:
+            shutil.rmtree(f_kl_output, ignore_errors=True)
 
-        of_group = kl_output[max(kl_output)]
+    def _get_inputs(self, f_edgelist, na, nb, delimiter):
+        """
+            The 1-indexed edgelist and the types file of the graph, as read by the binary.
 
-        try:
-            shutil.rmtree(self.f_kl_output, ignore_errors=True)
-        finally:
-            return of_group
+            They are converted once per graph, identified by its content, and kept in <f_kl_output>/inputs for all the
+            runs of the KL engines that share this output dir, across (ka, kb) points, sweeps and processes.
+        """
+        if isinstance(f_edgelist, BipartiteGraph):
+            key = f_edgelist.content_hash
+        else:
+            key = hashlib.md5("{}|{}|{}|{}".format(
+                _get_file_hash(f_edgelist), delimiter, int(na), int(nb)
+            ).encode()).hexdigest()
+        directory = os.path.join(self.f_kl_output, "inputs")
+        f_edgelist_1_indexed = os.path.join(directory, key + "_1-indexed.edgelist")
+        f_types = os.path.join(directory, key + ".types")
+        with _inputs_lock:
+            if os.path.isfile(f_edgelist_1_indexed) and os.path.isfile(f_types):
+                return f_edgelist_1_indexed, f_types
+            with span("KL.convert_inputs"):
+                try:
+                    os.makedirs(directory)
+                except OSError:
+                    pass
+                # write to temporary names first, so that the binary never reads a half-written file
+                with tempfile.NamedTemporaryFile(mode="w", dir=directory, suffix=".tmp", delete=False) as f:
+                    if isinstance(f_edgelist, BipartiteGraph):
+                        f_edgelist.write_edgelist(f, offset=1)
+                    else:
+                        self._save_edgelist_as_1_indexed(f_edgelist, f, delimiter)
+                os.rename(f.name, f_edgelist_1_indexed)
+                with tempfile.NamedTemporaryFile(mode="w", dir=directory, suffix=".tmp", delete=False) as f:
+                    if isinstance(f_edgelist, BipartiteGraph):
+                        f_edgelist.write_types(f)
+                    else:
+                        self._save_types(f, na, nb)
+                os.rename(f.name, f_types)
+        return f_edgelist_1_indexed, f_types
 
     @staticmethod
     def gen_types(na, nb):
         types = [1] * int(na) + [2] * int(nb)
         return types
 
-    def _get_of_group_by_index(self, num_sweep_):
+    def _get_of_group_by_index(self, f_kl_output, num_sweep_):
         of_group = []
-        f = self._open_biDCSBMcomms_file(num_sweep_)
+        f = self._open_biDCSBMcomms_file(f_kl_output, num_sweep_)
         for ind, line in enumerate(f):
             of_group.append(int(line.split('\n')[0]))
         f.close()
         return of_group
 
-    def _get_score_by_index(self, num_sweep_):
-        f = self._get_bisbm_score_file(num_sweep_)
+    def _get_score_by_index(self, f_kl_output, num_sweep_):
+        f = self._get_bisbm_score_file(f_kl_output, num_sweep_)
         for ind, line in enumerate(f):
             score = float(line.split('\n')[0])
         f.close()
         return score
 
-    def _get_bisbm_score_file(self, num_sweep_):
+    @staticmethod
+    def _get_bisbm_score_file(f_kl_output, num_sweep_):
         '''
             :return: file handle
         '''
         f = open(
-            self.f_kl_output + '/biDCSBMcomms' + str(int(num_sweep_)) + '.score', 'r'
+            f_kl_output + '/biDCSBMcomms' + str(int(num_sweep_)) + '.score', 'r'
         )
         return f
 
-    def _open_biDCSBMcomms_file(self, num_sweep_):
+    @staticmethod
+    def _open_biDCSBMcomms_file(f_kl_output, num_sweep_):
         '''
             :return: file handle
         '''
         f = open(
-            self.f_kl_output + '/biDCSBMcomms' +
+            f_kl_output + '/biDCSBMcomms' +
             str(int(num_sweep_)) + '.tsv', 'r'
         )
         return f
@@ -206,30 +255,42 @@ class KL(object):
     def _save_edgelist_as_1_indexed(f_edgelist, f_target_edgelist, delimiter="\t"):
         """
             Note that this function always saves with delimiter "\t"
-        :param f_edgelist:
-        :param f_target_edgelist:
-        :param delimiter:
+        :param f_edgelist: path to the 0-indexed edgelist
+        :param f_target_edgelist: path or open file handle to write to
+        :param delimiter: the delimiter of <f_edgelist>
         :return:
         """
-        import re
-        with open(f_target_edgelist, "w") as g:
-            with open(f_edgelist, "r") as f:
-                for line in f:
-                    line = line.replace('\r', '').replace('\n', '')
-                    edge = re.split(delimiter, line)
-                    try:
-                        g.write(str(int(edge[0]) + 1) + "\t" + str(int(edge[1]) + 1) + "\n")
-                    except ValueError as e:
-                        raise ValueError(
-                            "[ERROR] Please check if the delimiter for the edgelist file is wrong -- {}".format(e)
-                        )
+        try:
+            edges = np.loadtxt(f_edgelist, delimiter=delimiter, dtype=np.int64, usecols=(0, 1), ndmin=2)
+        except ValueError as e:
+            raise ValueError(
+                "[ERROR] Please check if the delimiter for the edgelist file is wrong -- {}".format(e)
+            )
+        np.savetxt(f_target_edgelist, edges + 1, fmt="%d", delimiter="\t")
 
     @staticmethod
     def _save_types(f_types, na, nb):
         assert na > 0, "[ERROR] Number of type-a nodes = 0, which is not allowed"
         assert nb > 0, "[ERROR] Number of type-b nodes = 0, which is not allowed"
         types = [1] * int(na) + [2] * int(nb)
-        with open(f_types, "w") as f:
-            for line in types:
-                f.write(str(line) + '\n')
+        np.savetxt(f_types, types, fmt="%d")
         return types
+
+
+# guards the conversion of the inputs, and the hashes of the edgelist files: {(path, mtime, size): md5 digest}
+_inputs_lock = threading.Lock()
+_file_hashes = {}
+
+
+def _get_file_hash(path):
+    """md5 digest of the content of the file at <path>, which is only read again when the file changes."""
+    stat = os.stat(path)
+    key = os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+    with _inputs_lock:
+        if key not in _file_hashes:
+            h = hashlib.md5()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(2 ** 20), b""):
+                    h.update(block)
+            _file_hashes[key] = h.hexdigest()
+        return _file_hashes[key]
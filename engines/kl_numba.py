@@ -0,0 +1,186 @@
+import numpy as np
+from numba import njit
+
+from det_k_bisbm.scheduler import raise_if_cancelled
+from det_k_bisbm.tracing import span
+from engines.numba_utils import *
+
+
+class KLNumba(object):
+    """In-process Kernighan-Lin engine for the degree-corrected biSBM, compiled with numba.
+
+    It plugs into `OptimalKs` like `KL`, but works on the CSR arrays of the in-memory graph and updates the
+    block counts incrementally, so that no file is written or read.
+
+    Each KL run starts from a random partition. In each pass, every node is moved exactly once, always making
+    the move (to a block of its own type) that increases the log-likelihood the most, or decreases it the least;
+    the partition then goes back to the best state seen during the pass. Passes are repeated until they no longer
+    improve the log-likelihood.
+
+    Parameters
+    ----------
+    n_sweeps : int, optional
+        Number of partitioning computations for each (ka, kb) point.
+
+    is_parallel : bool, optional
+        Whether to compute the partitioning in parallel.
+
+    n_cores : int, optional
+        If `is_parallel == True`, the number of cores used.
+
+    kl_steps : int, optional
+        The number of random initializations in a KL run.
+
+    kl_itertimes : int, optional
+        The number of KL runs performed before returning the optimal result.
+
+    seed : int, optional
+        Seed of the random number generator.
+
+    """
+    # the engine works on the BipartiteGraph itself, rather than on an edgelist file
+    IN_PROCESS = True
+    # the engine also partitions one-mode graphs, when called with nb == kb == 0 (see OptimalK)
+    ONE_MODE = True
+
+    def __init__(self,
+                 n_sweeps=4,
+                 is_parallel=True,
+                 n_cores=4,
+                 kl_steps=5,
+                 kl_itertimes=1,
+                 seed=None):
+
+        self.MAX_NUM_SWEEPS = int(n_sweeps)
+        self.PARALLELIZATION = bool(is_parallel)
+        self.NUM_CORES = int(n_cores)
+        self.MAX_KL_NUM_SWEEPS = int(kl_itertimes)
+        self.kl_steps = int(kl_steps)
+
+        self._rng = np.random.RandomState(seed)
+        self._graphs = {}
+
+    def engine(self, f_edgelist, na, nb, ka, kb):
+        """Run the KL algorithm; for a one-mode graph of na nodes, nb and kb are 0.
+
+        Parameters
+        ----------
+        f_edgelist : str or BipartiteGraph, required
+            Path to the edgelist file, or the graph itself.
+
+        ka : int, required
+            Number of communities for type-a nodes to partition.
+
+        kb : int, required
+            Number of communities for type-b nodes to partition.
+
+        Returns
+        -------
+        of_group : list
+
+        """
+        graph = get_graph(f_edgelist, na, nb, self._graphs)
+        ka = int(ka)
+        kb = int(kb)
+
+        of_group = None
+        best_log_l = -np.inf
+        for _ in range(self.MAX_KL_NUM_SWEEPS * self.kl_steps):
+            raise_if_cancelled()
+            mb = gen_init_mb(graph.types, ka, kb, self._rng)
+            with span("KLNumba.kernighan_lin", ka=ka, kb=kb):
+                log_l = _kernighan_lin(graph.indptr, graph.indices, graph.types, mb, ka, kb)
+            if log_l > best_log_l:
+                best_log_l = log_l
+                of_group = mb
+        return of_group.tolist()
+
+    def get_state(self):
+        """The state of the random number generator of the engine, as given by `numpy.random.RandomState`."""
+        return self._rng.get_state()
+
+    def set_state(self, state):
+        """Restore a state of the random number generator of the engine, given by `get_state`."""
+        self._rng.set_state(state)
+
+    @staticmethod
+    def gen_types(na, nb):
+        types = [1] * int(na) + [2] * int(nb)
+        return types
+
+
+@njit(cache=True, nogil=True)
+def _kernighan_lin(indptr, indices, types, mb, ka, kb):
+    # optimizes mb in place, and returns its log-likelihood
+    n = len(mb)
+    k = ka + kb
+    m_rs, e_r, n_r = get_block_counts(indptr, indices, mb, k)
+    log_l = get_log_likelihood(m_rs, e_r, ka)
+
+    counts = np.zeros(k, dtype=np.int64)
+    touched = np.zeros(k, dtype=np.int64)
+    is_locked = np.zeros(n, dtype=np.bool_)
+    moved_nodes = np.zeros(n, dtype=np.int64)
+    moved_from = np.zeros(n, dtype=np.int64)
+    while True:
+        is_locked[:] = False
+        start_log_l = log_l
+        best_log_l = log_l
+        best_n_moves = 0
+        n_moves = 0
+        for _ in range(n):
+            best_diff = -np.inf
+            best_v = -1
+            best_r = -1
+            for v in range(n):
+                r = mb[v]
+                if is_locked[v] or n_r[r] == 1:
+                    continue
+                if types[v] == 1:
+                    low, high = 0, ka
+                else:
+                    low, high = ka, k
+                n_touched = count_neighbor_blocks(v, indptr, indices, mb, counts, touched)
+                degree = indptr[v + 1] - indptr[v]
+                removal_diff = get_removal_diff(r, degree, counts, touched, n_touched, m_rs, e_r)
+                for r_new in range(low, high):
+                    if r_new == r:
+                        continue
+                    if kb == 0:
+                        # one-mode graph
+                        diff_log_l = get_move_diff_uni(r, r_new, degree, counts, touched, n_touched, m_rs, e_r)
+                    else:
+                        diff_log_l = removal_diff + get_insertion_diff(
+                            r_new, degree, counts, touched, n_touched, m_rs, e_r
+                        )
+                    if diff_log_l > best_diff:
+                        best_diff = diff_log_l
+                        best_v = v
+                        best_r = r_new
+                reset_counts(counts, touched, n_touched)
+            if best_v < 0:
+                break
+
+            moved_nodes[n_moves] = best_v
+            moved_from[n_moves] = mb[best_v]
+            n_moves += 1
+            is_locked[best_v] = True
+            n_touched = count_neighbor_blocks(best_v, indptr, indices, mb, counts, touched)
+            apply_move(best_v, best_r, indptr[best_v + 1] - indptr[best_v], counts, touched, n_touched,
+                       mb, m_rs, e_r, n_r)
+            reset_counts(counts, touched, n_touched)
+            log_l += best_diff
+            if log_l > best_log_l + 1e-10:
+                best_log_l = log_l
+                best_n_moves = n_moves
+
+        # go back to the best state seen during the pass
+        for i in range(n_moves - 1, best_n_moves - 1, -1):
+            v = moved_nodes[i]
+            n_touched = count_neighbor_blocks(v, indptr, indices, mb, counts, touched)
+            apply_move(v, moved_from[i], indptr[v + 1] - indptr[v], counts, touched, n_touched, mb, m_rs, e_r, n_r)
+            reset_counts(counts, touched, n_touched)
+        log_l = best_log_l
+        if best_n_moves == 0:
+            break
+    return get_log_likelihood(m_rs, e_r, ka)
@@ -2,6 +2,10 @@ import os
 import numpy as np
 import subprocess
 
+from det_k_bisbm.graph import BipartiteGraph
+from det_k_bisbm.scheduler import popen, raise_if_cancelled
+from det_k_bisbm.tracing import span, traced
+
 
 class MCMC(object):
     def __init__(self,
@@ -34,11 +38,15 @@ class MCMC(object):
 
         pass
 
+    @traced("MCMC.prepare_engine")
     def prepare_engine(self, f_edgelist, na, nb, ka, kb):
         """Output shell commands for graph partitioning calculation.
 
         Parameters
         ----------
+        f_edgelist : str or BipartiteGraph, required
+            Path to the edgelist file, or the graph itself.
+
         ka : int, required
             Number of communities for type-a nodes to partition.
 
@@ -51,6 +59,9 @@ class MCMC(object):
             the command line string that enables execution of the code
 
         """
+        if isinstance(f_edgelist, BipartiteGraph):
+            f_edgelist = f_edgelist.get_engine_input()
+
         params_ = ""
         if self.mcmc_cooling_ in ["exponential", "linear", "logarithmic"]:
             params_ = self.mcmc_cooling_param_1 + " " + self.mcmc_cooling_param_2
@@ -98,6 +109,9 @@ class MCMC(object):
 
         Parameters
         ----------
+        f_edgelist : str or BipartiteGraph, required
+            Path to the edgelist file, or the graph itself.
+
         ka : int, required
             Number of communities for type-a nodes to partition.
 
@@ -115,13 +129,16 @@ class MCMC(object):
         num_sweeps_ = 1
 
         def _run_engine(_):
-            p = subprocess.Popen(
-                action_str.split(' '),
-                bufsize=2048,
-                stdout=subprocess.PIPE
-            )
-            out, err = p.communicate()
-            p.wait()
+            with span("MCMC.subprocess"):
+                p = popen(
+                    action_str.split(' '),
+                    bufsize=2048,
+                    stdout=subprocess.PIPE
+                )
+                out, err = p.communicate()
+                p.wait()
+            # the process was terminated because the task running this engine got cancelled
+            raise_if_cancelled()
             return out, err, p
 
         num_sweep_ = 0
@@ -0,0 +1,278 @@
+import numpy as np
+from numba import njit
+
+from det_k_bisbm.scheduler import raise_if_cancelled
+from det_k_bisbm.tracing import span
+from engines.numba_utils import *
+
+
+COOLING_SCHEDULES = {
+    "exponential": 0,
+    "linear": 1,
+    "logarithmic": 2,
+    "constant": 3
+}
+
+# fraction of the moves that propose a uniformly random block, rather than the block of a second neighbor
+UNIFORM_PROPOSAL_RATIO = 0.1
+
+# number of single-node moves between two checks for the cancellation of the task running the engine
+CHUNK_STEPS = 2 ** 16
+
+
+class MCMCNumba(object):
+    """In-process MCMC engine for the degree-corrected biSBM, compiled with numba.
+
+    It follows the same contract as `MCMC`, but anneals the partition directly on the in-memory graph arrays,
+    so that no process is spawned and no file is read or parsed during the sweeps.
+
+    The chain maximizes the profile likelihood of the degree-corrected biSBM with single-node moves, where
+    a node is only moved between blocks of its own type and no block is ever emptied. Most moves propose the
+    block of a random second neighbor of the node, which escapes the poor local optima of uniform proposals.
+    The temperature at time t (in units of sweeps, i.e. n single-node moves) is given by the cooling schedule:
+
+        exponential  -> param_1 * param_2 ** t
+        linear       -> max(param_1 - param_2 * t, 0)
+        logarithmic  -> param_1 / log(t + param_2)
+        constant     -> param_1
+
+    The chain runs by chunks of `CHUNK_STEPS` moves, so that a sweep stops soon after it gets cancelled, e.g. when
+    another sweep already won the race (see `Scheduler.race`).
+
+    Parameters
+    ----------
+    n_sweeps : int, optional
+        Number of partitioning computations for each (ka, kb) point.
+
+    is_parallel : bool, optional
+        Whether to compute the partitioning in parallel.
+
+    n_cores : int, optional
+        If `is_parallel == True`, the number of cores used.
+
+    mcmc_moves : int, optional
+        Maximal number of single-node moves. Note that the <mcmc_steps> of `MCMC` counts sweeps instead, where a
+        sweep is n single-node moves.
+
+    mcmc_await_moves : int, optional
+        Stop early if the log-likelihood varies by less than <mcmc_epsilon> within this many moves.
+
+    mcmc_cooling : str, optional
+        Annealing scheme used. One of "exponential", "linear", "logarithmic" or "constant".
+
+    mcmc_cooling_param_1 : float, optional
+        Parameter 1 for the annealing.
+
+    mcmc_cooling_param_2 : float, optional
+        Parameter 2 for the annealing.
+
+    mcmc_epsilon : float, optional
+        See <mcmc_await_moves>.
+
+    seed : int, optional
+        Seed of the random number generator, which is shared by the parallel sweeps of the engine; each chain
+        draws its own seed from it.
+
+    """
+    # the engine works on the BipartiteGraph itself, rather than on an edgelist file
+    IN_PROCESS = True
+    # the engine also partitions one-mode graphs, when called with nb == kb == 0 (see OptimalK)
+    ONE_MODE = True
+
+    def __init__(self,
+                 n_sweeps=4,
+                 is_parallel=True,
+                 n_cores=4,
+                 mcmc_moves=1000,
+                 mcmc_await_moves=10000,
+                 mcmc_cooling="exponential",
+                 mcmc_cooling_param_1=100,
+                 mcmc_cooling_param_2=0.1,
+                 mcmc_epsilon=0.001,
+                 seed=None):
+
+        self.MAX_NUM_SWEEPS = int(n_sweeps)
+        self.PARALLELIZATION = bool(is_parallel)
+        self.NUM_CORES = int(n_cores)
+
+        if mcmc_cooling not in COOLING_SCHEDULES:
+            raise ValueError("[ERROR] <mcmc_cooling> should be one of {}; here it is {}".format(
+                list(COOLING_SCHEDULES), mcmc_cooling
+            ))
+        self.mcmc_moves_ = int(mcmc_moves)
+        self.mcmc_await_moves_ = int(mcmc_await_moves)
+        self.mcmc_cooling_ = str(mcmc_cooling)
+        self.mcmc_cooling_param_1 = float(mcmc_cooling_param_1)
+        self.mcmc_cooling_param_2 = float(mcmc_cooling_param_2)
+        self.mcmc_epsilon_ = float(mcmc_epsilon)
+
+        self._rng = np.random.RandomState(seed)
+        self._graphs = {}
+
+    def engine(self, f_edgelist, na, nb, ka, kb):
+        """Run the MCMC; for a one-mode graph of na nodes, nb and kb are 0.
+
+        Parameters
+        ----------
+        f_edgelist : str or BipartiteGraph, required
+            Path to the edgelist file, or the graph itself.
+
+        ka : int, required
+            Number of communities for type-a nodes to partition.
+
+        kb : int, required
+            Number of communities for type-b nodes to partition.
+
+        Returns
+        -------
+        of_group : list
+
+        """
+        graph = get_graph(f_edgelist, na, nb, self._graphs)
+        ka = int(ka)
+        kb = int(kb)
+        mb = gen_init_mb(graph.types, ka, kb, self._rng)
+        with span("MCMCNumba.anneal", ka=ka, kb=kb):
+            of_group = _anneal(
+                graph.indptr,
+                graph.indices,
+                graph.types,
+                mb,
+                ka,
+                kb,
+                UNIFORM_PROPOSAL_RATIO,
+                self.mcmc_moves_,
+                max(self.mcmc_await_moves_, 1),
+                self.mcmc_epsilon_,
+                COOLING_SCHEDULES[self.mcmc_cooling_],
+                self.mcmc_cooling_param_1,
+                self.mcmc_cooling_param_2,
+                self._rng.randint(2 ** 31 - 1)
+            )
+        return of_group.tolist()
+
+    def get_state(self):
+        """The state of the random number generator of the engine, as given by `numpy.random.RandomState`."""
+        return self._rng.get_state()
+
+    def set_state(self, state):
+        """Restore a state of the random number generator of the engine, given by `get_state`."""
+        self._rng.set_state(state)
+
+    @staticmethod
+    def gen_types(na, nb):
+        types = [1] * int(na) + [2] * int(nb)
+        return types
+
+
+@njit(cache=True, nogil=True)
+def _temperature(cooling, param_1, param_2, t):
+    if cooling == 0:
+        return param_1 * param_2 ** t
+    elif cooling == 1:
+        return max(param_1 - param_2 * t, 0.)
+    elif cooling == 2:
+        if t + param_2 <= 1.:
+            return param_1 / np.log(2.)
+        return param_1 / np.log(t + param_2)
+    return param_1
+
+
+def _anneal(indptr, indices, types, mb, ka, kb, uniform_ratio, n_steps, await_steps, epsilon,
+            cooling, param_1, param_2, seed):
+    # runs the chain by chunks of <CHUNK_STEPS> moves, so that a cancelled sweep stops early (see Scheduler.race)
+    _seed(seed)
+    k = ka + kb
+    m_rs, e_r, n_r = get_block_counts(indptr, indices, mb, k)
+    log_l = get_log_likelihood(m_rs, e_r, ka)
+    # log_l, best_log_l, window_max, window_min
+    state = np.array([log_l, log_l, log_l, log_l])
+    best_mb = mb.copy()
+    counts = np.zeros(k, dtype=np.int64)
+    touched = np.zeros(k, dtype=np.int64)
+    for start in range(0, n_steps, CHUNK_STEPS):
+        raise_if_cancelled()
+        is_converged = _anneal_chunk(
+            indptr, indices, types, mb, ka, kb, uniform_ratio, start, min(start + CHUNK_STEPS, n_steps),
+            await_steps, epsilon, cooling, param_1, param_2, m_rs, e_r, n_r, state, best_mb, counts, touched
+        )
+        if is_converged:
+            break
+
+    if state[0] > state[1]:
+        best_mb[:] = mb
+    return best_mb
+
+
+@njit(cache=True, nogil=True)
+def _seed(seed):
+    # seeds the generator of numba, which is local to the thread
+    np.random.seed(seed)
+
+
+@njit(cache=True, nogil=True)
+def _anneal_chunk(indptr, indices, types, mb, ka, kb, uniform_ratio, start, stop, await_steps, epsilon,
+                  cooling, param_1, param_2, m_rs, e_r, n_r, state, best_mb, counts, touched):
+    # makes the moves start .. stop - 1 of the chain, updating mb, the block counts, best_mb and state in place;
+    # returns whether the log-likelihood has converged
+    n = len(mb)
+    k = ka + kb
+    log_l, best_log_l, window_max, window_min = state[0], state[1], state[2], state[3]
+    is_converged = False
+    for step in range(start, stop):
+        v = np.random.randint(n)
+        if types[v] == 1:
+            low, high = 0, ka
+        else:
+            low, high = ka, k
+        r = mb[v]
+        if high - low > 1 and n_r[r] > 1:
+            # propose the block of a random second neighbor (which has the same type as v), if it differs from r;
+            # otherwise, propose a uniformly random block of the same type. In a one-mode graph (kb == 0), the
+            # block of a random neighbor is proposed instead.
+            r_new = r
+            if indptr[v + 1] > indptr[v] and np.random.random() > uniform_ratio:
+                u = indices[indptr[v] + np.random.randint(indptr[v + 1] - indptr[v])]
+                if kb == 0:
+                    r_new = mb[u]
+                else:
+                    r_new = mb[indices[indptr[u] + np.random.randint(indptr[u + 1] - indptr[u])]]
+            if r_new == r:
+                r_new = low + np.random.randint(high - low - 1)
+                if r_new >= r:
+                    r_new += 1
+
+            n_touched = count_neighbor_blocks(v, indptr, indices, mb, counts, touched)
+            degree = indptr[v + 1] - indptr[v]
+            if kb == 0:
+                diff_log_l = get_move_diff_uni(r, r_new, degree, counts, touched, n_touched, m_rs, e_r)
+            else:
+                diff_log_l = get_removal_diff(r, degree, counts, touched, n_touched, m_rs, e_r)
+                diff_log_l += get_insertion_diff(r_new, degree, counts, touched, n_touched, m_rs, e_r)
+
+            temperature = _temperature(cooling, param_1, param_2, step / n)
+            is_accepted = diff_log_l >= 0.
+            if not is_accepted and temperature > 0.:
+                is_accepted = np.random.random() < np.exp(diff_log_l / temperature)
+
+            if is_accepted:
+                apply_move(v, r_new, degree, counts, touched, n_touched, mb, m_rs, e_r, n_r)
+                log_l += diff_log_l
+            reset_counts(counts, touched, n_touched)
+
+        # keep the best state seen at the end of each sweep
+        if (step + 1) % n == 0 and log_l > best_log_l:
+            best_log_l = log_l
+            best_mb[:] = mb
+
+        window_max = max(window_max, log_l)
+        window_min = min(window_min, log_l)
+        if (step + 1) % await_steps == 0:
+            if window_max - window_min < epsilon:
+                is_converged = True
+                break
+            window_max = log_l
+            window_min = log_l
+
+    state[0], state[1], state[2], state[3] = log_l, best_log_l, window_max, window_min
+    return is_converged
@@ -0,0 +1,163 @@
+""" numba kernels shared by the in-process engines """
+import numpy as np
+from numba import njit
+
+from det_k_bisbm.graph import BipartiteGraph, UnipartiteGraph
+
+
+def get_graph(f_edgelist, na, nb, graphs):
+    """Return <f_edgelist> if it is a BipartiteGraph; otherwise load it from the path, once, into the dict <graphs>.
+
+    When nb == 0, the file holds a one-mode graph of na nodes.
+    """
+    if isinstance(f_edgelist, BipartiteGraph):
+        return f_edgelist
+    try:
+        return graphs[f_edgelist]
+    except KeyError:
+        edges = np.loadtxt(f_edgelist, dtype=np.int64, ndmin=2)
+        if int(nb) == 0:
+            graphs[f_edgelist] = UnipartiteGraph(edges, na)
+        else:
+            graphs[f_edgelist] = BipartiteGraph.from_na_nb(edges, na, nb)
+        return graphs[f_edgelist]
+
+
+def gen_init_mb(types, ka, kb, rng):
+    """Equal-sized groups within each type, randomly assigned to the nodes; type-b labels start at ka.
+
+    For a one-mode graph, whose nodes are all of type a, kb is 0.
+    """
+    assert np.count_nonzero(types == 1) >= ka and np.count_nonzero(types == 2) >= kb, \
+        "[ERROR] cannot partition the nodes into ({}, {}) non-empty groups".format(ka, kb)
+    assert (kb == 0) == (np.count_nonzero(types == 2) == 0), \
+        "[ERROR] kb should be 0 for a one-mode graph, and only then; here it is {}".format(kb)
+    mb = np.zeros(len(types), dtype=np.int64)
+    for _type, offset, k in [(1, 0, ka), (2, ka, kb)]:
+        if k == 0:
+            continue
+        nodes = np.flatnonzero(types == _type)
+        labels = offset + np.repeat(np.arange(k), list(map(len, np.array_split(nodes, k))))
+        mb[nodes] = rng.permutation(labels)
+    return mb
+
+
+@njit(cache=True, nogil=True)
+def x_log_x(x):
+    if x > 0:
+        return x * np.log(x)
+    return 0.
+
+
+@njit(cache=True, nogil=True)
+def get_block_counts(indptr, indices, mb, k):
+    """Block counts of the partition; m_rs is symmetric, e_r holds the block degrees and n_r the block sizes."""
+    m_rs = np.zeros((k, k), dtype=np.int64)
+    e_r = np.zeros(k, dtype=np.int64)
+    n_r = np.zeros(k, dtype=np.int64)
+    for v in range(len(mb)):
+        n_r[mb[v]] += 1
+        e_r[mb[v]] += indptr[v + 1] - indptr[v]
+        for idx in range(indptr[v], indptr[v + 1]):
+            m_rs[mb[v], mb[indices[idx]]] += 1
+    return m_rs, e_r, n_r
+
+
+@njit(cache=True, nogil=True)
+def get_log_likelihood(m_rs, e_r, ka):
+    """Profile log-likelihood of the degree-corrected biSBM, up to constants (over the type-a x type-b block).
+
+    If ka == len(e_r), i.e. kb == 0, it is the one of the degree-corrected SBM of a one-mode graph.
+    """
+    k = len(e_r)
+    log_l = 0.
+    if ka == k:
+        for r in range(k):
+            for s in range(k):
+                log_l += 0.5 * x_log_x(m_rs[r, s])
+    for r in range(ka):
+        for s in range(ka, k):
+            log_l += x_log_x(m_rs[r, s])
+    for r in range(k):
+        log_l -= x_log_x(e_r[r])
+    return log_l
+
+
+@njit(cache=True, nogil=True)
+def count_neighbor_blocks(v, indptr, indices, mb, counts, touched):
+    """Count the edges from v to each block into <counts>; the blocks reached are listed in <touched>."""
+    n_touched = 0
+    for idx in range(indptr[v], indptr[v + 1]):
+        t = mb[indices[idx]]
+        if counts[t] == 0:
+            touched[n_touched] = t
+            n_touched += 1
+        counts[t] += 1
+    return n_touched
+
+
+@njit(cache=True, nogil=True)
+def get_removal_diff(r, degree, counts, touched, n_touched, m_rs, e_r):
+    """Change of the log-likelihood when a node (of block r) is taken out of its block."""
+    diff_log_l = 0.
+    for i in range(n_touched):
+        t = touched[i]
+        diff_log_l += x_log_x(m_rs[r, t] - counts[t]) - x_log_x(m_rs[r, t])
+    diff_log_l -= x_log_x(e_r[r] - degree) - x_log_x(e_r[r])
+    return diff_log_l
+
+
+@njit(cache=True, nogil=True)
+def get_insertion_diff(r_new, degree, counts, touched, n_touched, m_rs, e_r):
+    """Change of the log-likelihood when a node (taken out of its block) is put into block r_new."""
+    diff_log_l = 0.
+    for i in range(n_touched):
+        t = touched[i]
+        diff_log_l += x_log_x(m_rs[r_new, t] + counts[t]) - x_log_x(m_rs[r_new, t])
+    diff_log_l -= x_log_x(e_r[r_new] + degree) - x_log_x(e_r[r_new])
+    return diff_log_l
+
+
+@njit(cache=True, nogil=True)
+def get_move_diff_uni(r, r_new, degree, counts, touched, n_touched, m_rs, e_r):
+    """Change of the one-mode log-likelihood when a node is moved from block r to block r_new.
+
+    Unlike in the bipartite case, the node may have neighbors in r and r_new themselves, which changes the
+    diagonal entries (twice the edges within a block) and the entry between r and r_new.
+    """
+    diff_log_l = 0.
+    for i in range(n_touched):
+        t = touched[i]
+        if t == r or t == r_new:
+            continue
+        diff_log_l += x_log_x(m_rs[r, t] - counts[t]) - x_log_x(m_rs[r, t])
+        diff_log_l += x_log_x(m_rs[r_new, t] + counts[t]) - x_log_x(m_rs[r_new, t])
+    diff_log_l += 0.5 * (x_log_x(m_rs[r, r] - 2 * counts[r]) - x_log_x(m_rs[r, r]))
+    diff_log_l += 0.5 * (x_log_x(m_rs[r_new, r_new] + 2 * counts[r_new]) - x_log_x(m_rs[r_new, r_new]))
+    diff_log_l += x_log_x(m_rs[r, r_new] + counts[r] - counts[r_new]) - x_log_x(m_rs[r, r_new])
+    diff_log_l -= x_log_x(e_r[r] - degree) - x_log_x(e_r[r])
+    diff_log_l -= x_log_x(e_r[r_new] + degree) - x_log_x(e_r[r_new])
+    return diff_log_l
+
+
+@njit(cache=True, nogil=True)
+def apply_move(v, r_new, degree, counts, touched, n_touched, mb, m_rs, e_r, n_r):
+    r = mb[v]
+    for i in range(n_touched):
+        t = touched[i]
+        c = counts[t]
+        m_rs[r, t] -= c
+        m_rs[t, r] -= c
+        m_rs[r_new, t] += c
+        m_rs[t, r_new] += c
+    e_r[r] -= degree
+    e_r[r_new] += degree
+    n_r[r] -= 1
+    n_r[r_new] += 1
+    mb[v] = r_new
+
+
+@njit(cache=True, nogil=True)
+def reset_counts(counts, touched, n_touched):
+    for i in range(n_touched):
+        counts[touched[i]] = 0
@@ -0,0 +1,17 @@
+from det_k_bisbm.batch import *
+from engines.mcmc_numba import MCMCNumba
+
+graphs = [
+    (name, get_bipartite_graph("dataset/test/{}.edgelist".format(name), "dataset/test/{}.types".format(name), "\t"))
+    for name in ["southernWomen", "malaria"]
+]
+
+
+def test_answer():
+    make_engine = lambda: MCMCNumba(n_sweeps=2, n_cores=2, mcmc_moves=20000, seed=1)
+    results = list(run_batch(graphs, make_engine, 2, init_ka=5, init_kb=5))
+    assert sorted(name for name, _, _ in results) == ["malaria", "southernWomen"]
+    for name, oks, error in results:
+        assert error is None
+        assert oks.graph is dict(graphs)[name]
+        assert len(oks.confident_desc_len) > 0
@@ -0,0 +1,19 @@
+from det_k_bisbm.generators import *
+from det_k_bisbm.utils import get_m_e_rs_from_edges, get_desc_len_from_data
+
+graph, mb = gen_bisbm(600, 400, 3, 4, 20000, mixing=0.1, degree_exponent=2.5, seed=42)
+
+
+def test_answer():
+    assert (graph.n_a, graph.n_b, graph.e) == (600, 400, 20000)
+    assert sorted(set(mb[:600])) == [0, 1, 2] and sorted(set(mb[600:])) == [3, 4, 5, 6]
+    assert (graph.edges[:, 0] < 600).all() and (graph.edges[:, 1] >= 600).all()
+
+    # 90% of the edges, plus the mixed ones that fall there by chance, are between the planted pairs, (0, 3), (0, 4), (1, 4), (1, 5), (2, 5) and (2, 6)
+    m_e_rs, _ = get_m_e_rs_from_edges(graph.edges, mb)
+    planted = m_e_rs[0, 3] + m_e_rs[0, 4] + m_e_rs[1, 4] + m_e_rs[1, 5] + m_e_rs[2, 5] + m_e_rs[2, 6]
+    assert 0.93 < planted / 20000 < 0.97
+    assert get_desc_len_from_data(600, 400, graph.e, 3, 4, graph, mb) < 0
+
+    # the same seed gives the same graph
+    assert (gen_bisbm(600, 400, 3, 4, 20000, mixing=0.1, degree_exponent=2.5, seed=42)[0].edges == graph.edges).all()
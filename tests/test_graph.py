@@ -0,0 +1,120 @@
+import numpy as np
+
+from det_k_bisbm.ioutils import *
+
+
+edgelist = get_edgelist("dataset/test/southernWomen.edgelist", "\t")
+types = get_types("dataset/test/southernWomen.types")
+graph = get_bipartite_graph("dataset/test/southernWomen.edgelist", "dataset/test/southernWomen.types", "\t")
+
+
+def test_answer():
+    assert graph.edges.dtype == np.int32
+    assert graph.e == len(edgelist)
+    assert (graph.n_a, graph.n_b, graph.n) == (18, 14, 32)
+    assert np.all(graph.edges == BipartiteGraph(edgelist, types).edges)
+    assert graph.degrees.sum() == 2 * graph.e
+    for source, target in edgelist:
+        assert int(target) in graph.neighbors(int(source))
+        assert int(source) in graph.neighbors(int(target))
+    assert not graph.edges.flags.writeable
+
+
+def test_graph_input_cache():
+    import os
+    from det_k_bisbm.cache import GraphInputCache
+    cache = GraphInputCache()
+    path = cache.acquire(graph)
+    # written once per graph, and shared by an identical graph
+    assert cache.acquire(BipartiteGraph(edgelist, types)) == path
+    assert np.all(np.loadtxt(path, dtype=np.int32) == graph.edges)
+    cache.release(graph)
+    assert os.path.isfile(path)
+    cache.release(graph)
+    assert not os.path.isfile(path)
+
+
+def test_graph_input_cache_is_thread_safe():
+    import os
+    import threading
+    from det_k_bisbm.cache import GraphInputCache
+    cache = GraphInputCache()
+    missing = []
+
+    def use():
+        for _ in range(200):
+            path = cache.acquire(graph)
+            if not os.path.isfile(path):
+                missing.append(path)
+            cache.release(graph)
+
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # an acquired file is never removed by the release of another user of the same graph
+    assert missing == []
+
+
+def test_read_bipartite_graph():
+    import os
+    import tempfile
+
+    streamed, ids, stats = read_bipartite_graph(
+        "dataset/test/southernWomen.edgelist", "dataset/test/southernWomen.types", chunk_size=10
+    )
+    assert (streamed.n_a, streamed.n_b) == (graph.n_a, graph.n_b) and stats["n_lines"] == graph.e
+    assert set(map(tuple, ids[streamed.edges])) == set(map(tuple, np.sort(graph.edges, axis=1)))
+
+    # arbitrary ids, with the type-a nodes in the first column; duplicate edges are dropped
+    f_edgelist = os.path.join(tempfile.mkdtemp(), "graph.edgelist")
+    with open(f_edgelist, "w") as f:
+        f.write("alice,x,1.5\nbob,y\nalice,x\n\ncarol,x\nbob,y\n")
+    streamed, ids, stats = read_bipartite_graph(f_edgelist, delimiter=",", chunk_size=2, dtype=str)
+    assert list(ids) == ["alice", "bob", "carol", "x", "y"]
+    assert streamed.edges.tolist() == [[0, 3], [1, 4], [2, 3]]
+    assert stats["n_duplicates"] == 2
+    assert stats["edge_bytes"] == 3 * 2 * 4
+
+    with open(f_edgelist, "a") as f:
+        f.write("x,dave\n")
+    try:
+        read_bipartite_graph(f_edgelist, delimiter=",", chunk_size=2, dtype=str)
+    except ImportError:
+        pass
+    else:
+        raise AssertionError("a node in both columns should raise")
+
+    # arbitrary int ids, indexed in the order of the ids
+    with open(f_edgelist, "w") as f:
+        f.write("70 -3\n5 -3\n70 12\n5 -3\n")
+    streamed, ids, stats = read_bipartite_graph(f_edgelist, chunk_size=3)
+    assert ids.tolist() == [5, 70, -3, 12]
+    assert streamed.edges.tolist() == [[1, 2], [0, 2], [1, 3]]
+    assert stats["n_duplicates"] == 1
+
+    with open(f_edgelist, "a") as f:
+        f.write("12 9\n")
+    try:
+        read_bipartite_graph(f_edgelist, chunk_size=2)
+    except ImportError:
+        pass
+    else:
+        raise AssertionError("a node in both columns should raise")
+
+    # a reversed duplicate edge is dropped when the types are given, but it puts its nodes in both columns otherwise
+    f_types = os.path.join(tempfile.mkdtemp(), "graph.types")
+    with open(f_types, "w") as f:
+        f.write("1\n2\n1\n")
+    with open(f_edgelist, "w") as f:
+        f.write("0 1\n2 1\n1 0\n")
+    streamed, ids, stats = read_bipartite_graph(f_edgelist, f_types, chunk_size=2)
+    assert streamed.edges.tolist() == [[0, 2], [1, 2]]
+    assert stats["n_duplicates"] == 1
+    try:
+        read_bipartite_graph(f_edgelist, chunk_size=2)
+    except ImportError:
+        pass
+    else:
+        raise AssertionError("a reversed edge should raise without the types")
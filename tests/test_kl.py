@@ -1,3 +1,6 @@
+import os
+import numpy as np
+
 from det_k_bisbm.ioutils import *
 from det_k_bisbm.optimalks import *
 
@@ -16,6 +19,7 @@ kl = KL(f_engine="engines/bipartiteSBM-KL/biSBM",
 
 edgelist = get_edgelist("dataset/test/southernWomen.edgelist", "\t")
 types = get_types("dataset/test/southernWomen.types")
+types_ints = list(map(int, types))
 
 oks = OptimalKs(kl, edgelist, types)
 oks.set_params(init_ka=10, init_kb=10, i_th=0.1)
@@ -25,3 +29,45 @@ def test_answer():
     confident_desc_len = oks.iterator()
     p_estimate = sorted(confident_desc_len, key=confident_desc_len.get)[0]
     assert p_estimate == (1, 1)
+
+
+def test_inputs_are_converted_once():
+    import shutil
+
+    f_edgelist = "dataset/test/southernWomen.edgelist"
+    action_str = kl.prepare_engine(f_edgelist, 18, 14, 3, 2, delimiter="\t")
+    f_edgelist_1_indexed, f_types, f_kl_output = action_str.split(" ")[1:4]
+    # the output dir of the command is owned by the caller
+    shutil.rmtree(f_kl_output)
+    assert np.all(np.loadtxt(f_edgelist_1_indexed, dtype=np.int64) == np.loadtxt(f_edgelist, dtype=np.int64) + 1)
+    assert np.loadtxt(f_types, dtype=np.int64).tolist() == types_ints
+
+    # the next runs, at any (ka, kb), read the same files, which are not written again
+    mtime = os.stat(f_edgelist_1_indexed).st_mtime_ns
+    action_str = kl.prepare_engine(f_edgelist, 18, 14, 5, 4, delimiter="\t")
+    shutil.rmtree(action_str.split(" ")[3])
+    assert action_str.split(" ")[1:3] == [f_edgelist_1_indexed, f_types]
+    assert os.stat(f_edgelist_1_indexed).st_mtime_ns == mtime
+
+
+def test_parallel_sweeps():
+    kl_parallel = KL(f_engine="engines/bipartiteSBM-KL/biSBM",
+                     n_sweeps=1,
+                     is_parallel=True,
+                     n_cores=2,
+                     kl_edgelist_delimiter="\t",
+                     kl_steps=5,
+                     kl_itertimes=3,
+                     f_kl_output="engines/bipartiteSBM-KL/f_kl_output",
+                     kl_is_parallel=True
+                     )
+    graph = BipartiteGraph(edgelist, types_ints)
+
+    # the sweeps are subtasks of the engine run, as in the worker pool of OptimalKs
+    scheduler = get_scheduler(kl_parallel.NUM_CORES)
+    of_group = scheduler.result(scheduler.submit(kl_parallel.engine, graph, 18, 14, 3, 2))
+    assert len(of_group) == 32
+    assert set(of_group[:18]) <= {0, 1, 2} and set(of_group[18:]) <= {3, 4}
+    # the output dir of each sweep is removed afterwards
+    f_kl_output = kl_parallel.f_kl_output
+    assert [d for d in os.listdir(f_kl_output) if os.path.isdir(os.path.join(f_kl_output, d))] == ["inputs"]
@@ -0,0 +1,25 @@
+from det_k_bisbm.ioutils import *
+from det_k_bisbm.optimalks import *
+
+from engines.kl_numba import *
+
+
+kl = KLNumba(n_sweeps=1,
+             is_parallel=False,
+             n_cores=1,
+             kl_steps=5,
+             kl_itertimes=1,
+             seed=42
+             )
+
+edgelist = get_edgelist("dataset/test/southernWomen.edgelist", "\t")
+types = get_types("dataset/test/southernWomen.types")
+
+oks = OptimalKs(kl, edgelist, types)
+oks.set_params(init_ka=10, init_kb=10, i_th=0.1)
+
+
+def test_answer():
+    confident_desc_len = oks.iterator()
+    p_estimate = sorted(confident_desc_len, key=confident_desc_len.get)[0]
+    assert p_estimate == (1, 1)
@@ -0,0 +1,41 @@
+import pickle
+import numpy as np
+
+from det_k_bisbm.landscape import *
+
+
+rng = np.random.RandomState(42)
+
+
+def test_answer():
+    landscape = Landscape()
+    expected = {}
+    for _ in range(500):
+        point = tuple(rng.randint(1, 12, size=2))
+        # few distinct values, to check the ties
+        value = float(rng.randint(20))
+        landscape[point] = value
+        expected[point] = value
+        if rng.rand() < 0.1:
+            point = list(expected)[rng.randint(len(expected))]
+            del landscape[point]
+            del expected[point]
+        points = list(expected)
+        assert list(landscape) == points
+        assert landscape.get_min_point() == sorted(expected, key=expected.get)[0]
+        assert landscape.is_min(min(expected.values())) and not landscape.is_min(min(expected.values()) + 1)
+    assert len(landscape._heap) <= 2 * len(landscape) + 16
+
+    ka, kb = landscape.get_min_point()
+    window, origin = landscape.get_window((ka, kb), 2)
+    for i, j in np.ndindex(*window.shape):
+        point = (origin[0] + i, origin[1] + j)
+        assert window[i, j] == expected[point] if point in expected else np.isnan(window[i, j])
+    assert set(landscape.get_neighbors((ka, kb), 2)) == set(
+        p for p in expected if p != (ka, kb) and abs(p[0] - ka) <= 2 and abs(p[1] - kb) <= 2
+    )
+
+    copied = pickle.loads(pickle.dumps(landscape.copy()))
+    landscape[(ka, kb)] = -1.
+    assert copied.get_min_point() == (ka, kb) and copied[(ka, kb)] == expected[(ka, kb)]
+    assert landscape.get_min_point() == (ka, kb)
@@ -0,0 +1,60 @@
+import time
+
+from det_k_bisbm.ioutils import *
+from det_k_bisbm.optimalks import *
+from det_k_bisbm.graph import BipartiteGraph
+from det_k_bisbm.scheduler import Scheduler
+
+from engines.mcmc_numba import *
+
+
+mcmc = MCMCNumba(n_sweeps=2,
+                 is_parallel=False,
+                 n_cores=1,
+                 mcmc_moves=3e5,
+                 mcmc_await_moves=3e5,
+                 mcmc_cooling="linear",
+                 mcmc_cooling_param_1=20,
+                 mcmc_cooling_param_2=0.1,
+                 mcmc_epsilon=0.01,
+                 seed=42
+                 )
+
+edgelist = get_edgelist("dataset/test/bisbm-n_1000-ka_4-kb_6-r-1.0-Ka_30-Ir_1.75.gt.edgelist", "\t")
+types = mcmc.gen_types(500, 500)
+
+oks = OptimalKs(mcmc, edgelist, types)
+
+oks.set_params(init_ka=8, init_kb=8, i_th=0.1)
+
+
+def test_answer():
+    confident_desc_len = oks.iterator()
+    p_estimate = sorted(confident_desc_len, key=confident_desc_len.get)[0]
+    # YES. We may not obtain (4, 6), as non-identifiable blocks may exist.
+    assert p_estimate in [(4, 6), (4, 5), (4, 7)]
+
+
+def test_race():
+    # a running chain stops at the next chunk of moves once its sweep is cancelled
+    slow_mcmc = MCMCNumba(mcmc_moves=1e9, mcmc_await_moves=1e9, mcmc_cooling="constant", seed=42)
+    graph = BipartiteGraph.from_na_nb(edgelist, 500, 500)
+    scheduler = Scheduler(2)
+    future = scheduler.submit(slow_mcmc.engine, graph, 500, 500, 4, 6)
+    start = time.time()
+    while not future.running():
+        time.sleep(0.01)
+    future.request_cancel()
+    assert scheduler.results([future]) == [None]
+    assert time.time() - start < 10
+
+
+def test_state():
+    # a run after set_state repeats the one after the matching get_state
+    short_mcmc = MCMCNumba(mcmc_moves=1e4, mcmc_await_moves=1e4, seed=42)
+    graph = BipartiteGraph.from_na_nb(edgelist, 500, 500)
+    state = short_mcmc.get_state()
+    of_group = short_mcmc.engine(graph, 500, 500, 4, 6)
+    assert short_mcmc.engine(graph, 500, 500, 4, 6) != of_group
+    short_mcmc.set_state(state)
+    assert short_mcmc.engine(graph, 500, 500, 4, 6) == of_group
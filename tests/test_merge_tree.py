@@ -0,0 +1,35 @@
+import numpy as np
+
+from det_k_bisbm.merge_tree import *
+
+
+def _merge(mb, merge_list):
+    # the relabeling node by node, as it used to be done
+    r, s = sorted(merge_list)
+    return [r if g == s else (g if g < s else g - 1) for g in mb]
+
+
+rng = np.random.RandomState(42)
+
+
+def test_answer():
+    mb = list(range(4)) + list(rng.randint(4, size=96)) + list(range(4, 10)) + list(4 + rng.randint(6, size=94))
+    trace_mb = MergeTree()
+    trace_mb[(4, 6)] = mb
+    expected = {(4, 6): mb}
+    ka, kb = 4, 6
+    for merge_list in [[1, 3], [4, 8], [0, 1], [3, 5], [2, 5]]:
+        new_point = (ka - 1, kb) if merge_list[1] < ka else (ka, kb - 1)
+        trace_mb.add_merge(new_point, (ka, kb), merge_list)
+        expected[new_point] = _merge(expected[(ka, kb)], merge_list)
+        ka, kb = new_point
+
+    assert list(trace_mb) == list(expected)
+    for point, mb in expected.items():
+        assert trace_mb[point] == mb
+
+    # a point assigned again does not change the points derived from it earlier
+    snapshot = trace_mb.copy()
+    trace_mb[(4, 6)] = [0] * 100 + [4] * 100
+    assert trace_mb[(2, 3)] == expected[(2, 3)]
+    assert snapshot[(4, 6)] == expected[(4, 6)]
@@ -0,0 +1,41 @@
+import numpy as np
+
+from det_k_bisbm.optimalk import *
+from engines.mcmc_numba import *
+
+
+# a one-mode graph with 3 planted groups of 100 nodes
+rng = np.random.RandomState(0)
+groups = np.repeat(np.arange(3), 100)
+ind_u, ind_v = np.triu_indices(300, k=1)
+is_edge = rng.rand(len(ind_u)) < np.where(groups[ind_u] == groups[ind_v], 0.15, 0.01)
+edgelist = np.stack([ind_u[is_edge], ind_v[is_edge]], axis=1)
+
+mcmc = MCMCNumba(n_sweeps=2,
+                 is_parallel=False,
+                 n_cores=1,
+                 mcmc_moves=3e4,
+                 mcmc_await_moves=3e3,
+                 mcmc_cooling="linear",
+                 mcmc_cooling_param_1=20,
+                 mcmc_cooling_param_2=0.5,
+                 seed=42
+                 )
+
+
+def test_answer():
+    import tempfile
+    from det_k_bisbm.cache import ResultStore
+
+    ok = OptimalK(mcmc, edgelist, init_k=6, logging_level="warning")
+    store = ResultStore(tempfile.mkdtemp())
+    ok.set_result_store(store)
+    confident_desc_len = ok.iterator()
+    assert confident_desc_len.get_min_point() == (3, 0)
+    assert ok.trace_mb.get_array((3, 0)).max() == 2
+
+    # the full affinity matrices are stored
+    italic_i, m_e_rs, mb, desc_len = store.get(ok.graph, ok._engine_key, 3, 0)
+    assert m_e_rs.shape == (3, 3) and m_e_rs.sum() == 2 * len(edgelist)
+    assert desc_len == confident_desc_len[(3, 0)]
+    store.clear()
@@ -0,0 +1,199 @@
+from det_k_bisbm.ioutils import *
+from det_k_bisbm.optimalks import *
+from det_k_bisbm.utils import gen_equal_bipartite_partition
+
+
+class EqualPartition(object):
+    """A deterministic engine, which returns equal-sized groups of consecutive nodes."""
+    MAX_NUM_SWEEPS = 2
+    NUM_CORES = 2
+    IN_PROCESS = True
+
+    def __init__(self, is_parallel):
+        self.PARALLELIZATION = is_parallel
+
+    def engine(self, f_edgelist, na, nb, ka, kb):
+        return gen_equal_bipartite_partition(na, nb, ka, kb)
+
+
+graph = get_bipartite_graph("dataset/test/malaria.edgelist", "dataset/test/malaria.types", "\t")
+
+
+def _search_neighborhood(is_parallel):
+    oks = OptimalKs(EqualPartition(is_parallel), graph, logging_level="warning")
+    desc_len, _, _ = oks._calc_and_update((4, 4))
+    is_local_minimum = oks._check_if_local_minimum(4, 4, desc_len, 2)
+    return is_local_minimum, list(oks.confident_desc_len.items()), (oks.ka, oks.kb), oks.init_italic_i
+
+
+def test_parallel_neighborhood_search():
+    assert _search_neighborhood(True) == _search_neighborhood(False)
+
+
+class CountingPartition(EqualPartition):
+    """Same as EqualPartition, but counts its runs, and records their points."""
+
+    def __init__(self, is_parallel):
+        super(CountingPartition, self).__init__(is_parallel)
+        self._n_runs = 0
+        self._points = set()
+
+    def engine(self, f_edgelist, na, nb, ka, kb):
+        self._n_runs += 1
+        self._points.add((ka, kb))
+        return super(CountingPartition, self).engine(f_edgelist, na, nb, ka, kb)
+
+
+def test_result_store():
+    import tempfile
+    from det_k_bisbm.cache import ResultStore
+
+    store = ResultStore(tempfile.mkdtemp())
+    engine = CountingPartition(False)
+    for _ in range(2):
+        oks = OptimalKs(engine, graph, logging_level="warning")
+        oks.set_result_store(store)
+        desc_len, _, _ = oks._calc_and_update((4, 4))
+    # the second run reads the stored result
+    assert engine._n_runs == 1
+    assert store.get(graph, oks._engine_key, 4, 4)[3] == desc_len
+
+    # a small store keeps only the latest entry
+    store.max_size = 1
+    store.put(graph, oks._engine_key, 3, 3, *oks._calc_with_hook(3, 3), desc_len=0.)
+    assert store.get(graph, oks._engine_key, 4, 4) is None
+    assert store.get(graph, oks._engine_key, 3, 3) is not None
+    store.clear()
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedPartition(EqualPartition):
+    """Same as EqualPartition, but the process "dies" after <n_runs> runs."""
+
+    def __init__(self, n_runs, is_parallel=False):
+        import threading
+
+        super(InterruptedPartition, self).__init__(is_parallel)
+        self.n_runs = n_runs
+        self._lock = threading.Lock()
+
+    def engine(self, f_edgelist, na, nb, ka, kb):
+        with self._lock:
+            self.n_runs -= 1
+            if self.n_runs < 0:
+                raise Interrupted()
+        return super(InterruptedPartition, self).engine(f_edgelist, na, nb, ka, kb)
+
+
+def test_checkpoint_and_resume():
+    import os
+    import tempfile
+
+    oks = OptimalKs(EqualPartition(False), graph, init_ka=6, init_kb=6, logging_level="warning")
+    desc_len = list(oks.iterator().items())
+
+    f_checkpoint = os.path.join(tempfile.mkdtemp(), "checkpoint")
+    oks = OptimalKs(InterruptedPartition(3), graph, init_ka=6, init_kb=6, logging_level="warning")
+    oks.set_checkpoint(f_checkpoint)
+    try:
+        oks.iterator()
+    except Interrupted:
+        pass
+    oks = OptimalKs(EqualPartition(False), graph, init_ka=6, init_kb=6, logging_level="warning")
+    assert list(oks.resume(f_checkpoint).items()) == desc_len
+
+
+def test_checkpoint_during_neighborhood_search():
+    import os
+    import tempfile
+
+    oks = OptimalKs(EqualPartition(True), graph, logging_level="warning")
+    oks.set_racing(False)
+    desc_len, _, _ = oks._calc_and_update((4, 4))
+    oks._check_if_local_minimum(4, 4, desc_len, 2)
+    desc_len_around = list(oks.confident_desc_len.items())
+
+    # the process dies in the middle of the batch of the 24 neighbors
+    f_checkpoint = os.path.join(tempfile.mkdtemp(), "checkpoint")
+    oks = OptimalKs(InterruptedPartition(2 + 2 * 12, is_parallel=True), graph, logging_level="warning")
+    oks.set_racing(False)
+    oks.set_checkpoint(f_checkpoint)
+    _, m_e_rs, _ = oks._calc_and_update((4, 4))
+    oks._update_current_state(4, 4, m_e_rs)
+    try:
+        oks._check_if_local_minimum(4, 4, desc_len, 2)
+    except Interrupted:
+        pass
+    oks._wait_for_checkpoint()
+    state = load_checkpoint(f_checkpoint)
+    assert state["neighborhood"] == (4, 4, desc_len, 2)
+    assert len(state["batch_results"]) > 0
+
+    # the saved neighbors are not computed again, and the search ends as the uninterrupted one
+    engine = CountingPartition(True)
+    oks = OptimalKs(engine, graph, logging_level="warning")
+    oks.set_racing(False)
+    assert list(oks.resume(f_checkpoint).items())[:len(desc_len_around)] == desc_len_around
+    # (the points around (1, 1) are always recomputed at the end, by _check_if_random_bipartite)
+    assert len(engine._points & set(state["batch_results"]) - {(1, 1), (1, 2), (2, 1), (2, 2)}) == 0
+
+
+class SlowPartition(CountingPartition):
+    """Same as CountingPartition, but every run takes a while, and the running ones are counted."""
+    MAX_NUM_SWEEPS = 4
+
+    def __init__(self, is_parallel):
+        import threading
+
+        super(SlowPartition, self).__init__(is_parallel)
+        self._n_running = 0
+        self._lock = threading.Lock()
+
+    def engine(self, f_edgelist, na, nb, ka, kb):
+        import time
+
+        with self._lock:
+            self._n_running += 1
+        try:
+            time.sleep(0.2)
+            return super(SlowPartition, self).engine(f_edgelist, na, nb, ka, kb)
+        finally:
+            with self._lock:
+                self._n_running -= 1
+
+
+def test_batch_cancels_the_unneeded_sweeps():
+    engine = SlowPartition(True)
+    oks = OptimalKs(engine, graph, logging_level="warning")
+    oks.set_racing(False)
+    # any sweep beats an infinite description length, hence the first one is kept, and the others are not needed
+    batch_results = oks._calc_in_batch([(4, 4)], float("inf"))
+    assert list(batch_results) == [(4, 4)]
+    # no sweep outlives the batch, and the pending ones never ran
+    assert engine._n_running == 0
+    assert engine._n_runs < SlowPartition.MAX_NUM_SWEEPS
+
+
+class FilePartition(EqualPartition):
+    """Same as EqualPartition, but the engine reads the graph from its input file."""
+    IN_PROCESS = False
+
+    def engine(self, f_edgelist, na, nb, ka, kb):
+        assert isinstance(f_edgelist, str)
+        return super(FilePartition, self).engine(f_edgelist, na, nb, ka, kb)
+
+
+def test_compute_and_update_releases_the_engine_input():
+    import os
+
+    oks = OptimalKs(FilePartition(False), graph, logging_level="warning")
+    oks.iterator()
+    assert not os.path.isfile(oks._f_edgelist_name)
+
+    # the input file acquired by a call after `iterator` is removed at the end of the call
+    oks.compute_and_update(3, 3, recompute=True)
+    assert oks.confident_desc_len[(3, 3)] > 0
+    assert not os.path.isfile(oks._f_edgelist_name)
@@ -0,0 +1,57 @@
+import time
+
+from det_k_bisbm.scheduler import *
+
+
+def _inner(x):
+    time.sleep(0.01)
+    return x
+
+
+def _outer(x):
+    # a task that submits tasks to the same scheduler, like an engine with parallel inner sweeps
+    return sum(get_scheduler().map(_inner, range(x))) + x
+
+
+def test_answer():
+    scheduler = get_scheduler(2)
+    assert scheduler.map(_outer, range(6)) == [0, 1, 3, 6, 10, 15]
+    assert Scheduler(1).map(_inner, [3, 2, 1]) == [3, 2, 1]
+
+
+def _sleep(seconds):
+    # a cancelled task gets its process terminated, long before it would exit
+    p = popen(["sleep", str(seconds)])
+    p.wait()
+    raise_if_cancelled()
+    return seconds
+
+
+def test_race():
+    scheduler = Scheduler(3)
+    start = time.time()
+    futures = scheduler.race([scheduler.submit(_sleep, s) for s in [0.1, 30, 30, 30]], lambda result: result < 1)
+    assert scheduler.results(futures) == [0.1, None, None, None]
+    assert time.time() - start < 10
+
+
+def test_top_level_tasks():
+    import threading
+
+    local = threading.local()
+    max_nesting = []
+
+    def run_graph(scheduler, x):
+        # a top-level task is never run inline under another one, which waits for its own subtasks
+        local.nesting = getattr(local, "nesting", 0) + 1
+        max_nesting.append(local.nesting)
+        try:
+            return sum(scheduler.map(_inner, range(3))) + x
+        finally:
+            local.nesting -= 1
+
+    for n_cores in [1, 3]:
+        scheduler = Scheduler(n_cores)
+        futures = [scheduler.submit_top_level(run_graph, scheduler, x) for x in range(20)]
+        assert sorted(future.result() for future in scheduler.as_completed(futures)) == [x + 3 for x in range(20)]
+    assert max(max_nesting) == 1
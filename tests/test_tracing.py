@@ -0,0 +1,32 @@
+import json
+import os
+import tempfile
+
+from det_k_bisbm.tracing import *
+from det_k_bisbm.optimalks import OptimalKs
+from det_k_bisbm.ioutils import get_bipartite_graph
+from engines.mcmc_numba import MCMCNumba
+
+graph = get_bipartite_graph("dataset/test/southernWomen.edgelist", "dataset/test/southernWomen.types", "\t")
+
+
+def test_answer():
+    oks = OptimalKs(MCMCNumba(n_sweeps=2, is_parallel=False, mcmc_moves=1000, seed=42), graph, init_ka=3, init_kb=3,
+                    logging_level="warning")
+    oks._calc_with_hook(3, 3)
+    assert stop_tracing() is None
+
+    tracer = start_tracing()
+    oks._calc_with_hook(2, 2)
+    assert stop_tracing() is tracer
+    oks._calc_with_hook(1, 1)
+
+    names = [s[0] for s in tracer.spans]
+    assert names == ["MCMCNumba.anneal", "engine", "BlockMatrix.from_edges", "OptimalKs._calc_with_hook"]
+    assert tracer.get_total_durations()["engine"] <= tracer.get_total_durations()["OptimalKs._calc_with_hook"]
+
+    f_trace = os.path.join(tempfile.mkdtemp(), "trace.json")
+    tracer.export_chrome_trace(f_trace)
+    with open(f_trace, "r") as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == 4 and events[1]["args"] == {"ka": "2", "kb": "2"}
@@ -0,0 +1,148 @@
+import math
+import numpy as np
+
+from det_k_bisbm.utils import *
+
+
+def _italic_i_reference(m_e_rs):
+    italic_i = 0.
+    m_e_r = np.sum(m_e_rs, axis=1)
+    num_edges = m_e_r.sum() / 2.
+    for ind, e_val in enumerate(np.nditer(m_e_rs)):
+        ind_i = int(math.floor(ind / (m_e_rs.shape[0])))
+        ind_j = ind % (m_e_rs.shape[0])
+        if e_val != 0.0:
+            italic_i += e_val / 2. / num_edges * math.log(
+                e_val / m_e_r[ind_i] / m_e_r[ind_j] * 2 * num_edges
+            )
+    return italic_i
+
+
+def _random_bipartite_m_e_rs(ka, kb, rng):
+    block = rng.randint(0, 20, size=(ka, kb)).astype(float)
+    block[0][0] += 1  # never an empty matrix
+    m_e_rs = np.zeros((ka + kb, ka + kb))
+    m_e_rs[:ka, ka:] = block
+    m_e_rs[ka:, :ka] = block.T
+    return m_e_rs
+
+
+rng = np.random.RandomState(42)
+stack = np.stack([_random_bipartite_m_e_rs(3, 4, rng) for _ in range(8)])
+
+
+def test_italic_i_batch():
+    italic_i_s = get_italic_i_from_m_e_rs_batch(stack)
+    assert italic_i_s.shape == (8,)
+    for m_e_rs, italic_i in zip(stack, italic_i_s):
+        assert abs(italic_i - _italic_i_reference(m_e_rs)) < 1e-10
+        assert abs(get_italic_i_from_m_e_rs(m_e_rs) - italic_i) < 1e-12
+
+
+def test_merge_candidates():
+    ka, kb = 3, 4
+    m_e_rs = stack[0]
+    italic_i = _italic_i_reference(m_e_rs)
+    candidates = get_merge_candidates(ka, kb, m_e_rs, top_n=100)
+    # all pairs of type-a rows and of type-b columns are scored
+    assert len(candidates) == 3 + 6
+    assert candidates == sorted(candidates, key=lambda x: -x[0])
+    for diff_italic_i, merge_list in candidates:
+        new_ka, new_kb, new_m_e_rs = merge_m_e_rs(ka, kb, m_e_rs, merge_list)
+        assert new_ka + new_kb == ka + kb - 1
+        assert new_m_e_rs.sum() == m_e_rs.sum()
+        assert abs(_italic_i_reference(new_m_e_rs) - italic_i - diff_italic_i) < 1e-10
+
+
+def test_m_e_rs_from_edges():
+    edgelist = [("0", "3"), ("0", "4"), ("1", "3"), ("2", "4"), ("1", "4")]
+    mb = [0, 0, 1, 2, 3]
+    edges = get_edges_from_edgelist(edgelist)
+    assert edges.dtype == np.int32 and edges.shape == (5, 2)
+    m_e_rs, m_e_r = get_m_e_rs_from_edges(edges, np.array(mb))
+    expected = np.zeros((4, 4))
+    for i, j in edgelist:
+        expected[mb[int(i)]][mb[int(j)]] += 1
+        expected[mb[int(j)]][mb[int(i)]] += 1
+    assert np.all(m_e_rs == expected)
+    assert np.all(m_e_r == expected.sum(axis=1))
+    try:
+        get_m_e_rs_from_edges(edges, [0, 0, 1, 0, 1])
+    except ImportError:
+        pass
+    else:
+        raise AssertionError("an edge inside a block should raise")
+
+
+def test_merge_block():
+    rng_state = new_rng_state(42)
+    for ka, kb in [(1, 5), (5, 1), (4, 6)]:
+        m_e_rs = _random_bipartite_m_e_rs(ka, kb, rng)
+        out = np.zeros((ka, kb))
+        for _ in range(10):
+            merge_list = list(merge_block(ka, kb, m_e_rs[:ka, ka:], out, rng_state))
+            new_ka, new_kb, c = merge_m_e_rs(ka, kb, m_e_rs, merge_list)
+            assert np.all(out[:new_ka, :new_kb] == c[:new_ka, new_ka:])
+
+    # the same state gives the same merges
+    m_e_rs = _random_bipartite_m_e_rs(4, 6, rng)
+    pairs = [merge_block(4, 6, m_e_rs[:4, 4:], out, new_rng_state(7)) for _ in range(2)]
+    assert pairs[0] == pairs[1]
+
+
+def test_block_matrix():
+    m_e_rs = _random_bipartite_m_e_rs(4, 6, rng)
+    block_matrix = BlockMatrix.from_m_e_rs(m_e_rs, 4)
+    assert np.all(block_matrix.to_m_e_rs() == m_e_rs)
+    assert np.isclose(get_italic_i_from_m_e_rs(block_matrix), get_italic_i_from_m_e_rs(m_e_rs))
+    assert get_merge_candidates(4, 6, block_matrix, top_n=5) == get_merge_candidates(4, 6, m_e_rs, top_n=5)
+    for merge_list in [[1, 3], [5, 9]]:
+        new_ka, new_kb, merged = merge_m_e_rs(4, 6, block_matrix, merge_list)
+        assert np.all(merged.to_m_e_rs() == merge_m_e_rs(4, 6, m_e_rs, merge_list)[2])
+        # the marginals are updated, not summed again
+        assert np.all(merged.e_r == merged.block.sum(axis=1)) and np.all(merged.e_s == merged.block.sum(axis=0))
+
+    # a type-b label beyond kb is an error, like a type-a label beyond ka
+    edges = np.array([[0, 2], [1, 3]], dtype=np.int32)
+    assert BlockMatrix.from_edges(edges, [0, 1, 2, 3], 2, 2).e == 2
+    for mb in [[0, 2, 2, 3], [0, 1, 4, 3]]:
+        try:
+            BlockMatrix.from_edges(edges, mb, 2, 2)
+        except ImportError:
+            pass
+        else:
+            raise AssertionError("a label beyond its groups should raise")
+
+
+def test_desc_len_batch():
+    n_a, n_b = 30, 40
+    types = [1] * n_a + [2] * n_b
+    edges = np.array([(a, n_a + b) for a in range(n_a) for b in range(n_b) if rng.rand() < 0.2])
+    graph = BipartiteGraph(edges, types)
+    mbs = []
+    for ka, kb in [(1, 1), (2, 3), (5, 4), (3, 7)]:
+        mbs.append(list(rng.permutation(np.arange(n_a) % ka)) + list(ka + rng.permutation(np.arange(n_b) % kb)))
+    expected = [get_desc_len_from_data(n_a, n_b, graph.e, max(mb[:n_a]) + 1, max(mb) - max(mb[:n_a]), edges, mb)
+                for mb in mbs]
+    assert np.allclose(get_desc_len_from_data_batch(graph, np.array(mbs)), expected, rtol=1e-12)
+    # an iterable of vectors, in chunks spread over the cores
+    assert np.allclose(get_desc_len_from_data_batch(graph, iter(mbs), n_cores=2, chunk_size=3), expected, rtol=1e-12)
+    assert np.allclose(get_desc_len_from_data_batch(graph, [mbs[3]], ka=3, kb=7), expected[3:], rtol=1e-12)
+
+    mbs_uni = [rng.randint(k, size=n_a + n_b) for k in [1, 3, 6]]
+    expected = [get_desc_len_from_data_uni(n_a + n_b, graph.e, max(mb) + 1, edges, mb) for mb in mbs_uni]
+    assert np.allclose(get_desc_len_from_data_uni_batch(n_a + n_b, edges, mbs_uni, chunk_size=2), expected, rtol=1e-12)
+
+
+def test_merge_candidates_uni():
+    k = 6
+    counts = rng.randint(0, 10, size=(k, k))
+    m_e_rs = (counts + counts.T).astype(float)
+    italic_i = _italic_i_reference(m_e_rs)
+    # kb == 0 stands for a one-mode graph, whose affinity matrix has a diagonal
+    candidates = get_merge_candidates(k, 0, m_e_rs, top_n=100)
+    assert len(candidates) == 15
+    for diff_italic_i, merge_list in candidates:
+        new_k, new_kb, new_m_e_rs = merge_m_e_rs(k, 0, m_e_rs, merge_list)
+        assert (new_k, new_kb) == (k - 1, 0)
+        assert abs(_italic_i_reference(new_m_e_rs) - italic_i - diff_italic_i) < 1e-10